@@ -1,8 +1,16 @@
 import streamlit as st
 import pandas as pd
-import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
 import plotly.express as px
 import plotly.graph_objects as go
+from etl.esquema_db import PATH_DB, conectar, texto_para_epoch
+from etl.metricas import ATIVO as METRICAS_ATIVAS, resumo_etapas
+from etl.roteador_shards import obter_roteador
+from dashboard.dados import CachePeriodo, CachePeriodoFrota, intervalo_disponivel
+from dashboard.graficos import LARGURA_GRAFICO_PX, reduzir_serie, tipo_trace
 
 # ==============================================================================
 # 1. CONFIGURAÇÕES GERAIS E SISTEMA DE DESIGN
@@ -163,35 +171,82 @@ st.markdown("""
 # ==============================================================================
 # 3. CAMADA DE DADOS (ETL)
 # ==============================================================================
-@st.cache_data
-def carregar_dados_reais():
+# Caches incrementais mantidos em memória (um por período consultado) e intervalo do modo ao vivo
+MAX_PERIODOS_EM_CACHE = 4
+INTERVALO_AO_VIVO_S = 5
+JANELAS_DESEMPENHO = {"Última hora": 1, "Últimas 24 horas": 24, "Últimos 7 dias": 168, "Últimos 30 dias": 720}
+
+@st.cache_data(ttl=60)
+def carregar_intervalo():
+    """Primeira e última data com leituras (define os limites do filtro)."""
+    try:
+        return intervalo_disponivel()
+    except Exception as e:
+        st.error(f"Erro de conexão com dados: {e}")
+        return None
+
+@st.cache_resource
+def caches_por_periodo():
+    """Caches compartilhados entre as sessões, do período usado há mais tempo para o mais recente."""
+    return OrderedDict(), threading.Lock()
+
+def carregar_dados_reais(inicio, fim, recarregar=False):
     """
-    Carrega, limpa e integra dados de SQLite e CSV.
+    Carrega só o período selecionado: o filtro de datas vai para o SQL (índice de timestamp)
+    e períodos longos vêm dos rollups horário/diário mantidos na gravação.
+    Nas execuções seguintes busca só o que entrou depois da marca d'água do cache.
     """
     try:
-        conn = sqlite3.connect('etl/green_horizon.db')
-        df_clima_limpo = pd.read_sql_query("SELECT * FROM historico_clima", conn)
-        df_logs_raw = pd.read_sql_query("SELECT * FROM logs_decisao", conn)
-        conn.close()
-        
-        df_sujo = pd.read_csv('data/historico_leituras_sujo.csv')
-        
-        # Tratamento de timestamp
-        for df in [df_clima_limpo, df_sujo, df_logs_raw]:
-            df['timestamp'] = pd.to_datetime(df['timestamp'], errors='coerce', format='mixed')
-            df.dropna(subset=['timestamp'], inplace=True)
-        
-        # Junção de tabelas
-        df_logs = pd.merge(df_logs_raw, df_clima_limpo[['timestamp', 'temp_ambiente']], on='timestamp', how='left')
-        
-        return df_clima_limpo, df_logs, df_sujo
+        periodos, lock = caches_por_periodo()
+        with lock:
+            cache = periodos.get((inicio, fim))
+            if cache is None:
+                # Com os shards ligados, um cache por shard do período, juntados (ver CachePeriodoFrota)
+                roteador = obter_roteador()
+                cache = periodos[(inicio, fim)] = (CachePeriodoFrota(inicio, fim, roteador) if roteador.ativo
+                                                   else CachePeriodo(inicio, fim, roteador.caminho_unico))
+                while len(periodos) > MAX_PERIODOS_EM_CACHE:
+                    periodos.popitem(last=False)
+            periodos.move_to_end((inicio, fim))
+
+        if recarregar:
+            cache.recarregar()
+        else:
+            cache.atualizar()
+        return cache.df_leituras, cache.df_logs, cache.df_sujo, cache.df_acoes, cache.granularidade, cache.estado
     except Exception as e:
         st.error(f"Erro de conexão com dados: {e}")
-        return None, None, None
+        return None, None, None, None, None, None
+
+@st.cache_data(max_entries=MAX_PERIODOS_EM_CACHE)
+def preparar_auditoria(inicio, fim, estado, _df_sujo, _df_limpo, largura_px=LARGURA_GRAFICO_PX):
+    """
+    Séries do gráfico de auditoria reduzidas (LTTB) à largura do gráfico.
+    Recalculadas só quando o estado do cache do período muda (marca d'água, revisão, cortes,
+    camada ou recarga).
+    """
+    total_pontos = len(_df_sujo) + len(_df_limpo)
+    return (reduzir_serie(_df_sujo, 'temp_ambiente', largura_px),
+            reduzir_serie(_df_limpo, 'temp_ambiente', largura_px),
+            total_pontos)
 
-df_limpo, df_logs, df_sujo = carregar_dados_reais()
+@st.cache_data(ttl=30)
+def carregar_desempenho(horas):
+    """Percentis por etapa (backend, ETL e dashboard) das métricas gravadas nas últimas `horas`."""
+    try:
+        conn = conectar(PATH_DB)
+        try:
+            desde = texto_para_epoch(datetime.now().replace(microsecond=0)) - horas * 3600
+            return pd.DataFrame(resumo_etapas(conn, desde))
+        finally:
+            conn.close()
+    except Exception as e:
+        st.error(f"Erro ao ler as métricas de desempenho: {e}")
+        return pd.DataFrame()
 
-if df_limpo is not None:
+intervalo = carregar_intervalo()
+
+if intervalo is not None:
     # ==============================================================================
     # 4. SIDEBAR (CONTROLES)
     # ==============================================================================
@@ -215,8 +270,7 @@ if df_limpo is not None:
 
     # Filtro Temporal
     st.sidebar.markdown("<h4 style='color: white; margin-bottom: 5px;'>📅 Período de Análise</h4>", unsafe_allow_html=True)
-    min_date = df_limpo['timestamp'].min().date()
-    max_date = df_limpo['timestamp'].max().date()
+    min_date, max_date = intervalo
     
     data_sel = st.sidebar.date_input(
         "Selecione o Intervalo", 
@@ -225,11 +279,13 @@ if df_limpo is not None:
         format="DD/MM/YYYY"
     )
 
-    if len(data_sel) == 2:
-        start_date, end_date = data_sel
-        df_limpo = df_limpo[(df_limpo['timestamp'].dt.date >= start_date) & (df_limpo['timestamp'].dt.date <= end_date)]
-        df_logs  = df_logs[(df_logs['timestamp'].dt.date >= start_date) & (df_logs['timestamp'].dt.date <= end_date)]
-        df_sujo  = df_sujo[(df_sujo['timestamp'].dt.date >= start_date) & (df_sujo['timestamp'].dt.date <= end_date)]
+    # Seleção incompleta (só a data inicial): usa o período todo
+    start_date, end_date = data_sel if len(data_sel) == 2 else (min_date, max_date)
+
+    ao_vivo = st.sidebar.toggle("🔴 Atualização ao vivo", value=False,
+                                help=f"Busca novas leituras a cada {INTERVALO_AO_VIVO_S} segundos.")
+    recarregar = st.sidebar.button("🔄 Recarregar tudo", use_container_width=True)
+    df_limpo, df_logs, df_sujo, df_acoes, granularidade, estado = carregar_dados_reais(start_date, end_date, recarregar)
 
     st.sidebar.markdown("""
     <div class="sidebar-card" style="margin-top: 25px;">
@@ -248,7 +304,7 @@ if df_limpo is not None:
     st.markdown('<h1 class="main-title">Green Horizon</h1>', unsafe_allow_html=True)
     st.markdown('<p class="subtitle">AgroTech 2.0 | Monitoramento de Precisão & Inteligência de Dados</p>', unsafe_allow_html=True)
     
-    if not df_logs.empty:
+    if df_logs is not None and not df_logs.empty:
         ultima_leitura = df_logs.iloc[-1]
         
         # Cards de KPI
@@ -260,31 +316,39 @@ if df_limpo is not None:
         with m3:
             st.metric("Tarifa Energética", ultima_leitura['tarifa'])
         with m4:
-            acoes_inteligentes = df_logs[df_logs['acao'].str.contains("AGUARDAR|ADIAR", na=False, case=False)].shape[0]
-            eficiencia = (acoes_inteligentes / len(df_logs)) * 100 if len(df_logs) > 0 else 0
+            acoes_inteligentes = df_acoes.loc[df_acoes['acao'].str.contains("AGUARDAR|ADIAR", na=False, case=False), 'count'].sum()
+            total_decisoes = df_acoes['count'].sum()
+            eficiencia = (acoes_inteligentes / total_decisoes) * 100 if total_decisoes > 0 else 0
             st.metric("Economia de Ciclos (%)", f"{eficiencia:.1f}%")
 
         st.info(f"**⚙️ Decisão Operacional:** {ultima_leitura['acao']} — **Justificativa Técnica:** {ultima_leitura['motivo']}")
 
-        tab1, tab2, tab3 = st.tabs(["📊 Auditoria de Sensores", "📈 Correlação Hídrica", "💰 Impacto de Negócio"])
+        tab1, tab2, tab3, tab4 = st.tabs(["📊 Auditoria de Sensores", "📈 Correlação Hídrica",
+                                          "💰 Impacto de Negócio", "⏱️ Desempenho"])
 
         # --- GRÁFICO 1: AUDITORIA DE DADOS ---
         with tab1:
             st.subheader("Auditoria da Qualidade dos Dados")
+            serie_bruta, serie_tratada, total_pontos = preparar_auditoria(start_date, end_date, estado, df_sujo, df_limpo)
+            if granularidade != "bruto":
+                st.caption(f"Período longo: dado tratado exibido pela média {granularidade} por sensor.")
+            exibidos = len(serie_bruta) + len(serie_tratada)
+            if exibidos < total_pontos:
+                st.caption(f"Exibindo {exibidos:,} de {total_pontos:,} pontos (redução LTTB preservando picos e vales).")
             fig_auditoria = go.Figure()
             
             # Dados Brutos (Sujo)
-            fig_auditoria.add_trace(go.Scatter(
-                x=df_sujo['timestamp'], 
-                y=df_sujo['temp_ambiente'], 
+            fig_auditoria.add_trace(tipo_trace(len(serie_bruta))(
+                x=serie_bruta['timestamp'], 
+                y=serie_bruta['temp_ambiente'], 
                 name="Leitura Bruta (Raw)", 
                 line=dict(color='#E53935', width=1, dash='dot')
             ))
             
             # Dados Tratados (Validado)
-            fig_auditoria.add_trace(go.Scatter(
-                x=df_limpo['timestamp'], 
-                y=df_limpo['temp_ambiente'], 
+            fig_auditoria.add_trace(tipo_trace(len(serie_tratada))(
+                x=serie_tratada['timestamp'], 
+                y=serie_tratada['temp_ambiente'], 
                 name="Dado Tratado (Validado)", 
                 line=dict(color='#1E88E5', width=2)
             ))
@@ -351,7 +415,7 @@ if df_limpo is not None:
             c1, c2 = st.columns([1, 2])
             
             with c1:
-                total_economizado = df_logs[df_logs['acao'].str.contains("AGUARDAR|ADIAR", na=False, case=False)].shape[0]
+                total_economizado = df_acoes.loc[df_acoes['acao'].str.contains("AGUARDAR|ADIAR", na=False, case=False), 'count'].sum()
                 st.markdown(f"""
                 <div class="custom-insight-card">
                     <h3 style="color: #2E7D32; margin-top: 0;">Economia Gerada</h3>
@@ -360,9 +424,8 @@ if df_limpo is not None:
                 """, unsafe_allow_html=True)
             
             with c2:
-                df_dist = df_logs['acao'].value_counts().reset_index()
                 fig_pie = px.pie(
-                    df_dist, 
+                    df_acoes, 
                     values='count', 
                     names='acao', 
                     hole=.4,
@@ -378,7 +441,48 @@ if df_limpo is not None:
                 fig_pie.update_traces(textfont_size=24)
                 
                 st.plotly_chart(fig_pie, use_container_width=True, config=PLOTLY_CONFIG)
+
     else:
         st.warning("⚠️ Nenhum dado encontrado. Ajuste o filtro de datas.")
+        tab4, = st.tabs(["⏱️ Desempenho"])
+
+    # --- GRÁFICO 4: DESEMPENHO DAS ETAPAS (também sem decisões no período) ---
+    with tab4:
+        st.subheader("Latência por Etapa")
+        if not METRICAS_ATIVAS:
+            st.caption("Métricas desligadas neste processo (GREEN_HORIZON_METRICAS=0); exibindo o que os outros gravaram.")
+        janela = st.selectbox("Janela", list(JANELAS_DESEMPENHO), index=1)
+        df_desempenho = carregar_desempenho(JANELAS_DESEMPENHO[janela])
+
+        if df_desempenho.empty:
+            st.info("Nenhuma métrica gravada nesta janela. Os processos gravam a cada minuto e ao encerrar.")
+        else:
+            medidas = df_desempenho[df_desempenho['p50_ms'].notna()]
+            fig_latencia = px.bar(
+                medidas.melt(id_vars='etapa', value_vars=['p50_ms', 'p95_ms', 'p99_ms'],
+                             var_name='percentil', value_name='ms'),
+                x='ms',
+                y='etapa',
+                color='percentil',
+                barmode='group',
+                orientation='h',
+                log_x=True,
+                labels={"ms": "Latência (ms, escala log)", "etapa": "Etapa", "percentil": "Percentil"},
+                color_discrete_sequence=THEME_COLOR_PALETTE
+            )
+
+            try:
+                fig_latencia.update_layout(**layout_padrao_charts)
+            except Exception:
+                fig_latencia.update_layout(template="plotly_white")
+            fig_latencia.update_layout(height=max(300, 60 * len(medidas)), margin=dict(t=20))
+
+            st.plotly_chart(fig_latencia, use_container_width=True, config=PLOTLY_CONFIG)
+            st.dataframe(df_desempenho.round(2), use_container_width=True, hide_index=True)
+
+    # Modo ao vivo: nova execução do script, que só busca o que passou da marca d'água
+    if ao_vivo:
+        time.sleep(INTERVALO_AO_VIVO_S)
+        st.rerun()
 else:
     st.error("Erro crítico: Banco de dados indisponível.")
\ No newline at end of file
@@ -0,0 +1,195 @@
+import numpy as np
+import pandas as pd
+import sys
+from datetime import datetime
+from clima_API import consultar_previsao_horaria
+from decisao_irrigacao import LIMIAR_UMIDADE_PADRAO, buscar_ultimas_leituras_por_sensor, carregar_culturas
+from previsao_umidade import horas_ate_limite, kc_das_leituras, projetar_umidade
+from simulador_historico import CONSUMO_BOMBA_KWH, LIMIAR_CHUVA_MM
+from tarifas import ROTULOS_VETOR, obter_motor_tarifas
+
+# --- 1. CONFIGURAÇÃO ---
+# Horizonte do plano (a Open-Meteo dá boa resolução horária até ~72h)
+HORAS_HORIZONTE = 48
+
+# Um ciclo = uma hora de bomba para um sensor/setor; quantos setores a bomba atende na mesma hora
+CAPACIDADE_BOMBA_POR_HORA = 50
+# Ganho de umidade do solo (pontos percentuais) de um ciclo; a chuva prevista entra pela projeção
+GANHO_UMIDADE_POR_CICLO = 10.0
+
+# Solo abaixo do mínimo precisa ser atendido dentro deste prazo
+PRAZO_CRITICO_HORAS = 12
+
+
+# --- 2. NÚCLEO (VETORIZADO) ---
+def planejar_janelas(ciclos, prazos, custos, capacidade):
+    """
+    Distribui ciclos de irrigação nas horas mais baratas do horizonte.
+
+    ciclos[s]     ciclos (horas de bomba) que o sensor s precisa
+    prazos[s]     o sensor só pode ser atendido nas horas [0, prazo)
+    custos[h]     custo de um ciclo na hora h (np.inf = hora proibida, ex.: chuva prevista)
+    capacidade    setores atendidos por hora (escalar ou array [h])
+
+    Sensores são atendidos por prazo (o mais urgente primeiro) e cada grupo pega as horas
+    mais baratas ainda livres da sua janela, no máximo um ciclo por sensor por hora.
+    Como as janelas são aninhadas ([0, prazo)), com um ciclo por sensor o resultado é o de
+    custo mínimo; com vários, é uma aproximação gulosa. O custo não depende do número de
+    sensores: os laços são por prazo e por hora (no máximo o tamanho do horizonte).
+
+    Retorna (plano bool [sensores, horas], ciclos que não couberam [sensores]).
+    """
+    ciclos = np.asarray(ciclos, dtype=np.int64)
+    custos = np.asarray(custos, dtype=float)
+    horas_total = len(custos)
+    prazos = np.clip(np.asarray(prazos, dtype=np.int64), 0, horas_total)
+
+    plano = np.zeros((len(ciclos), horas_total), dtype=bool)
+    livre = np.broadcast_to(np.asarray(capacidade, dtype=np.int64), (horas_total,)).copy()
+    livre[~np.isfinite(custos)] = 0
+    pendentes = ciclos.copy()
+    horas_por_custo = np.argsort(custos, kind='stable')
+
+    for prazo in np.unique(prazos[ciclos > 0]):
+        grupo = np.flatnonzero((prazos == prazo) & (ciclos > 0))
+        janela = horas_por_custo[horas_por_custo < prazo]
+
+        # Quantas vagas usar em cada hora: enche primeiro as mais baratas
+        vagas = np.minimum(livre[janela], len(grupo))
+        demanda = pendentes[grupo].sum()
+        usar = np.clip(demanda - (np.cumsum(vagas) - vagas), 0, vagas)
+
+        # Cada hora escolhida atende os sensores com mais ciclos pendentes (construção de Ryser)
+        for hora, quantidade in zip(janela[usar > 0], usar[usar > 0]):
+            atendidos = grupo[np.argsort(-pendentes[grupo], kind='stable')[:quantidade]]
+            atendidos = atendidos[pendentes[atendidos] > 0]
+            plano[atendidos, hora] = True
+            pendentes[atendidos] -= 1
+            livre[hora] -= len(atendidos)
+
+        # Sobras (sensor precisa de mais horas distintas do que as escolhidas): segunda passada pelas
+        # horas da janela, da mais barata, com as vagas que restaram e quem ainda não usou aquela hora
+        for hora in janela[livre[janela] > 0]:
+            candidatos = grupo[(pendentes[grupo] > 0) & ~plano[grupo, hora]]
+            if not candidatos.size:
+                if not pendentes[grupo].any():
+                    break
+                continue
+            atendidos = candidatos[np.argsort(-pendentes[candidatos], kind='stable')[:livre[hora]]]
+            plano[atendidos, hora] = True
+            pendentes[atendidos] -= 1
+            livre[hora] -= len(atendidos)
+
+    return plano, pendentes
+
+
+def ciclos_necessarios(umidade, umidade_min):
+    """Ciclos para levar cada sensor de volta ao mínimo (umidade já projetada até o prazo, com a chuva prevista)."""
+    deficit = np.asarray(umidade_min, dtype=float) - np.asarray(umidade, dtype=float)
+    return np.ceil(np.clip(deficit, 0, None) / GANHO_UMIDADE_POR_CICLO).astype(np.int64)
+
+
+# --- 3. PLANO PARA OS SENSORES ---
+def planejar_irrigacao(df_leituras, previsao, motor_tarifas=None, df_culturas=None, inicio=None,
+                       capacidade_por_hora=CAPACIDADE_BOMBA_POR_HORA, prazos_horas=None):
+    """
+    Plano de irrigação de custo mínimo para a última leitura de cada sensor.
+
+    previsao: saída de consultar_previsao_horaria (o horizonte é o tamanho da previsão).
+    A umidade de cada sensor é projetada hora a hora (ET da cultura e chuva prevista, em
+    previsao_umidade.py): quem cruza o mínimo dentro do horizonte tem até aquela hora para
+    ser atendido; quem já está abaixo, PRAZO_CRITICO_HORAS. prazos_horas substitui esses prazos.
+    Horas com chuva prevista acima de LIMIAR_CHUVA_MM ficam fora do plano, como na regra PREDITIVO.
+
+    Retorna (df_plano: um ciclo por linha, df_resumo: um sensor por linha).
+    """
+    motor_tarifas = motor_tarifas or obter_motor_tarifas()
+    if df_culturas is None:
+        df_culturas = carregar_culturas()
+
+    inicio = np.datetime64(inicio or datetime.now(), 'h')
+    horarios = (np.array(previsao['horarios'], dtype='datetime64[h]') if previsao['horarios']
+                else inicio + np.arange(HORAS_HORIZONTE))
+
+    def serie(chave):
+        valores = previsao.get(chave)
+        return np.asarray(valores, dtype=float) if valores else np.zeros(len(horarios))
+    chuva = serie('chuva_mm')
+
+    codigo_tarifa, tarifa_kwh = motor_tarifas.consultar_vetor(horarios)
+    custos = np.where(chuva > LIMIAR_CHUVA_MM, np.inf, tarifa_kwh * CONSUMO_BOMBA_KWH)
+
+    umidade = df_leituras['umidade_solo'].to_numpy(dtype=float)
+    umidade_min = (df_leituras['id_cultura']
+                   .map(df_culturas['umidade_min'])
+                   .fillna(LIMIAR_UMIDADE_PADRAO)
+                   .to_numpy(dtype=float))
+
+    kc = kc_das_leituras(df_leituras['id_cultura'], df_culturas)
+    trajetoria = projetar_umidade(umidade, serie('temperatura'), serie('vento_kmh'),
+                                  serie('radiacao_solar'), chuva, kc)
+    cruzamento = horas_ate_limite(trajetoria, umidade_min)
+
+    if prazos_horas is None:
+        prazos_horas = np.where(cruzamento == 0, PRAZO_CRITICO_HORAS,
+                                np.where(np.isfinite(cruzamento), cruzamento, len(horarios)))
+    prazos_horas = np.asarray(prazos_horas, dtype=np.int64)
+
+    # Déficit medido na umidade projetada para o prazo (já com a secagem e a chuva até lá)
+    umidade_no_prazo = trajetoria[np.arange(len(umidade)), np.clip(prazos_horas, 0, len(horarios))]
+    ciclos = np.where(np.isfinite(cruzamento), ciclos_necessarios(umidade_no_prazo, umidade_min), 0)
+
+    plano, nao_atendidos = planejar_janelas(ciclos, prazos_horas, custos, capacidade_por_hora)
+
+    sensor_idx, hora_idx = np.nonzero(plano)
+    custo_ciclo = tarifa_kwh * CONSUMO_BOMBA_KWH
+    df_plano = pd.DataFrame({
+        "id_sensor": df_leituras['id_sensor'].to_numpy()[sensor_idx],
+        "inicio": horarios[hora_idx].astype('datetime64[s]'),
+        "tarifa": ROTULOS_VETOR[codigo_tarifa[hora_idx]],
+        "tarifa_kwh": tarifa_kwh[hora_idx],
+        "custo_energia": custo_ciclo[hora_idx],
+    }).sort_values(['inicio', 'id_sensor'], kind='stable', ignore_index=True)
+
+    primeira_hora = np.where(plano.any(axis=1), plano.argmax(axis=1), -1)
+    df_resumo = pd.DataFrame({
+        "id_sensor": df_leituras['id_sensor'].to_numpy(),
+        "umidade_solo": umidade,
+        "umidade_min": umidade_min,
+        "horas_ate_minimo": cruzamento,
+        "prazo_horas": prazos_horas,
+        "umidade_no_prazo": umidade_no_prazo.round(1),
+        "ciclos_necessarios": ciclos,
+        "ciclos_agendados": plano.sum(axis=1),
+        "ciclos_sem_vaga": nao_atendidos,
+        "primeiro_ciclo": pd.Series(horarios[primeira_hora].astype('datetime64[s]')).where(primeira_hora >= 0),
+        "custo_energia": plano.astype(float) @ custo_ciclo,
+    })
+    return df_plano, df_resumo
+
+
+def processar_agendamento(horas=HORAS_HORIZONTE):
+    """Planeja as próximas `horas` para todos os sensores com a última leitura do banco."""
+    df_leituras = buscar_ultimas_leituras_por_sensor()
+    if df_leituras.empty:
+        print("❌ Banco vazio! Rode o ETL primeiro para carregar o histórico.")
+        return None
+
+    previsao = consultar_previsao_horaria(horas=horas)
+    if previsao is None:
+        print("❌ Sem previsão do clima. Agendamento adiado.")
+        return None
+
+    df_plano, df_resumo = planejar_irrigacao(df_leituras, previsao)
+
+    sem_vaga = int(df_resumo['ciclos_sem_vaga'].sum())
+    print(f"\n🗓️ PLANO DE IRRIGAÇÃO ({len(previsao['horarios'])}h): {len(df_plano)} ciclos agendados, "
+          f"R$ {df_resumo['custo_energia'].sum():.2f}" + (f" | ⚠️ {sem_vaga} ciclos sem vaga na bomba" if sem_vaga else ""))
+    return df_plano, df_resumo
+
+
+if __name__ == "__main__":
+    horas = int(sys.argv[1]) if len(sys.argv) > 1 else HORAS_HORIZONTE
+    resultado = processar_agendamento(horas)
+    if resultado is not None:
+        print(resultado[1].to_string(index=False))
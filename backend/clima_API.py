@@ -1,29 +1,254 @@
+import csv
 import requests
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-def consultar_clima():
+URL_OPEN_METEO = "https://api.open-meteo.com/v1/forecast"
+LATITUDE, LONGITUDE = -22.9519, -43.2105
+FUSO_HORARIO = "America/Sao_Paulo"
+
+PATH_TALHOES = Path(__file__).resolve().parent.parent / 'data' / 'config_talhoes.csv'
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'etl'))
+from metricas import contar, medido, medir
+from regras_decisao import indice_hora_atual, resumir_previsao
+
+# Talhões dentro da mesma célula (~11 km) compartilham a previsão
+RESOLUCAO_GRADE = 0.1
+COORDENADAS_POR_REQUISICAO = 50
+MAX_REQUISICOES_PARALELAS = 8
+# Cache da previsão: fresca por 10 min, aceitável (se a API falhar) por até 6 h
+TTL_PREVISAO_S = 600
+IDADE_MAXIMA_PREVISAO_S = 6 * 3600
+
+
+class CircuitoAbertoError(Exception):
+    """A API falhou repetidamente e as chamadas estão suspensas temporariamente."""
+
+
+class ClienteClima:
+    """
+    Cliente compartilhado da Open-Meteo: sessão keep-alive com pool de conexões,
+    timeouts e retentativas com backoff, circuit breaker e cache TTL que continua
+    servindo a última previsão boa enquanto atualiza em segundo plano.
+    """
+
+    def __init__(self, url_base=URL_OPEN_METEO, timeout=(3.05, 10), tentativas=3, backoff=0.5,
+                 ttl_segundos=TTL_PREVISAO_S, idade_maxima_segundos=IDADE_MAXIMA_PREVISAO_S,
+                 limite_falhas=5, pausa_circuito=60):
+        self.url_base = url_base
+        self.timeout = timeout
+        self.ttl_segundos = ttl_segundos
+        self.idade_maxima_segundos = idade_maxima_segundos
+        self.limite_falhas = limite_falhas
+        self.pausa_circuito = pausa_circuito
+
+        retry = Retry(total=tentativas, connect=tentativas, read=tentativas, backoff_factor=backoff,
+                      status_forcelist=(429, 500, 502, 503, 504), allowed_methods=frozenset(['GET']))
+        adaptador = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+        self.sessao = requests.Session()
+        self.sessao.mount('http://', adaptador)
+        self.sessao.mount('https://', adaptador)
+
+        self._lock = threading.Lock()
+        self._cache = {}            # chave -> (instante da resposta, json)
+        self._atualizando = set()   # chaves com refresh em segundo plano em andamento
+        self._falhas_seguidas = 0
+        self._circuito_aberto_ate = 0.0
+
+    @staticmethod
+    def _normalizar(params):
+        """Listas viram texto separado por vírgula (formato da Open-Meteo) e a ordem deixa de importar."""
+        return tuple(sorted((k, ",".join(map(str, v)) if isinstance(v, (list, tuple)) else str(v))
+                            for k, v in params.items()))
+
+    def buscar(self, params):
+        """
+        Devolve o JSON da API para os parâmetros informados.
+        Dentro do TTL responde do cache; vencido, responde o dado antigo e atualiza em segundo plano.
+        Só bloqueia (e pode levantar exceção) quando não há resposta em cache ou ela passou
+        de idade_maxima_segundos, velha demais para representar as próximas horas.
+        """
+        chave = self._normalizar(params)
+        with self._lock:
+            entrada = self._cache.get(chave)
+
+        if entrada is None:
+            return self._requisitar(chave)
+
+        instante, dados = entrada
+        idade = time.monotonic() - instante
+        if idade >= self.idade_maxima_segundos:
+            return self._requisitar(chave)
+        if idade >= self.ttl_segundos:
+            self._atualizar_em_segundo_plano(chave)
+        return dados
+
+    def _atualizar_em_segundo_plano(self, chave):
+        with self._lock:
+            if chave in self._atualizando:
+                return
+            self._atualizando.add(chave)
+
+        def tarefa():
+            try:
+                self._requisitar(chave)
+            except Exception as e:
+                print(f"⚠️ Previsão em cache mantida (atualização falhou): {e}")
+            finally:
+                with self._lock:
+                    self._atualizando.discard(chave)
+
+        threading.Thread(target=tarefa, daemon=True).start()
+
+    def _requisitar(self, chave):
+        with self._lock:
+            if time.monotonic() < self._circuito_aberto_ate:
+                contar('clima.requisicao', erros=1)
+                raise CircuitoAbertoError("API de clima indisponível; nova tentativa em instantes.")
+
+        try:
+            with medir('clima.requisicao'):
+                response = self.sessao.get(self.url_base, params=dict(chave), timeout=self.timeout)
+                response.raise_for_status()
+                dados = response.json()
+            # Retentativas feitas pelo urllib3 dentro do get (backoff do Retry)
+            retentativas = getattr(response.raw, 'retries', None)
+            contar('clima.requisicao', retentativas=len(retentativas.history) if retentativas else 0)
+        except Exception:
+            with self._lock:
+                self._falhas_seguidas += 1
+                if self._falhas_seguidas >= self.limite_falhas:
+                    self._circuito_aberto_ate = time.monotonic() + self.pausa_circuito
+            raise
+
+        with self._lock:
+            self._falhas_seguidas = 0
+            self._circuito_aberto_ate = 0.0
+            self._cache[chave] = (time.monotonic(), dados)
+        return dados
+
+
+# Instância única reutilizada pelo backend e pelo ETL
+cliente_clima = ClienteClima()
+
+
+def parametros_previsao(latitude=LATITUDE, longitude=LONGITUDE):
+    """Parâmetros da consulta de consultar_clima (também compilados no snapshot da decisão rápida)."""
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "hourly": ["temperature_2m", "precipitation"],
+        "timezone": FUSO_HORARIO,
+        "forecast_days": 2,
+    }
+
+
+@medido('clima.consultar')
+def consultar_clima(cliente=None, latitude=LATITUDE, longitude=LONGITUDE):
     """
     Consulta a API Open-Meteo para as próximas 3 horas.
     Retorna médias e somas para análise preditiva.
     """
-    lat, lon = -22.9519, -43.2105
-    #  Pega API
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&hourly=temperature_2m,precipitation&forecast_days=1"
-    
+    cliente = cliente or cliente_clima
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Pega os dados das próximas 3 horas
-        temps = data['hourly']['temperature_2m'][0:3]
-        chuvas = data['hourly']['precipitation'][0:3]
-        
-        return {
-            "temperatura_media": round(sum(temps) / len(temps), 1),
-            "volume_chuva_total": round(sum(chuvas), 2),
-            "vai_chover": sum(chuvas) > 0.1, # Considera chuva se for > 0.1mm
-            "probabilidade_chuva": 100 if sum(chuvas) > 0.5 else 0 
-        }
+        return resumir_previsao(cliente.buscar(parametros_previsao(latitude, longitude)))
     except Exception as e:
+        contar('clima.consultar', erros=1)
         print(f"⚠️ Erro na API de Clima: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def consultar_previsao_horaria(cliente=None, latitude=LATITUDE, longitude=LONGITUDE, horas=72):
+    """
+    Previsão hora a hora das próximas `horas` (a partir da hora atual), para o agendador.
+    Retorna {"horarios": [...'AAAA-MM-DDTHH:00'], "temperatura": [...], "chuva_mm": [...],
+    "vento_kmh": [...], "radiacao_solar": [...W/m²]} ou None em caso de erro.
+    """
+    cliente = cliente or cliente_clima
+    params = {
+        "latitude": latitude,
+        "longitude": longitude,
+        "hourly": ["temperature_2m", "precipitation", "wind_speed_10m", "shortwave_radiation"],
+        "timezone": FUSO_HORARIO,
+        "forecast_days": horas // 24 + 2,
+    }
+
+    try:
+        data = cliente.buscar(params)
+    except Exception as e:
+        print(f"⚠️ Erro na API de Clima: {e}")
+        return None
+
+    horarios = data['hourly']['time']
+    inicio = indice_hora_atual(data)
+    return {
+        "horarios": horarios[inicio:inicio + horas],
+        "temperatura": data['hourly']['temperature_2m'][inicio:inicio + horas],
+        "chuva_mm": data['hourly']['precipitation'][inicio:inicio + horas],
+        "vento_kmh": data['hourly']['wind_speed_10m'][inicio:inicio + horas],
+        "radiacao_solar": data['hourly']['shortwave_radiation'][inicio:inicio + horas],
+    }
+
+
+# --- MÚLTIPLOS TALHÕES ---
+def carregar_talhoes(caminho=PATH_TALHOES):
+    """Lê o config_talhoes.csv como lista de (id_talhao, latitude, longitude)."""
+    with open(caminho, newline='', encoding='utf-8') as f:
+        return [(linha['id_talhao'], float(linha['latitude']), float(linha['longitude']))
+                for linha in csv.DictReader(f)]
+
+
+def celula_grade(latitude, longitude, resolucao=RESOLUCAO_GRADE):
+    """Arredonda a coordenada para o centro da célula da grade."""
+    return (round(round(latitude / resolucao) * resolucao, 4),
+            round(round(longitude / resolucao) * resolucao, 4))
+
+
+def buscar_previsoes_locais(locais, cliente=None, resolucao=RESOLUCAO_GRADE,
+                            coordenadas_por_requisicao=COORDENADAS_POR_REQUISICAO,
+                            max_paralelo=MAX_REQUISICOES_PARALELAS):
+    """
+    Busca a previsão de vários talhões de uma vez.
+    Talhões próximos são agrupados na mesma célula da grade, as células vão em requisições
+    multi-coordenada da Open-Meteo e essas requisições rodam em paralelo (limitado a max_paralelo).
+    Retorna {id_talhao: resumo no formato de consultar_clima} (None se o lote daquele talhão falhar).
+    """
+    cliente = cliente or cliente_clima
+    locais = list(locais)
+
+    celula_por_local = {id_local: celula_grade(lat, lon, resolucao) for id_local, lat, lon in locais}
+    celulas = sorted(set(celula_por_local.values()))
+    lotes = [celulas[i:i + coordenadas_por_requisicao]
+             for i in range(0, len(celulas), coordenadas_por_requisicao)]
+
+    def buscar_lote(lote):
+        params = {
+            "latitude": [lat for lat, _ in lote],
+            "longitude": [lon for _, lon in lote],
+            "hourly": ["temperature_2m", "precipitation"],
+            "timezone": FUSO_HORARIO,
+            "forecast_days": 2,
+        }
+        try:
+            data = cliente.buscar(params)
+        except Exception as e:
+            print(f"⚠️ Erro na API de Clima ({len(lote)} células): {e}")
+            return {}
+
+        # Uma coordenada devolve um objeto; várias devolvem uma lista na mesma ordem
+        respostas = data if isinstance(data, list) else [data]
+        return {celula: resumir_previsao(resposta) for celula, resposta in zip(lote, respostas)}
+
+    previsao_por_celula = {}
+    if lotes:
+        with ThreadPoolExecutor(max_workers=min(max_paralelo, len(lotes))) as executor:
+            for resultado in executor.map(buscar_lote, lotes):
+                previsao_por_celula.update(resultado)
+
+    return {id_local: previsao_por_celula.get(celula) for id_local, celula in celula_por_local.items()}
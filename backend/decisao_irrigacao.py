@@ -1,96 +1,61 @@
+import numpy as np
 import pandas as pd
-import sqlite3
+import sys
 from datetime import datetime
 from pathlib import Path
 from clima_API import consultar_clima
+from previsao_umidade import estimar_leituras
+from regras_decisao import (LIMIAR_UMIDADE_PADRAO, MOTIVO_MANUTENCAO, MOTIVO_PREDITIVO, MOTIVO_ECONOMIA,
+                            MOTIVO_EXECUCAO, decidir, textos_motivo)
+from tarifas import obter_motor_tarifas, eh_ponta
 
 # --- 1. CONFIGURAÇÃO DE CAMINHOS ---
 BASE_DIR = Path(__file__).resolve().parent.parent
-PATH_TARIFAS = BASE_DIR / 'data' / 'tarifas_energia.csv'
 PATH_CSV = BASE_DIR / 'data' / 'historico_leituras_sujo.csv'
+PATH_CULTURAS = BASE_DIR / 'data' / 'config_culturas.csv'
 
-PATH_DB = BASE_DIR / 'etl' / 'green_horizon.db'
+sys.path.append(str(BASE_DIR / 'etl'))
+from escritor_lote import obter_escritor
+from metricas import medido, medir
+from roteador_shards import obter_roteador
+
+# Aviso para sensores que, no ritmo de secagem atual, chegam ao mínimo antes disso
+HORAS_ALERTA_SECAGEM = 12
 
 def buscar_ultima_leitura_real():
     """Conecta no banco e recupera o registro mais recente para evitar dados fake."""
     try:
-        conn = sqlite3.connect(PATH_DB)
-       
-        query = "SELECT * FROM historico_clima ORDER BY timestamp DESC LIMIT 1"
-        df_ultima = pd.read_sql(query, conn)
-        conn.close()
-        
+        with medir('decisao.ultima_leitura'):
+            # Usa o índice em timestamp: custo O(log n) mesmo com anos de histórico.
+            # Nos shards, uma linha do shard mais novo de cada fazenda; vale a mais recente
+            query = "SELECT * FROM historico_clima ORDER BY timestamp DESC LIMIT 1"
+            df_ultima = obter_roteador().consultar_df(query, recentes=True)
+
         if not df_ultima.empty:
-            return df_ultima.iloc[0].to_dict()
+            return df_ultima.sort_values('timestamp', kind='stable').iloc[-1].to_dict()
         return None
     except Exception as e:
         print(f"⚠️ Erro ao buscar leitura no banco: {e}")
         return None
 
+@medido('decisao.tarifa')
 def verificar_tarifa_atual():
-    """Identifica se o custo da energia está em horário de 'Pico' ou 'Fora Ponta'."""
-    try:
-        df_tarifas = pd.read_csv(PATH_TARIFAS, sep=None, engine='python')
-        hora_atual = datetime.now().hour
-        tarifa_info = df_tarifas[df_tarifas['hora'] == hora_atual].iloc[0]
-        return tarifa_info['tipo'] 
-    except:
-        return "Normal"
+    """Identifica o posto tarifário atual ('Ponta (Caro)', 'Fora Ponta (Barato)'...).
+    Um tarifas_energia.csv inválido levanta ValueError em vez de virar 'Normal'."""
+    rotulo, _ = obter_motor_tarifas().consultar(datetime.now())
+    return rotulo
 
 def salvar_tudo_sincronizado(decisao, dados_reais):
-    """Realiza a persistência dos dados: Logs, Histórico e CSV com ID incremental."""
+    """Realiza a persistência dos dados: Logs, Histórico e CSV com ID incremental (via escritor em lote)."""
     try:
-        conn = sqlite3.connect(PATH_DB)
-        cursor = conn.cursor()
-
-        # 1. Lógica de ID Incremental
-        cursor.execute("SELECT MAX(id_leitura) FROM historico_clima")
-        resultado = cursor.fetchone()[0]
-        proximo_id = (int(resultado) + 1) if resultado is not None else 1
-
-        # 2. Criar tabela de logs se não existir
-        cursor.execute('''CREATE TABLE IF NOT EXISTS logs_decisao (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, 
-            timestamp TEXT, 
-            umidade_solo REAL, 
-            previsao_chuva REAL, 
-            tarifa TEXT, 
-            acao TEXT, 
-            motivo TEXT)''')
-
-        # 3. INSERE NA TABELA DE LOGS
-        cursor.execute('''INSERT INTO logs_decisao (timestamp, umidade_solo, previsao_chuva, tarifa, acao, motivo)
-                          VALUES (?, ?, ?, ?, ?, ?)''', 
-                       (decisao['timestamp'], decisao['umidade_solo'], decisao['volume_chuva'], 
-                        decisao['tarifa'], decisao['acao'], decisao['motivo']))
-
-        # 4. Inserir na tabela de HISTÓRICO
-        cursor.execute('''INSERT INTO historico_clima (id_leitura, timestamp, id_sensor, id_cultura, umidade_solo, 
-                                                      temp_ambiente, vento_kmh, radiacao_solar, chuva_mm)
-                          VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''', 
-                       (proximo_id, decisao['timestamp'], dados_reais['id_sensor'], dados_reais['id_cultura'],
-                        decisao['umidade_solo'], dados_reais['temp_ambiente'], 
-                        dados_reais['vento_kmh'], dados_reais['radiacao_solar'], decisao['volume_chuva']))
-
-        conn.commit()
-        conn.close()
-
-      
-        nova_linha_csv = [
-            proximo_id, decisao['timestamp'], dados_reais['id_sensor'], 
-            dados_reais['id_cultura'], decisao['umidade_solo'], 
-            dados_reais['temp_ambiente'], dados_reais['vento_kmh'], 
-            dados_reais['radiacao_solar'], decisao['volume_chuva']
-        ]
-        
-        df_nova = pd.DataFrame([nova_linha_csv])
-        df_nova.to_csv(PATH_CSV, mode='a', header=False, index=False)
-        
-        print(f"✅ Sincronização concluída! ID Gerado: {proximo_id}")
+        with medir('decisao.salvar'):
+            proximo_id = obter_escritor().registrar(decisao, dados_reais)
+        print(f"✅ Sincronização agendada! ID Gerado: {proximo_id}")
 
     except Exception as e:
         print(f"❌ Erro na sincronização: {e}")
 
+@medido('decisao.total')
 def processar_decisao():
     """Cérebro do Green Horizon: une dados reais, clima e economia."""
     
@@ -102,31 +67,28 @@ def processar_decisao():
 
 
     clima = consultar_clima()
-    tarifa = verificar_tarifa_atual()
+    if clima is None:
+        print("❌ Sem previsão do clima. Decisão adiada para o próximo ciclo.")
+        return
+
+    try:
+        tarifa = verificar_tarifa_atual()
+    except ValueError as e:
+        print(f"❌ Tabela de tarifas inválida, decisão adiada para o próximo ciclo: {e}")
+        return
     umidade_atual = dados_reais['umidade_solo']
 
- 
+    # Mesmas regras escalares da decisão rápida (decisao_rapida.py)
+    acao, motivo = decidir(umidade_atual, clima, eh_ponta(tarifa))
     decisao = {
         "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
         "umidade_solo": umidade_atual,
         "volume_chuva": clima['volume_chuva_total'],
         "tarifa": tarifa,
-        "acao": "AGUARDAR",
-        "motivo": ""
+        "acao": acao,
+        "motivo": motivo
     }
 
-    
-    if umidade_atual < 30:
-        if clima['vai_chover']:
-            decisao["motivo"] = f"PREDITIVO: Chuva de {decisao['volume_chuva']}mm em breve."
-        elif tarifa == "Pico":
-            decisao["motivo"] = "ECONOMIA: Horário de energia cara. Postergando."
-        else:
-            decisao["acao"] = "LIGAR"
-            decisao["motivo"] = "EXECUÇÃO: Solo seco e custo de energia favorável."
-    else:
-        decisao["motivo"] = "MANUTENÇÃO: Umidade dentro do padrão ideal."
-
     print(f"\n🤖 DECISÃO GREEN HORIZON: {decisao['acao']}")
     print(f"💡 MOTIVO: {decisao['motivo']}")
 
@@ -134,5 +96,146 @@ def processar_decisao():
 
     salvar_tudo_sincronizado(decisao, dados_reais)
 
+# --- 2. MODO LOTE (TODOS OS SENSORES EM UMA PASSADA) ---
+# "Skip scan" no índice (id_sensor, timestamp): salta de sensor em sensor e pega
+# a leitura mais nova de cada um, O(sensores * log n) em vez de varrer a tabela
+SQL_ULTIMAS_POR_SENSOR = """WITH RECURSIVE sensores(id_sensor) AS (
+                                SELECT MIN(id_sensor) FROM historico_clima
+                                UNION ALL
+                                SELECT (SELECT MIN(id_sensor) FROM historico_clima h WHERE h.id_sensor > s.id_sensor)
+                                FROM sensores s WHERE s.id_sensor IS NOT NULL
+                            )
+                            SELECT h.* FROM sensores s
+                            JOIN historico_clima h ON h.id_leitura = (
+                                SELECT id_leitura FROM historico_clima
+                                WHERE id_sensor = s.id_sensor
+                                ORDER BY timestamp DESC LIMIT 1)"""
+
+def buscar_ultimas_leituras_por_sensor():
+    """Recupera, em uma única consulta, a leitura mais recente de cada sensor."""
+    try:
+        with medir('decisao_lote.leituras'):
+            df_ultimas = obter_roteador().consultar_df(SQL_ULTIMAS_POR_SENSOR)
+
+        return ultimas_por_sensor(df_ultimas)
+    except Exception as e:
+        print(f"⚠️ Erro ao buscar leituras no banco: {e}")
+        return pd.DataFrame()
+
+def ultimas_por_sensor(df_leituras):
+    """Junta o resultado do skip scan de vários shards: um sensor aparece em cada mês em que leu."""
+    if df_leituras.empty:
+        return df_leituras
+    return (df_leituras.sort_values(['id_sensor', 'timestamp'], kind='stable')
+            .drop_duplicates('id_sensor', keep='last')
+            .reset_index(drop=True))
+
+def carregar_culturas():
+    """Lê o config_culturas.csv indexado por id_cultura."""
+    return pd.read_csv(PATH_CULTURAS).set_index('id_cultura')
+
+def aplicar_regras(solo_seco, vai_chover, horario_pico):
+    """
+    Núcleo vetorizado das regras de irrigação (usado pelo lote e pelo backtest).
+    Aceita escalares ou arrays e devolve o código do motivo de cada leitura.
+    """
+    solo_seco, vai_chover, horario_pico = np.broadcast_arrays(
+        np.asarray(solo_seco, dtype=bool), np.asarray(vai_chover, dtype=bool), np.asarray(horario_pico, dtype=bool))
+
+    return np.select(
+        [~solo_seco, vai_chover, horario_pico],
+        [MOTIVO_MANUTENCAO, MOTIVO_PREDITIVO, MOTIVO_ECONOMIA],
+        default=MOTIVO_EXECUCAO
+    )
+
+@medido('decisao_lote.regras')
+def decidir_lote(df_leituras, clima, tarifa, df_culturas=None):
+    """
+    Aplica as regras de irrigação a todos os sensores de uma vez (vetorizado).
+    Cada leitura é comparada com o umidade_min da sua cultura.
+    """
+    if df_culturas is None:
+        df_culturas = carregar_culturas()
+
+    umidade = df_leituras['umidade_solo'].to_numpy(dtype=float)
+    umidade_min = (df_leituras['id_cultura']
+                   .map(df_culturas['umidade_min'])
+                   .fillna(LIMIAR_UMIDADE_PADRAO)
+                   .to_numpy(dtype=float))
+
+    codigo = aplicar_regras(umidade < umidade_min, clima['vai_chover'], eh_ponta(tarifa))
+    et_mm_h, horas_ate_minimo = estimar_leituras(df_leituras, umidade_min, df_culturas)
+
+    acao = np.where(codigo == MOTIVO_EXECUCAO, "LIGAR", "AGUARDAR")
+    motivo = np.array(textos_motivo(clima['volume_chuva_total']))[codigo]
+
+    return pd.DataFrame({
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "id_sensor": df_leituras['id_sensor'].to_numpy(),
+        "id_cultura": df_leituras['id_cultura'].to_numpy(),
+        "umidade_solo": umidade,
+        "umidade_min": umidade_min,
+        "volume_chuva": clima['volume_chuva_total'],
+        "tarifa": tarifa,
+        "acao": acao,
+        "motivo": motivo,
+        "temp_ambiente": df_leituras['temp_ambiente'].to_numpy(),
+        "vento_kmh": df_leituras['vento_kmh'].to_numpy(),
+        "radiacao_solar": df_leituras['radiacao_solar'].to_numpy(),
+        "et_mm_h": et_mm_h.round(3),
+        "horas_ate_minimo": horas_ate_minimo.round(1),
+    })
+
+def salvar_lote_sincronizado(df_decisoes):
+    """Entrega todas as decisões do lote ao escritor em lote (executemany em uma única transação)."""
+    if df_decisoes.empty:
+        return
+
+    try:
+        with medir('decisao_lote.salvar'):
+            primeiro_id = obter_escritor().registrar_decisoes(df_decisoes)
+
+        print(f"✅ Lote sincronizado! {len(df_decisoes)} decisões (IDs {primeiro_id} a {primeiro_id + len(df_decisoes) - 1})")
+
+    except Exception as e:
+        print(f"❌ Erro na sincronização do lote: {e}")
+
+@medido('decisao_lote.total')
+def processar_decisao_lote():
+    """Decide para todos os sensores em uma única passada: 1 consulta, 1 regra vetorizada, 1 gravação."""
+    df_leituras = buscar_ultimas_leituras_por_sensor()
+
+    if df_leituras.empty:
+        print("❌ Banco vazio! Rode o ETL primeiro para carregar o histórico.")
+        return
+
+    clima = consultar_clima()
+    if clima is None:
+        print("❌ Sem previsão do clima. Decisão do lote adiada.")
+        return
+
+    try:
+        tarifa = verificar_tarifa_atual()
+    except ValueError as e:
+        print(f"❌ Tabela de tarifas inválida, decisão do lote adiada: {e}")
+        return
+    df_decisoes = decidir_lote(df_leituras, clima, tarifa)
+
+    resumo = df_decisoes['acao'].value_counts().to_dict()
+    print(f"\n🤖 DECISÃO GREEN HORIZON (LOTE): {len(df_decisoes)} sensores -> {resumo}")
+    secando = int((df_decisoes['horas_ate_minimo'].between(0, HORAS_ALERTA_SECAGEM, inclusive='neither')).sum())
+    if secando:
+        print(f"⏳ {secando} sensores devem chegar ao mínimo nas próximas {HORAS_ALERTA_SECAGEM}h, mantidas as condições atuais.")
+
+    salvar_lote_sincronizado(df_decisoes)
+    return df_decisoes
+
 if __name__ == "__main__":
-    processar_decisao()
\ No newline at end of file
+    if "--servico" in sys.argv:
+        # Modo residente: ver servico_decisao.py
+        from servico_decisao import executar_servico
+        executar_servico()
+    elif "--lote" in sys.argv:
+        processar_decisao_lote()
+    else:
+        processar_decisao()
\ No newline at end of file
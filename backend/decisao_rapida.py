@@ -0,0 +1,267 @@
+import json
+import marshal
+import os
+import sys
+import time
+import urllib.parse
+from datetime import datetime
+from pathlib import Path
+
+# Partida rápida para cron e gateways de borda: o caminho quente (ler a última leitura,
+# consultar tarifa e clima, decidir e gravar) usa só a biblioteca padrão. Pandas, numpy e
+# requests são importados apenas para recompilar o snapshot de configuração ou no --resumo.
+INICIO_PROCESSO = time.perf_counter()
+
+# --- 1. CONFIGURAÇÃO DE CAMINHOS ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+PATH_CULTURAS = BASE_DIR / 'data' / 'config_culturas.csv'
+PATH_TARIFAS = BASE_DIR / 'data' / 'tarifas_energia.csv'
+PATH_FERIADOS = BASE_DIR / 'data' / 'feriados.csv'
+PATH_CACHE = BASE_DIR / 'data' / 'cache'
+PATH_SNAPSHOT = PATH_CACHE / 'config_decisao.marshal'
+PATH_PREVISAO = PATH_CACHE / 'previsao.json'
+
+sys.path.append(str(BASE_DIR / 'etl'))
+from esquema_db import texto_para_epoch
+from escritor_lote import obter_escritor
+from metricas import medir
+from roteador_shards import obter_roteador
+from regras_decisao import decidir, resumir_previsao
+
+# O snapshot é refeito quando muda o formato, a versão do Python (marshal não é portável
+# entre versões) ou algum arquivo de origem: CSVs de configuração e módulos com as constantes
+VERSAO_SNAPSHOT = 1
+ORIGENS_SNAPSHOT = (PATH_CULTURAS, PATH_TARIFAS, PATH_FERIADOS,
+                    BASE_DIR / 'backend' / 'tarifas.py', BASE_DIR / 'backend' / 'clima_API.py')
+
+FIM_DE_SEMANA, DIA_UTIL = 1, 0
+
+
+# --- 2. SNAPSHOT DA CONFIGURAÇÃO ---
+def _versao_origens():
+    return (VERSAO_SNAPSHOT, sys.version,
+            tuple(p.stat().st_mtime_ns if p.exists() else 0 for p in ORIGENS_SNAPSHOT))
+
+def compilar_snapshot():
+    """
+    Compila culturas, tarifas, feriados e os parâmetros do clima em tipos nativos (tuplas,
+    dicts, strings). Usa os carregadores de sempre (tarifas.py valida o CSV), então só
+    aqui entram numpy e requests.
+    """
+    import csv
+    from clima_API import IDADE_MAXIMA_PREVISAO_S, TTL_PREVISAO_S, URL_OPEN_METEO, ClienteClima, parametros_previsao
+    from tarifas import ROTULO_POR_CODIGO, PONTA, carregar_tarifas
+
+    motor = carregar_tarifas(PATH_TARIFAS, PATH_FERIADOS)
+    with open(PATH_CULTURAS, newline='', encoding='utf-8') as f:
+        culturas = {int(linha['id_cultura']): (linha['nome'], float(linha['umidade_min']))
+                    for linha in csv.DictReader(f)}
+
+    return {
+        "versao": _versao_origens(),
+        "rotulos": tuple(tuple(ROTULO_POR_CODIGO[int(c)] for c in linha) for linha in motor.codigos),
+        "ponta": tuple(tuple(bool(c == PONTA) for c in linha) for linha in motor.codigos),
+        "precos": tuple(tuple(float(p) for p in linha) for linha in motor.precos),
+        "feriados": frozenset(str(d) for d in motor.feriados),
+        "culturas": culturas,
+        "clima": {
+            "url": URL_OPEN_METEO,
+            "params": ClienteClima._normalizar(parametros_previsao()),
+            "ttl_segundos": TTL_PREVISAO_S,
+            "idade_maxima_segundos": IDADE_MAXIMA_PREVISAO_S,
+        },
+    }
+
+def carregar_snapshot(caminho=None):
+    """Lê o snapshot do disco; recompila (e regrava) se estiver ausente, corrompido ou desatualizado."""
+    caminho = Path(caminho or PATH_SNAPSHOT)
+    versao = _versao_origens()
+    try:
+        with open(caminho, 'rb') as f:
+            snapshot = marshal.load(f)
+        if snapshot["versao"] == versao:
+            return snapshot
+    except (OSError, EOFError, ValueError, TypeError, KeyError):
+        pass
+
+    with medir('decisao_rapida.compilar'):
+        snapshot = compilar_snapshot()
+    try:
+        caminho.parent.mkdir(parents=True, exist_ok=True)
+        temporario = caminho.with_suffix('.tmp')
+        with open(temporario, 'wb') as f:
+            marshal.dump(snapshot, f)
+        os.replace(temporario, caminho)
+    except OSError as e:
+        print(f"⚠️ Snapshot de configuração não gravado (segue em memória): {e}")
+    return snapshot
+
+
+# --- 3. TARIFA ---
+def consultar_tarifa(snapshot, momento=None):
+    """Retorna (rótulo, é_ponta) do instante: mesma regra do MotorTarifas.consultar, sem numpy."""
+    momento = momento or datetime.now()
+    dia = momento.date()
+    calendario = FIM_DE_SEMANA if (dia.weekday() >= 5 or dia.isoformat() in snapshot["feriados"]) else DIA_UTIL
+    return snapshot["rotulos"][calendario][momento.hour], snapshot["ponta"][calendario][momento.hour]
+
+
+# --- 4. CLIMA ---
+class ClienteClimaLeve:
+    """
+    Cliente da Open-Meteo com urllib e cache em disco, para processos de vida curta
+    (o cache em memória do ClienteClima morre a cada execução do cron).
+    Mesma interface buscar(params) e os mesmos prazos: dentro do TTL responde do arquivo;
+    vencido, consulta a API e, se ela falhar, usa o arquivo até idade_maxima_segundos.
+    """
+
+    def __init__(self, url_base, ttl_segundos, idade_maxima_segundos, caminho_cache=PATH_PREVISAO,
+                 timeout=10, tentativas=3, backoff=0.5):
+        self.url_base = url_base
+        self.ttl_segundos = ttl_segundos
+        self.idade_maxima_segundos = idade_maxima_segundos
+        self.caminho_cache = caminho_cache
+        self.timeout = timeout
+        self.tentativas = tentativas
+        self.backoff = backoff
+
+    def buscar(self, params):
+        chave = urllib.parse.urlencode(sorted(params.items()) if isinstance(params, dict) else params)
+        entrada = self._ler_cache(chave)
+        idade = time.time() - entrada[0] if entrada else None
+        if idade is not None and 0 <= idade < self.ttl_segundos:
+            return entrada[1]
+
+        try:
+            dados = self._requisitar(chave)
+        except Exception as e:
+            if idade is not None and 0 <= idade < self.idade_maxima_segundos:
+                print(f"⚠️ Previsão em cache usada (API falhou): {e}")
+                return entrada[1]
+            raise
+
+        self._gravar_cache(chave, dados)
+        return dados
+
+    def _requisitar(self, chave):
+        import urllib.error
+        import urllib.request  # ~40 ms de import (http.client, ssl): só quando o cache venceu
+
+        for tentativa in range(self.tentativas + 1):
+            try:
+                with medir('clima.requisicao'):
+                    with urllib.request.urlopen(f"{self.url_base}?{chave}", timeout=self.timeout) as resposta:
+                        return json.load(resposta)
+            except urllib.error.HTTPError as e:
+                if e.code not in (429, 500, 502, 503, 504) or tentativa == self.tentativas:
+                    raise
+            except urllib.error.URLError:
+                if tentativa == self.tentativas:
+                    raise
+            time.sleep(self.backoff * 2 ** tentativa)
+
+    def _ler_cache(self, chave):
+        try:
+            with open(self.caminho_cache, encoding='utf-8') as f:
+                cache = json.load(f)
+            return (cache["instante"], cache["dados"]) if cache.get("chave") == chave else None
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _gravar_cache(self, chave, dados):
+        try:
+            self.caminho_cache.parent.mkdir(parents=True, exist_ok=True)
+            temporario = self.caminho_cache.with_suffix('.tmp')
+            temporario.write_text(json.dumps({"chave": chave, "instante": time.time(), "dados": dados}),
+                                  encoding='utf-8')
+            os.replace(temporario, self.caminho_cache)
+        except OSError as e:
+            print(f"⚠️ Cache da previsão não gravado: {e}")
+
+
+def consultar_clima_rapido(snapshot, cliente=None):
+    """Resumo das próximas 3 horas no formato de consultar_clima (None em caso de erro)."""
+    clima = snapshot["clima"]
+    cliente = cliente or ClienteClimaLeve(clima["url"], clima["ttl_segundos"], clima["idade_maxima_segundos"])
+    try:
+        with medir('decisao_rapida.clima'):
+            return resumir_previsao(cliente.buscar(dict(clima["params"])))
+    except Exception as e:
+        print(f"⚠️ Erro na API de Clima: {e}")
+        return None
+
+
+# --- 5. DECISÃO ---
+def buscar_ultima_leitura():
+    """Registro mais recente do histórico como dict (sqlite3 puro, sem pd.read_sql)."""
+    try:
+        with medir('decisao_rapida.ultima_leitura'):
+            colunas, linhas = obter_roteador().consultar(
+                "SELECT * FROM historico_clima ORDER BY timestamp DESC LIMIT 1", recentes=True)
+        if not linhas:
+            return None
+        posicao = colunas.index('timestamp')
+        return dict(zip(colunas, max(linhas, key=lambda linha: linha[posicao])))
+    except Exception as e:
+        print(f"⚠️ Erro ao buscar leitura no banco: {e}")
+        return None
+
+def processar_decisao_rapida(cliente=None, snapshot=None):
+    """Mesma decisão do processar_decisao, com partida rápida. Retorna o dict da decisão (ou None)."""
+    with medir('decisao_rapida.total'):
+        dados_reais = buscar_ultima_leitura()
+        if not dados_reais:
+            print("❌ Banco vazio! Rode o ETL primeiro para carregar o histórico.")
+            return None
+
+        try:
+            snapshot = snapshot or carregar_snapshot()
+        except ValueError as e:
+            print(f"❌ Tabela de tarifas inválida, decisão adiada para o próximo ciclo: {e}")
+            return None
+        clima = consultar_clima_rapido(snapshot, cliente)
+        if clima is None:
+            print("❌ Sem previsão do clima. Decisão adiada para o próximo ciclo.")
+            return None
+
+        tarifa, horario_pico = consultar_tarifa(snapshot)
+        acao, motivo = decidir(dados_reais['umidade_solo'], clima, horario_pico)
+        decisao = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "umidade_solo": dados_reais['umidade_solo'],
+            "volume_chuva": clima['volume_chuva_total'],
+            "tarifa": tarifa,
+            "acao": acao,
+            "motivo": motivo
+        }
+
+        cultura = snapshot["culturas"].get(dados_reais['id_cultura'])
+        print(f"\n🤖 DECISÃO GREEN HORIZON: {decisao['acao']}")
+        print(f"💡 MOTIVO: {decisao['motivo']}")
+        print(f"🌱 Sensor {dados_reais['id_sensor']} ({cultura[0] if cultura else 'cultura não cadastrada'})")
+
+        try:
+            proximo_id = obter_escritor().registrar(decisao, dados_reais)
+            print(f"✅ Sincronização agendada! ID Gerado: {proximo_id}")
+        except Exception as e:
+            print(f"❌ Erro na sincronização: {e}")
+        return decisao
+
+
+# --- 6. ANÁLISE (PANDAS SOB DEMANDA) ---
+def resumo_decisoes(horas=24):
+    """Contagem de ações e motivos das últimas `horas`. Só aqui o pandas é importado (consultar_df)."""
+    desde = texto_para_epoch(datetime.now().replace(microsecond=0)) - horas * 3600
+    df = obter_roteador().consultar_df("SELECT acao, motivo FROM logs_decisao WHERE timestamp >= ?",
+                                       (desde,), inicio=desde)
+    if df.empty:
+        return df
+    return df.groupby(['acao', 'motivo']).size().rename('decisoes').reset_index()
+
+
+if __name__ == "__main__":
+    if "--resumo" in sys.argv:
+        print(resumo_decisoes().to_string(index=False))
+    else:
+        processar_decisao_rapida()
+        print(f"⏱️ Decisão em {(time.perf_counter() - INICIO_PROCESSO) * 1000:.0f} ms a partir do import")
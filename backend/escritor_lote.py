@@ -0,0 +1,280 @@
+import atexit
+import csv
+import io
+import json
+import sys
+import threading
+from datetime import datetime
+from pathlib import Path
+
+# --- 1. CONFIGURAÇÃO DE CAMINHOS ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+PATH_CSV = BASE_DIR / 'data' / 'historico_leituras_sujo.csv'
+
+sys.path.append(str(BASE_DIR / 'etl'))
+from esquema_db import conectar, texto_para_epoch
+from metricas import contar, medir
+from roteador_shards import RoteadorShards, obter_roteador
+
+# Descarrega quando o buffer chega a MAX_ITENS ou a cada INTERVALO_SEGUNDOS, o que vier primeiro
+MAX_ITENS = 1000
+INTERVALO_SEGUNDOS = 1.0
+# Falhas seguidas de um shard até o lote dele ser gravado linha a linha (as que ainda falham
+# vão para falhas_gravacao no catálogo)
+MAX_TENTATIVAS = 3
+ORIGEM_FALHAS = "escritor"
+
+SQL_LOGS = '''INSERT INTO logs_decisao (timestamp, id_sensor, umidade_solo, previsao_chuva, tarifa, acao, motivo)
+              VALUES (?, ?, ?, ?, ?, ?, ?)'''
+SQL_HISTORICO = '''INSERT INTO historico_clima (id_leitura, timestamp, id_sensor, id_cultura, umidade_solo,
+                                               temp_ambiente, vento_kmh, radiacao_solar, chuva_mm)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)'''
+SQL_FALHAS = '''INSERT INTO falhas_gravacao (registrado_em, origem, tabela, erro, linha)
+                VALUES (?, ?, ?, ?, ?)'''
+
+
+class EscritorLote:
+    """
+    Escrita write-behind das decisões: logs, histórico e espelho CSV ficam em memória
+    e são gravados juntos (executemany + uma transação + um append no CSV) quando o
+    buffer enche ou o intervalo vence. Tudo que estiver pendente é gravado no fechar(),
+    chamado automaticamente na saída do processo.
+
+    O lote de um shard que falha volta ao buffer; depois de MAX_TENTATIVAS falhas seguidas
+    (ou no fechar) ele é gravado linha a linha e só as linhas que ainda falham saem para a
+    tabela falhas_gravacao do catálogo.
+
+    Os IDs de leitura são reservados no contador do catálogo (RoteadorShards.reservar_ids),
+    o mesmo da ingestão e do ETL: nenhum outro gravador recebe os mesmos ids.
+
+    Sem caminho_db, grava pelo roteador do processo (banco único ou um shard por fazenda e mês);
+    com ele, tudo vai para aquele arquivo.
+    """
+
+    def __init__(self, caminho_db=None, caminho_csv=PATH_CSV,
+                 max_itens=MAX_ITENS, intervalo_segundos=INTERVALO_SEGUNDOS, roteador=None):
+        self.roteador = roteador or (RoteadorShards(caminho_unico=caminho_db, ativo=False) if caminho_db
+                                     else obter_roteador())
+        self.caminho_csv = caminho_csv
+        self.max_itens = max_itens
+        self.intervalo_segundos = intervalo_segundos
+
+        self._lock = threading.Lock()            # buffers e reserva de IDs
+        self._lock_gravacao = threading.Lock()   # uma descarga por vez
+        self._logs, self._historico, self._linhas_csv = [], [], []
+        self._tentativas = {}                    # falhas seguidas por shard (só quem descarrega usa)
+
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._laco, name="escritor-lote", daemon=True)
+        self._thread.start()
+        atexit.register(self.fechar)
+
+    # --- ENFILEIRAMENTO ---
+    def registrar(self, decisao, dados_reais):
+        """Enfileira uma decisão e a leitura correspondente. Retorna o id_leitura reservado."""
+        return self.registrar_varios([(decisao, dados_reais)])
+
+    def registrar_varios(self, pares):
+        """Enfileira vários pares (decisao, dados_reais). Retorna o primeiro id_leitura reservado."""
+        pares = list(pares)
+        if not pares:
+            return None
+
+        with self._lock:
+            primeiro_id = self._reservar_ids(len(pares))
+            epochs = {}  # decisões de um mesmo tick compartilham o timestamp
+            for deslocamento, (decisao, dados_reais) in enumerate(pares):
+                id_leitura = primeiro_id + deslocamento
+                epoch = epochs.get(decisao['timestamp'])
+                if epoch is None:
+                    epoch = epochs[decisao['timestamp']] = texto_para_epoch(decisao['timestamp'])
+                leitura = (id_leitura, decisao['timestamp'], dados_reais['id_sensor'], dados_reais['id_cultura'],
+                           decisao['umidade_solo'], dados_reais['temp_ambiente'], dados_reais['vento_kmh'],
+                           dados_reais['radiacao_solar'], decisao['volume_chuva'])
+
+                self._logs.append((epoch, dados_reais['id_sensor'], decisao['umidade_solo'],
+                                   decisao['volume_chuva'], decisao['tarifa'], decisao['acao'], decisao['motivo']))
+                self._historico.append((id_leitura, epoch) + leitura[2:])
+                self._linhas_csv.append(leitura)
+
+            cheio = len(self._logs) >= self.max_itens
+
+        if cheio:
+            self._acordar.set()
+        return primeiro_id
+
+    def registrar_decisoes(self, df_decisoes):
+        """
+        Versão colunar de registrar_varios para o DataFrame de decidir_lote (decisão e leitura
+        na mesma linha): monta as tuplas direto das colunas, sem um dict por sensor.
+        """
+        if df_decisoes.empty:
+            return None
+
+        col, epoch = _colunas_decisoes(df_decisoes)
+        dados = (col['id_sensor'], col['id_cultura'], col['umidade_solo'], col['temp_ambiente'],
+                 col['vento_kmh'], col['radiacao_solar'], col['volume_chuva'])
+
+        with self._lock:
+            primeiro_id = self._reservar_ids(len(df_decisoes))
+            ids = range(primeiro_id, primeiro_id + len(df_decisoes))
+            self._logs.extend(zip(epoch, col['id_sensor'], col['umidade_solo'], col['volume_chuva'],
+                                  col['tarifa'], col['acao'], col['motivo']))
+            self._historico.extend(zip(ids, epoch, *dados))
+            self._linhas_csv.extend(zip(ids, col['timestamp'], *dados))
+            cheio = len(self._logs) >= self.max_itens
+
+        if cheio:
+            self._acordar.set()
+        return primeiro_id
+
+    def registrar_logs(self, df_decisoes):
+        """
+        Só o log_decisao de cada linha do DataFrame de decidir_lote, sem copiar a leitura para o
+        histórico nem para o CSV: para quem decide sobre leituras que já estão no banco.
+        Retorna quantas decisões entraram no buffer.
+        """
+        if df_decisoes.empty:
+            return 0
+
+        col, epoch = _colunas_decisoes(df_decisoes)
+        with self._lock:
+            self._logs.extend(zip(epoch, col['id_sensor'], col['umidade_solo'], col['volume_chuva'],
+                                  col['tarifa'], col['acao'], col['motivo']))
+            cheio = len(self._logs) >= self.max_itens
+
+        if cheio:
+            self._acordar.set()
+        return len(df_decisoes)
+
+    def _reservar_ids(self, quantidade):
+        return self.roteador.reservar_ids(quantidade)
+
+    # --- GRAVAÇÃO ---
+    def descarregar(self, isolar=False):
+        """
+        Grava tudo que está no buffer. Retorna quantas leituras foram gravadas.
+        isolar=True grava linha a linha já na primeira falha (fechar: nada fica para trás).
+        """
+        with self._lock_gravacao:
+            with self._lock:
+                logs, historico, linhas_csv = self._logs, self._historico, self._linhas_csv
+                self._logs, self._historico, self._linhas_csv = [], [], []
+
+            if not logs and not historico:
+                return 0
+
+            # Uma transação por shard (no banco único, uma só)
+            with medir('escritor.transacao'):
+                falhas = self.roteador.gravar([(SQL_LOGS, logs, 1, 0), (SQL_HISTORICO, historico, 2, 1)])
+
+            tentativas, self._tentativas = self._tentativas, {}
+            logs_falhos, historico_falho, ids_fora = [], [], set()
+            for caminho, erro, (grupo_logs, grupo_historico) in falhas:
+                self._tentativas[caminho] = tentativas.get(caminho, 0) + 1
+                if self._tentativas[caminho] < MAX_TENTATIVAS and not isolar:
+                    logs_falhos += grupo_logs
+                    historico_falho += grupo_historico
+                    continue
+                # Uma linha ruim não segura o shard: as outras entram, ela vai para falhas_gravacao
+                del self._tentativas[caminho]
+                rejeitadas = self._gravar_linha_a_linha(grupo_logs, grupo_historico)
+                if rejeitadas and not self._registrar_falhas(rejeitadas):
+                    logs_falhos += [linha for tabela, linha, _ in rejeitadas if tabela == 'logs_decisao']
+                    historico_falho += [linha for tabela, linha, _ in rejeitadas if tabela == 'historico_clima']
+                ids_fora.update(linha[0] for tabela, linha, _ in rejeitadas if tabela == 'historico_clima')
+
+            if logs_falhos or historico_falho:
+                # Só o que era dos shards que falharam volta ao início do buffer para a próxima tentativa
+                ids_falhos = {linha[0] for linha in historico_falho}
+                with self._lock:
+                    self._logs[:0], self._historico[:0] = logs_falhos, historico_falho
+                    self._linhas_csv[:0] = [linha for linha in linhas_csv if linha[0] in ids_falhos]
+                contar('escritor.transacao', erros=1, retentativas=1)
+                print(f"❌ Erro na gravação em lote ({len(logs_falhos) + len(historico_falho)} pendentes): "
+                      f"{falhas[0][1]}")
+            if falhas:
+                # Rejeitadas não vão para o espelho: o ETL as regravaria por cima de outra leitura
+                ids_fora.update(linha[0] for linha in historico_falho)
+                historico = [linha for linha in historico if linha[0] not in ids_fora]
+                linhas_csv = [linha for linha in linhas_csv if linha[0] not in ids_fora]
+                if not historico:
+                    return 0
+
+            with medir('escritor.csv'):
+                texto = io.StringIO()
+                csv.writer(texto, lineterminator='\n').writerows(linhas_csv)
+                with open(self.caminho_csv, 'a', newline='', encoding='utf-8') as f:
+                    f.write(texto.getvalue())
+
+            return len(historico)
+
+    def _gravar_linha_a_linha(self, logs, historico):
+        """Cada linha em sua própria transação. Retorna as que falharam: [(tabela, linha, erro)]."""
+        rejeitadas = []
+        for tabela, sql, linhas, posicao_sensor, posicao_epoch in (
+                ('logs_decisao', SQL_LOGS, logs, 1, 0), ('historico_clima', SQL_HISTORICO, historico, 2, 1)):
+            for linha in linhas:
+                falhas = self.roteador.gravar([(sql, [linha], posicao_sensor, posicao_epoch)])
+                if falhas:
+                    rejeitadas.append((tabela, linha, falhas[0][1]))
+        return rejeitadas
+
+    def _registrar_falhas(self, rejeitadas):
+        """Grava as rejeitadas em falhas_gravacao (catálogo). Retorna False se nem isso foi possível."""
+        agora = texto_para_epoch(datetime.now().replace(microsecond=0))
+        try:
+            conn = conectar(self.roteador.caminho_unico)
+            try:
+                with conn:
+                    conn.executemany(SQL_FALHAS, ((agora, ORIGEM_FALHAS, tabela, str(erro), json.dumps(linha, default=str))
+                                                  for tabela, linha, erro in rejeitadas))
+            finally:
+                conn.close()
+        except Exception as e:
+            print(f"❌ Falha ao registrar {len(rejeitadas)} linhas rejeitadas (continuam no buffer): {e}")
+            return False
+        contar('escritor.falhas_gravacao', erros=len(rejeitadas))
+        print(f"⚠️ {len(rejeitadas)} linha(s) rejeitada(s) pelo banco foram para falhas_gravacao: {rejeitadas[0][2]}")
+        return True
+
+    def _laco(self):
+        while not self._parar.is_set():
+            self._acordar.wait(self.intervalo_segundos)
+            self._acordar.clear()
+            self.descarregar()
+
+    def pendentes(self):
+        """Decisões no buffer (cada uma com ou sem a cópia da leitura)."""
+        with self._lock:
+            return len(self._logs)
+
+    def fechar(self):
+        """Para a thread de descarga e grava o que ainda estiver pendente."""
+        self._parar.set()
+        self._acordar.set()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=10)
+        self.descarregar(isolar=True)
+
+
+def _colunas_decisoes(df_decisoes):
+    """Colunas do DataFrame de decidir_lote como listas e o timestamp de cada linha em epoch."""
+    col = {nome: df_decisoes[nome].tolist() for nome in (
+        'timestamp', 'id_sensor', 'id_cultura', 'umidade_solo', 'temp_ambiente', 'vento_kmh',
+        'radiacao_solar', 'volume_chuva', 'tarifa', 'acao', 'motivo')}
+    epochs = {texto: texto_para_epoch(texto) for texto in set(col['timestamp'])}
+    return col, [epochs[texto] for texto in col['timestamp']]
+
+
+_escritor = None
+_lock_escritor = threading.Lock()
+
+def obter_escritor():
+    """Escritor único do processo, criado no primeiro uso."""
+    global _escritor
+    with _lock_escritor:
+        if _escritor is None:
+            _escritor = EscritorLote()
+        return _escritor
@@ -0,0 +1,101 @@
+import numpy as np
+
+# --- 1. CONFIGURAÇÃO ---
+# Camada de solo explorada pelas raízes: 1 mm de água = 100 / PROFUNDIDADE_RAIZ_MM pontos de umidade
+PROFUNDIDADE_RAIZ_MM = 300.0
+PONTOS_UMIDADE_POR_MM = 100.0 / PROFUNDIDADE_RAIZ_MM
+UMIDADE_MAXIMA = 100.0
+
+# Cultura fora de config_culturas.csv: sem ajuste (ETc = ET0)
+KC_PADRAO = 1.0
+
+# Hargreaves com radiação medida: ET0 = 0.0135 (T + 17.8) Rs / λ  (Rs em MJ/m² no período)
+COEF_HARGREAVES = 0.0135
+CALOR_LATENTE_MJ_KG = 2.45
+W_M2_PARA_MJ_M2_H = 0.0036
+# Ajuste empírico pelo vento: +1% de ET por km/h
+FATOR_VENTO_POR_KMH = 0.01
+
+
+# --- 2. EVAPOTRANSPIRAÇÃO ---
+def evapotranspiracao(temp_ambiente, vento_kmh, radiacao_solar, kc=KC_PADRAO):
+    """
+    Evapotranspiração da cultura (ETc, mm/h) a partir das leituras horárias.
+    Aceita escalares, colunas ou matrizes [sensores, horas] (broadcast do NumPy).
+    Sem radiação (noite) a ET é zero; valores ausentes contam como zero.
+    """
+    temp = np.asarray(temp_ambiente, dtype=float)
+    vento = np.nan_to_num(np.asarray(vento_kmh, dtype=float))
+    radiacao = np.clip(np.nan_to_num(np.asarray(radiacao_solar, dtype=float)), 0, None)
+
+    radiacao_mj = radiacao * W_M2_PARA_MJ_M2_H
+    et0 = COEF_HARGREAVES * (np.nan_to_num(temp) + 17.8) * radiacao_mj / CALOR_LATENTE_MJ_KG
+    et0 = np.clip(et0, 0, None) * (1 + FATOR_VENTO_POR_KMH * vento)
+    return et0 * np.asarray(kc, dtype=float)
+
+def taxa_perda_umidade(temp_ambiente, vento_kmh, radiacao_solar, kc=KC_PADRAO):
+    """Pontos de umidade do solo perdidos por hora nas condições informadas."""
+    return evapotranspiracao(temp_ambiente, vento_kmh, radiacao_solar, kc) * PONTOS_UMIDADE_POR_MM
+
+
+# --- 3. PROJEÇÃO ---
+def projetar_umidade(umidade_inicial, temp_ambiente, vento_kmh, radiacao_solar, chuva_mm, kc=KC_PADRAO):
+    """
+    Trajetória da umidade de cada sensor ao longo das horas da previsão.
+
+    umidade_inicial e kc: [sensores]; condições e chuva: [horas] (mesma previsão para todos)
+    ou [sensores, horas]. Retorna [sensores, horas + 1]: a coluna 0 é a umidade atual e a
+    coluna h a umidade ao fim da hora h.
+
+    Tudo em somas acumuladas: a saturação em UMIDADE_MAXIMA (o excesso de chuva drena) usa a
+    fórmula de reflexão x_t = S_t - max(0, max_k≤t (S_k - teto)), sem laço por hora.
+    """
+    umidade_inicial = np.asarray(umidade_inicial, dtype=float)
+    kc = np.broadcast_to(np.asarray(kc, dtype=float), umidade_inicial.shape)
+
+    perda = taxa_perda_umidade(temp_ambiente, vento_kmh, radiacao_solar, kc[:, None])
+    ganho = np.nan_to_num(np.asarray(chuva_mm, dtype=float)) * PONTOS_UMIDADE_POR_MM
+    variacao = np.broadcast_to(ganho - perda, (len(umidade_inicial), np.shape(perda)[-1]))
+
+    livre = umidade_inicial[:, None] + np.concatenate(
+        (np.zeros((len(umidade_inicial), 1)), np.cumsum(variacao, axis=1)), axis=1)
+    excesso = np.maximum.accumulate(np.maximum(livre - UMIDADE_MAXIMA, 0), axis=1)
+    return np.clip(livre - excesso, 0, None)
+
+def horas_ate_limite(trajetoria, limite):
+    """
+    Primeira hora em que cada trajetória fica abaixo do limite (0 = já está abaixo agora;
+    np.inf = não cruza dentro do horizonte).
+    """
+    abaixo = trajetoria < np.asarray(limite, dtype=float)[:, None]
+    cruza = abaixo.any(axis=1)
+    return np.where(cruza, abaixo.argmax(axis=1), np.inf)
+
+def horas_ate_minimo(umidade, umidade_min, temp_ambiente, vento_kmh, radiacao_solar, kc=KC_PADRAO):
+    """
+    Estimativa por leitura, sem previsão: horas até umidade_min mantidas as condições atuais.
+    0 se já está abaixo; np.inf se não há perda (ex.: leitura noturna).
+    Serve tanto às decisões ao vivo quanto ao backtest (colunas inteiras do histórico).
+    """
+    folga = np.asarray(umidade, dtype=float) - np.asarray(umidade_min, dtype=float)
+    taxa = taxa_perda_umidade(temp_ambiente, vento_kmh, radiacao_solar, kc)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        horas = np.where(taxa > 0, folga / taxa, np.inf)
+    return np.where(folga <= 0, 0.0, horas)
+
+
+# --- 4. LEITURAS (DATAFRAME) ---
+def kc_das_leituras(id_cultura, df_culturas):
+    """kc_fator da cultura de cada leitura (df_culturas indexado por id_cultura, como em carregar_culturas)."""
+    return id_cultura.map(df_culturas['kc_fator']).fillna(KC_PADRAO).to_numpy(dtype=float)
+
+def estimar_leituras(df, umidade_min, df_culturas):
+    """
+    ET da cultura (mm/h) e horas até umidade_min para cada linha de um DataFrame de leituras.
+    Mesmo cálculo nas decisões do lote e no backtest.
+    """
+    kc = kc_das_leituras(df['id_cultura'], df_culturas)
+    condicoes = [df[c].to_numpy(dtype=float) for c in ('temp_ambiente', 'vento_kmh', 'radiacao_solar')]
+    et = evapotranspiracao(*condicoes, kc)
+    horas = horas_ate_minimo(df['umidade_solo'].to_numpy(dtype=float), umidade_min, *condicoes, kc)
+    return et, horas
@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+
+# Regras escalares da decisão de irrigação, só com a biblioteca padrão: usadas pelo
+# processar_decisao, pelo lote (textos dos motivos) e pela decisão rápida (decisao_rapida.py),
+# que não pode pagar o import do pandas/numpy.
+
+# Limiar usado quando a cultura do sensor não está em config_culturas.csv
+LIMIAR_UMIDADE_PADRAO = 30
+# Chuva prevista acima disto (mm nas próximas HORAS_PREVISAO horas) adia a irrigação
+LIMIAR_CHUVA_MM = 0.1
+HORAS_PREVISAO = 3
+# Chuva prevista acima disto aparece como probabilidade 100% no resumo (só informativo)
+LIMIAR_PROBABILIDADE_MM = 0.5
+
+# Códigos dos motivos, na ordem de prioridade das regras
+MOTIVO_MANUTENCAO, MOTIVO_PREDITIVO, MOTIVO_ECONOMIA, MOTIVO_EXECUCAO = 0, 1, 2, 3
+
+
+def indice_hora_atual(data):
+    """
+    Posição da hora atual em data['hourly']['time']. Os horários vêm no fuso pedido à API
+    (America/Sao_Paulo), não no do servidor: a hora atual é o UTC mais o utc_offset_seconds da
+    própria resposta. Hora fora da previsão (cache antigo): avisa e usa o primeiro horário.
+    """
+    agora = datetime.now(timezone.utc) + timedelta(seconds=data.get('utc_offset_seconds', 0))
+    hora_atual = agora.strftime("%Y-%m-%dT%H:00")
+    horarios = data['hourly']['time']
+    if hora_atual in horarios:
+        return horarios.index(hora_atual)
+    print(f"⚠️ Hora atual ({hora_atual}) fora da previsão ({horarios[0]} a {horarios[-1]}): usando o início dela.")
+    return 0
+
+def resumir_previsao(data, horas=HORAS_PREVISAO):
+    """Resume a previsão horária da API nas próximas `horas` a partir da hora atual."""
+    inicio = indice_hora_atual(data)
+    temps = data['hourly']['temperature_2m'][inicio:inicio + horas]
+    chuvas = data['hourly']['precipitation'][inicio:inicio + horas]
+
+    return {
+        "temperatura_media": round(sum(temps) / len(temps), 1),
+        "volume_chuva_total": round(sum(chuvas), 2),
+        "vai_chover": sum(chuvas) > LIMIAR_CHUVA_MM,
+        "probabilidade_chuva": 100 if sum(chuvas) > LIMIAR_PROBABILIDADE_MM else 0
+    }
+
+
+def codigo_motivo(solo_seco, vai_chover, horario_pico):
+    """Versão escalar de aplicar_regras: o código do motivo de uma leitura."""
+    if not solo_seco:
+        return MOTIVO_MANUTENCAO
+    if vai_chover:
+        return MOTIVO_PREDITIVO
+    if horario_pico:
+        return MOTIVO_ECONOMIA
+    return MOTIVO_EXECUCAO
+
+
+def textos_motivo(volume_chuva):
+    """Texto de cada código de motivo (o preditivo cita a chuva prevista)."""
+    return [
+        "MANUTENÇÃO: Umidade dentro do padrão ideal.",
+        f"PREDITIVO: Chuva de {volume_chuva}mm em breve.",
+        "ECONOMIA: Horário de energia cara. Postergando.",
+        "EXECUÇÃO: Solo seco e custo de energia favorável.",
+    ]
+
+
+def decidir(umidade, clima, horario_pico, limiar=LIMIAR_UMIDADE_PADRAO):
+    """Retorna (acao, motivo) de uma leitura de umidade com o resumo do clima e o posto tarifário."""
+    codigo = codigo_motivo(umidade < limiar, clima['vai_chover'], horario_pico)
+    acao = "LIGAR" if codigo == MOTIVO_EXECUCAO else "AGUARDAR"
+    return acao, textos_motivo(clima['volume_chuva_total'])[codigo]
@@ -0,0 +1,307 @@
+import asyncio
+import signal
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from clima_API import consultar_clima
+from decisao_irrigacao import (SQL_ULTIMAS_POR_SENSOR, carregar_culturas, decidir_lote, ultimas_por_sensor,
+                               verificar_tarifa_atual)
+from escritor_lote import MAX_ITENS, obter_escritor
+
+# --- 1. CONFIGURAÇÃO ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR / 'etl'))
+from esquema_db import conectar, ler_gravacoes
+from roteador_shards import RoteadorShards, obter_roteador
+
+# Cada grupo de sensores decide a cada INTERVALO_TICK_S; os grupos começam escalonados no intervalo
+INTERVALO_TICK_S = 5.0
+GRUPOS_SENSORES = 1
+
+# A foto das últimas leituras é atualizada pelas gravações novas (gravacoes_historico) a cada tick e refeita
+# do zero de tempos em tempos (pega upserts do ETL, que não geram gravação nova)
+RECARGA_COMPLETA_S = 600
+# Grupos que disparam quase juntos compartilham a mesma atualização
+IDADE_MAXIMA_FOTO_S = 0.5
+
+# Backpressure: com mais que isso na fila do escritor, o tick espera uma descarga antes de enfileirar
+LIMITE_PENDENTES_ESCRITOR = 10 * MAX_ITENS
+
+INTERVALO_RELATORIO_S = 60
+AMOSTRAS_LATENCIA = 1000
+
+
+# --- 2. ÚLTIMAS LEITURAS EM MEMÓRIA ---
+class FotoLeituras:
+    """
+    Última leitura de cada sensor, mantida entre ticks.
+    A carga completa usa o skip scan de decisao_irrigacao; depois disso cada atualização
+    lê só as leituras gravadas depois da marca (seq de gravacoes_historico, na ordem dos commits;
+    o id_leitura é reservado antes da gravação e não serve de marca). Se a retenção já podou
+    gravações que a foto não leu, a atualização vira carga completa. A conexão fica aberta entre
+    ticks e é usada sempre pela mesma thread (o executor de banco do serviço tem uma única thread).
+
+    Nos shards (sem caminho_db e com o roteador ligado) a carga completa é o skip scan em todos
+    os shards e a atualização lê, no shard mais novo de cada fazenda, o que passou da marca
+    daquele shard. Leituras atrasadas gravadas no mês anterior só entram na recarga completa.
+    """
+
+    def __init__(self, caminho_db=None, grupos=GRUPOS_SENSORES, recarga_completa_s=RECARGA_COMPLETA_S):
+        self.roteador = RoteadorShards(caminho_unico=caminho_db, ativo=False) if caminho_db else obter_roteador()
+        self.grupos = grupos
+        self.recarga_completa_s = recarga_completa_s
+        self.df = pd.DataFrame()
+        self.marca_seq = 0
+        self.marcas_shards = {}
+        self._recarregada_em = None
+        self._conn = None
+
+    def atualizar(self):
+        """Traz as leituras novas (ou recarrega tudo, se venceu). Retorna o DataFrame atual."""
+        agora = time.monotonic()
+        completa = self._recarregada_em is None or agora - self._recarregada_em >= self.recarga_completa_s
+        if self.roteador.ativo:
+            df, completa = self._ler_shards(completa)
+        else:
+            df, completa = self._ler_banco_unico(completa)
+
+        if completa:
+            self._recarregada_em = agora
+        elif df is not None:
+            # Mesma regra do skip scan: vale a leitura de timestamp mais recente de cada sensor
+            df = (pd.concat([self.df.drop(columns='grupo'), df], ignore_index=True)
+                  .sort_values('timestamp', kind='stable')
+                  .drop_duplicates('id_sensor', keep='last'))
+
+        if df is not None:
+            hash_sensor = pd.util.hash_pandas_object(df['id_sensor'], index=False).to_numpy()
+            self.df = df.assign(grupo=(hash_sensor % np.uint64(self.grupos)).astype(np.int64)).reset_index(drop=True)
+        return self.df
+
+    def _ler_banco_unico(self, completa):
+        if self._conn is None:
+            self._conn = conectar(self.roteador.caminho_unico)
+
+        # Marca e leituras no mesmo snapshot do WAL: nada gravado entre as duas consultas se perde
+        self._conn.execute("BEGIN")
+        try:
+            primeira, marca = ler_gravacoes(self._conn)
+            completa = completa or primeira > self.marca_seq + 1
+            if completa:
+                df = pd.read_sql(SQL_ULTIMAS_POR_SENSOR, self._conn)
+            elif marca > self.marca_seq:
+                df = pd.read_sql("""SELECT * FROM historico_clima
+                                    WHERE id_leitura IN (SELECT id_leitura FROM gravacoes_historico WHERE seq > ?)
+                                      AND id_sensor IS NOT NULL""",
+                                 self._conn, params=(self.marca_seq,))
+            else:
+                df = None
+        finally:
+            self._conn.rollback()
+        self.marca_seq = marca
+        return df, completa
+
+    def _ler_shards(self, completa):
+        if not completa:
+            # Cada linha traz a seq da gravação e a primeira seq ainda no shard (mesmo snapshot)
+            por_shard = self.roteador.consultar_por_shard(
+                """SELECT g.seq, (SELECT MIN(seq) FROM gravacoes_historico), h.*
+                    FROM gravacoes_historico g JOIN historico_clima h ON h.id_leitura = g.id_leitura
+                    WHERE g.seq > ? AND h.id_sensor IS NOT NULL""",
+                lambda caminho: (self.marcas_shards.get(caminho, 0),), recentes=True)
+            partes = []
+            for caminho, (colunas, linhas) in por_shard.items():
+                if linhas and linhas[0][1] > self.marcas_shards.get(caminho, 0) + 1:
+                    completa = True  # a retenção podou gravações que a foto não leu
+                    break
+                if linhas:
+                    partes.append(pd.DataFrame.from_records([linha[2:] for linha in linhas], columns=colunas[2:]))
+                    self.marcas_shards[caminho] = max(linha[0] for linha in linhas)
+            else:
+                return (pd.concat(partes, ignore_index=True) if partes else None), False
+
+        # Marcas lidas antes dos dados: o que entrar no meio aparece de novo na próxima atualização
+        marcas = self.roteador.consultar_por_shard("SELECT COALESCE(MAX(seq), 0) FROM gravacoes_historico")
+        self.marcas_shards = {caminho: linhas[0][0] for caminho, (_, linhas) in marcas.items()}
+        return ultimas_por_sensor(self.roteador.consultar_df(SQL_ULTIMAS_POR_SENSOR)), True
+
+    def fechar(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# --- 3. SERVIÇO ---
+class ServicoDecisao:
+    """
+    Serviço residente de decisão: um laço asyncio por grupo de sensores, com conexão,
+    culturas, cliente de clima e escritor aquecidos entre ticks.
+
+    - clima (HTTP) e banco rodam em executores; o laço de eventos só agenda;
+    - tick que estoura o intervalo não acumula atraso: os ticks perdidos são pulados e contados;
+    - escritor com fila acima de LIMITE_PENDENTES_ESCRITOR segura o tick até descarregar;
+    - só decide para sensores com leitura nova (id_leitura diferente do último decidido: os ids não
+      chegam em ordem) e grava só o log da decisão: a leitura já está no histórico e não é copiada de novo;
+    - SIGINT/SIGTERM (ou parar()) deixam o tick em andamento terminar e gravam tudo que estiver pendente.
+    """
+
+    def __init__(self, intervalo_s=INTERVALO_TICK_S, grupos=GRUPOS_SENSORES, caminho_db=None,
+                 limite_pendentes=LIMITE_PENDENTES_ESCRITOR, consultar_clima=consultar_clima):
+        self.intervalo_s = intervalo_s
+        self.grupos = grupos
+        self.limite_pendentes = limite_pendentes
+        self.consultar_clima = consultar_clima
+
+        self.foto = FotoLeituras(caminho_db, grupos)
+        self.df_culturas = carregar_culturas()
+        self.escritor = obter_escritor()
+
+        self._executor_db = ThreadPoolExecutor(max_workers=1, thread_name_prefix="servico-db")
+        self._executor_io = ThreadPoolExecutor(max_workers=4, thread_name_prefix="servico-io")
+        self._lock_foto = None
+        self._foto_em = None
+        self._parar = None
+        self._loop = None
+
+        self.latencias = [deque(maxlen=AMOSTRAS_LATENCIA) for _ in range(grupos)]
+        self.ticks = [0] * grupos
+        self.ticks_pulados = [0] * grupos
+        self.decisoes = [0] * grupos
+        # Último id_leitura decidido por sensor, um por grupo (cada grupo decide em seu próprio tick)
+        self.decididos = [pd.Series(dtype='int64') for _ in range(grupos)]
+
+    # --- TICK ---
+    async def _leituras(self):
+        """Foto atualizada; grupos que chegam juntos aproveitam a mesma ida ao banco."""
+        async with self._lock_foto:
+            if self._foto_em is None or time.monotonic() - self._foto_em >= IDADE_MAXIMA_FOTO_S:
+                await self._loop.run_in_executor(self._executor_db, self.foto.atualizar)
+                self._foto_em = time.monotonic()
+            return self.foto.df
+
+    def _decidir(self, indice, df_grupo, clima):
+        """
+        Regras vetorizadas do lote + enfileiramento no escritor (roda fora do laço de eventos),
+        só para os sensores cuja leitura ainda não foi decidida. Retorna quantas decisões saíram.
+        """
+        decididos = self.decididos[indice]
+        ultimo = decididos.reindex(df_grupo['id_sensor'].to_numpy()).to_numpy(dtype=float)  # NaN: nunca decidido
+        df_grupo = df_grupo[df_grupo['id_leitura'].to_numpy() != ultimo]
+        if df_grupo.empty:
+            return 0
+
+        df_decisoes = decidir_lote(df_grupo, clima, verificar_tarifa_atual(), self.df_culturas)
+        self.escritor.registrar_logs(df_decisoes)
+        self.decididos[indice] = df_grupo.set_index('id_sensor')['id_leitura'].combine_first(decididos)
+        return len(df_decisoes)
+
+    async def _tick(self, indice):
+        df, clima = await asyncio.gather(self._leituras(),
+                                         self._loop.run_in_executor(self._executor_io, self.consultar_clima))
+        if clima is None:
+            print(f"⚠️ Grupo {indice}: sem previsão do clima, tick adiado.")
+            return
+        if df.empty:
+            return
+
+        df_grupo = df[df['grupo'].to_numpy() == indice]
+        if df_grupo.empty:
+            return
+
+        if self.escritor.pendentes() >= self.limite_pendentes:
+            await self._loop.run_in_executor(self._executor_io, self.escritor.descarregar)
+
+        self.decisoes[indice] += await self._loop.run_in_executor(None, self._decidir, indice, df_grupo, clima)
+
+    # --- LAÇOS ---
+    async def _esperar(self, segundos):
+        """Dorme até `segundos` ou até o pedido de parada. Retorna True se é para parar."""
+        try:
+            await asyncio.wait_for(self._parar.wait(), timeout=max(segundos, 0))
+        except asyncio.TimeoutError:
+            pass
+        return self._parar.is_set()
+
+    async def _laco_grupo(self, indice):
+        proximo = time.monotonic() + indice * self.intervalo_s / self.grupos
+        while not await self._esperar(proximo - time.monotonic()):
+            inicio = time.monotonic()
+            try:
+                await self._tick(indice)
+            except Exception as e:
+                print(f"❌ Erro no tick do grupo {indice}: {e}")
+            fim = time.monotonic()
+            self.latencias[indice].append(fim - inicio)
+            self.ticks[indice] += 1
+
+            proximo += self.intervalo_s
+            if proximo <= fim:
+                # Estourou o intervalo: descarta os ticks perdidos em vez de enfileirá-los
+                perdidos = int((fim - proximo) // self.intervalo_s) + 1
+                self.ticks_pulados[indice] += perdidos
+                proximo += perdidos * self.intervalo_s
+
+    async def _laco_relatorio(self):
+        while not await self._esperar(INTERVALO_RELATORIO_S):
+            self.imprimir_relatorio()
+
+    def imprimir_relatorio(self):
+        for indice in range(self.grupos):
+            if not self.latencias[indice]:
+                continue
+            p50, p95, maximo = np.percentile(self.latencias[indice], [50, 95, 100]) * 1000
+            print(f"📈 Grupo {indice}: {self.ticks[indice]} ticks, {self.decisoes[indice]} decisões | "
+                  f"latência p50 {p50:.0f} ms, p95 {p95:.0f} ms, máx {maximo:.0f} ms"
+                  + (f" | ⚠️ {self.ticks_pulados[indice]} ticks pulados" if self.ticks_pulados[indice] else ""))
+
+    # --- CICLO DE VIDA ---
+    async def executar(self):
+        self._loop = asyncio.get_running_loop()
+        self._parar = asyncio.Event()
+        self._lock_foto = asyncio.Lock()
+        for sinal in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self._loop.add_signal_handler(sinal, self._parar.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Windows / fora da thread principal: fica o KeyboardInterrupt
+
+        print(f"🛰️ Serviço de decisão no ar: {self.grupos} grupo(s), tick de {self.intervalo_s:g}s.")
+        relatorio = asyncio.create_task(self._laco_relatorio())
+        try:
+            await asyncio.gather(*(self._laco_grupo(i) for i in range(self.grupos)))
+        finally:
+            self._parar.set()
+            await relatorio
+            await self._encerrar()
+
+    async def _encerrar(self):
+        """Grava o que está na fila do escritor e fecha conexão e executores."""
+        pendentes = self.escritor.pendentes()
+        await self._loop.run_in_executor(self._executor_io, self.escritor.descarregar)
+        await self._loop.run_in_executor(self._executor_db, self.foto.fechar)
+        self._executor_io.shutdown(wait=True)
+        self._executor_db.shutdown(wait=True)
+        self.imprimir_relatorio()
+        print(f"🛑 Serviço encerrado ({pendentes} gravações pendentes descarregadas).")
+
+    def parar(self):
+        """Pede a parada (pode ser chamado de outra thread)."""
+        if self._loop is not None and self._parar is not None:
+            self._loop.call_soon_threadsafe(self._parar.set)
+
+
+def executar_servico(intervalo_s=INTERVALO_TICK_S, grupos=GRUPOS_SENSORES):
+    try:
+        asyncio.run(ServicoDecisao(intervalo_s, grupos).executar())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    intervalo = float(sys.argv[1]) if len(sys.argv) > 1 else INTERVALO_TICK_S
+    grupos = int(sys.argv[2]) if len(sys.argv) > 2 else GRUPOS_SENSORES
+    executar_servico(intervalo, grupos)
@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+import sys
+from pathlib import Path
+from decisao_irrigacao import (PATH_CSV, LIMIAR_UMIDADE_PADRAO,
+                               MOTIVO_EXECUCAO, aplicar_regras, carregar_culturas)
+from previsao_umidade import estimar_leituras
+from regras_decisao import HORAS_PREVISAO, LIMIAR_CHUVA_MM
+from tarifas import PONTA, ROTULOS_VETOR, obter_motor_tarifas
+
+# --- 1. CONFIGURAÇÃO ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR / 'etl'))
+from limpar_dados import limpar_historico
+from regras_qualidade import MotorQualidade
+from esquema_db import conectar, serie_de_epoch
+from arquivo_colunar import iterar_arquivo
+from roteador_shards import obter_roteador
+
+# Premissas físicas de um ciclo de irrigação (uma decisão LIGAR)
+VOLUME_AGUA_POR_CICLO_L = 500.0
+CONSUMO_BOMBA_KWH = 1.5
+
+TAMANHO_CHUNK = 200_000
+
+COLUNAS_TIMELINE = ['timestamp', 'id_sensor', 'id_cultura', 'umidade_solo', 'umidade_min',
+                    'chuva_prevista_mm', 'et_mm_h', 'horas_ate_minimo', 'tarifa', 'tarifa_kwh', 'acao', 'agua_litros', 'custo_energia']
+
+
+def chuva_nas_proximas_horas(codigo_sensor, segundos, chuva, horas=HORAS_PREVISAO):
+    """
+    Soma, para cada leitura, a chuva registrada pelo mesmo sensor no intervalo (t, t + horas].
+    Funciona como uma previsão perfeita. Exige os dados ordenados por (sensor, tempo).
+    """
+    # Sensor e tempo em uma única chave ordenada: a busca nunca cruza de um sensor para outro
+    chave = codigo_sensor.astype(np.int64) * 10**11 + segundos
+    acumulado = np.concatenate(([0.0], np.cumsum(chuva)))
+    inicio = np.searchsorted(chave, chave, side='right')
+    fim = np.searchsorted(chave, chave + horas * 3600, side='right')
+    return acumulado[fim] - acumulado[inicio]
+
+
+def simular_bloco(df, df_culturas, motor_tarifas, horas_previsao=HORAS_PREVISAO):
+    """Aplica as regras de decisão a um bloco de leituras, sem API e sem gravar no banco."""
+    df = df.sort_values(['id_sensor', 'timestamp'], kind='stable')
+
+    codigo_sensor = pd.factorize(df['id_sensor'])[0]
+    segundos = df['timestamp'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+    chuva = df['chuva_mm'].to_numpy(dtype=float)
+    chuva_prevista = chuva_nas_proximas_horas(codigo_sensor, segundos, chuva, horas_previsao)
+
+    umidade = df['umidade_solo'].to_numpy(dtype=float)
+    umidade_min = (df['id_cultura']
+                   .map(df_culturas['umidade_min'])
+                   .fillna(LIMIAR_UMIDADE_PADRAO)
+                   .to_numpy(dtype=float))
+
+    codigo_tarifa, tarifa_kwh = motor_tarifas.consultar_vetor(df['timestamp'])
+    et_mm_h, horas_ate_minimo = estimar_leituras(df, umidade_min, df_culturas)
+
+    codigo = aplicar_regras(umidade < umidade_min, chuva_prevista > LIMIAR_CHUVA_MM, codigo_tarifa == PONTA)
+    ligar = codigo == MOTIVO_EXECUCAO
+
+    return pd.DataFrame({
+        "timestamp": df['timestamp'].to_numpy(),
+        "id_sensor": df['id_sensor'].to_numpy(),
+        "id_cultura": df['id_cultura'].to_numpy(),
+        "umidade_solo": umidade,
+        "umidade_min": umidade_min,
+        "chuva_prevista_mm": chuva_prevista.round(2),
+        "et_mm_h": et_mm_h.round(3),
+        "horas_ate_minimo": horas_ate_minimo.round(1),
+        "tarifa": ROTULOS_VETOR[codigo_tarifa],
+        "tarifa_kwh": tarifa_kwh,
+        "acao": np.where(ligar, "LIGAR", "AGUARDAR"),
+        "agua_litros": ligar * VOLUME_AGUA_POR_CICLO_L,
+        "custo_energia": ligar * CONSUMO_BOMBA_KWH * tarifa_kwh,
+    })[COLUNAS_TIMELINE]
+
+
+def ler_blocos(origem, tamanho_chunk):
+    """
+    Lê o histórico em blocos com datas já convertidas: CSV sujo já limpo, ou o arquivo
+    colunar (dias antigos) seguido do banco ordenado por timestamp.
+    """
+    if origem == 'csv':
+        motor = MotorQualidade()  # regras de sequência atravessam os blocos
+        for chunk in pd.read_csv(PATH_CSV, chunksize=tamanho_chunk):
+            yield limpar_historico(chunk, motor)
+    else:
+        # Dias arquivados saíram do banco: vêm primeiro, agrupados até tamanho_chunk
+        partes, linhas = [], 0
+        for df_dia in iterar_arquivo():
+            partes.append(df_dia)
+            linhas += len(df_dia)
+            if linhas >= tamanho_chunk:
+                yield pd.concat(partes, ignore_index=True)
+                partes, linhas = [], 0
+        if partes:
+            yield pd.concat(partes, ignore_index=True)
+
+        roteador = obter_roteador()
+        query = "SELECT * FROM historico_clima ORDER BY timestamp"
+        if not roteador.ativo:
+            conn = conectar(roteador.caminho_unico)
+            try:
+                for chunk in pd.read_sql(query, conn, chunksize=tamanho_chunk):
+                    yield chunk.assign(timestamp=serie_de_epoch(chunk['timestamp']))
+            finally:
+                conn.close()
+            return
+
+        # Shards: um mês por vez, com as fazendas lidas em paralelo e intercaladas por timestamp
+        # (memória limitada a um mês da frota)
+        for mes in roteador.meses():
+            df_mes = roteador.consultar_df(query, mes=mes)
+            df_mes = df_mes.sort_values('timestamp', kind='stable', ignore_index=True)
+            for inicio in range(0, len(df_mes), tamanho_chunk):
+                chunk = df_mes.iloc[inicio:inicio + tamanho_chunk]
+                yield chunk.assign(timestamp=serie_de_epoch(chunk['timestamp']))
+
+
+def executar_backtest(origem='db', caminho_saida=None, tamanho_chunk=TAMANHO_CHUNK,
+                      horas_previsao=HORAS_PREVISAO):
+    """
+    Reprocessa todo o histórico com as regras de decisao_irrigacao.py.
+    Tarifa e custo vêm do motor de tarifas (dias úteis, fins de semana e feriados).
+    Com caminho_saida, a linha do tempo vai direto para o CSV (memória limitada a um bloco)
+    e a função devolve só o resumo por sensor; sem ele, devolve (timeline, resumo).
+    """
+    df_culturas = carregar_culturas()
+    motor_tarifas = obter_motor_tarifas()
+
+    partes = []
+    resumo = None
+    pendentes = None
+    primeiro_bloco = True
+
+    def consolidar(df_timeline):
+        nonlocal resumo, primeiro_bloco
+        if df_timeline.empty:
+            return
+        if caminho_saida is not None:
+            df_timeline.to_csv(caminho_saida, mode='w' if primeiro_bloco else 'a',
+                               header=primeiro_bloco, index=False)
+            primeiro_bloco = False
+        else:
+            partes.append(df_timeline)
+
+        parcial = df_timeline.assign(ciclos=df_timeline['acao'].eq("LIGAR")).groupby('id_sensor')[
+            ['ciclos', 'agua_litros', 'custo_energia']].sum()
+        resumo = parcial if resumo is None else resumo.add(parcial, fill_value=0)
+
+    for chunk in ler_blocos(origem, tamanho_chunk):
+        if pendentes is not None:
+            chunk = pd.concat([pendentes, chunk], ignore_index=True)
+        if chunk.empty:
+            continue
+
+        # Leituras cuja janela de previsão ainda pode receber dados do próximo bloco ficam pendentes
+        corte = chunk['timestamp'].max() - pd.Timedelta(hours=horas_previsao)
+        prontas = chunk['timestamp'] <= corte
+        pendentes = chunk[~prontas]
+
+        consolidar(simular_bloco(chunk, df_culturas, motor_tarifas, horas_previsao)
+                   .pipe(lambda df: df[df['timestamp'] <= corte]))
+
+    if pendentes is not None and not pendentes.empty:
+        consolidar(simular_bloco(pendentes, df_culturas, motor_tarifas, horas_previsao))
+
+    if resumo is None:
+        resumo = pd.DataFrame(columns=['ciclos', 'agua_litros', 'custo_energia'])
+    resumo['ciclos'] = resumo['ciclos'].astype(int)
+
+    print(f"📼 Backtest concluído: {int(resumo['ciclos'].sum())} ciclos, "
+          f"{resumo['agua_litros'].sum():.0f} L, R$ {resumo['custo_energia'].sum():.2f}")
+
+    if caminho_saida is not None:
+        return resumo
+    timeline = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=COLUNAS_TIMELINE)
+    return timeline, resumo
+
+
+if __name__ == "__main__":
+    origem = 'csv' if "--csv" in sys.argv else 'db'
+    print(executar_backtest(origem=origem, caminho_saida=BASE_DIR / 'data' / 'backtest_decisoes.csv'))
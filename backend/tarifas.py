@@ -0,0 +1,146 @@
+import csv
+import numpy as np
+from datetime import date, datetime
+from pathlib import Path
+
+# --- 1. CONFIGURAÇÃO ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+PATH_TARIFAS = BASE_DIR / 'data' / 'tarifas_energia.csv'
+PATH_FERIADOS = BASE_DIR / 'data' / 'feriados.csv'
+
+# Códigos dos postos tarifários
+FORA_PONTA, INTERMEDIARIO, PONTA = 0, 1, 2
+
+# Rótulos aceitos no tarifas_energia.csv; qualquer outro é erro de configuração
+ROTULOS_TARIFA = {
+    "Fora Ponta (Barato)": FORA_PONTA,
+    "Intermediário": INTERMEDIARIO,
+    "Ponta (Caro)": PONTA,
+}
+ROTULO_POR_CODIGO = {codigo: rotulo for rotulo, codigo in ROTULOS_TARIFA.items()}
+ROTULOS_VETOR = np.array([ROTULO_POR_CODIGO[codigo] for codigo in sorted(ROTULO_POR_CODIGO)])
+
+# Calendários: dia útil ou fim de semana/feriado (sem posto de ponta)
+DIA_UTIL, FIM_DE_SEMANA = 0, 1
+DIAS_ACEITOS = {"util": DIA_UTIL, "fim_de_semana": FIM_DE_SEMANA}
+
+
+class MotorTarifas:
+    """
+    Tarifas pré-compiladas em vetores [calendário, hora]: a consulta de um horário,
+    ou de milhões deles, é um gather em arrays NumPy.
+    """
+
+    def __init__(self, codigos, precos, feriados):
+        self.codigos = codigos      # int8  [2, 24]
+        self.precos = precos        # float [2, 24]
+        self.feriados = feriados    # datetime64[D], ordenado
+
+    def consultar(self, momento=None):
+        """Retorna (rótulo, tarifa_kwh) de um único instante (padrão: agora)."""
+        momento = momento or datetime.now()
+        dia = momento.date()
+        calendario = FIM_DE_SEMANA if (dia.weekday() >= 5 or self._eh_feriado(dia)) else DIA_UTIL
+        codigo = int(self.codigos[calendario, momento.hour])
+        return ROTULO_POR_CODIGO[codigo], float(self.precos[calendario, momento.hour])
+
+    def consultar_vetor(self, timestamps):
+        """Versão vetorizada: recebe datetime64 (array ou Series) e retorna (códigos, tarifas_kwh)."""
+        ts = np.asarray(timestamps, dtype='datetime64[s]')
+        dia = ts.astype('datetime64[D]')
+        hora = ((ts - dia) // np.timedelta64(1, 'h')).astype(np.intp)
+
+        # 1970-01-01 foi quinta-feira: (dias + 3) % 7 dá 0 = segunda ... 6 = domingo
+        dia_semana = (dia.astype(np.int64) + 3) % 7
+        feriado = np.isin(dia, self.feriados)
+        calendario = np.where((dia_semana >= 5) | feriado, FIM_DE_SEMANA, DIA_UTIL)
+
+        return self.codigos[calendario, hora], self.precos[calendario, hora]
+
+    def _eh_feriado(self, dia):
+        alvo = np.datetime64(dia, 'D')
+        posicao = np.searchsorted(self.feriados, alvo)
+        return posicao < len(self.feriados) and self.feriados[posicao] == alvo
+
+
+def _ler_tabela(caminho):
+    """Lê e valida o CSV de tarifas. Sem coluna 'dia', as linhas valem para dias úteis."""
+    codigos = np.full((2, 24), -1, dtype=np.int8)
+    precos = np.full((2, 24), np.nan)
+
+    with open(caminho, newline='', encoding='utf-8') as f:
+        for numero, linha in enumerate(csv.DictReader(f), start=2):
+            rotulo = linha['tipo'].strip()
+            if rotulo not in ROTULOS_TARIFA:
+                raise ValueError(f"{caminho.name}, linha {numero}: tipo de tarifa desconhecido '{rotulo}'. "
+                                 f"Aceitos: {', '.join(ROTULOS_TARIFA)}")
+
+            hora = int(linha['hora'])
+            preco = float(linha['tarifa_kwh'])
+            if not 0 <= hora <= 23 or preco < 0:
+                raise ValueError(f"{caminho.name}, linha {numero}: hora ou tarifa_kwh fora do intervalo.")
+
+            dia = (linha.get('dia') or 'util').strip()
+            if dia not in DIAS_ACEITOS:
+                raise ValueError(f"{caminho.name}, linha {numero}: dia '{dia}' inválido (use util ou fim_de_semana).")
+            calendario = DIAS_ACEITOS[dia]
+            if codigos[calendario, hora] != -1:
+                raise ValueError(f"{caminho.name}, linha {numero}: hora {hora} repetida.")
+            codigos[calendario, hora] = ROTULOS_TARIFA[rotulo]
+            precos[calendario, hora] = preco
+
+    if (codigos[DIA_UTIL] == -1).any():
+        faltando = np.flatnonzero(codigos[DIA_UTIL] == -1).tolist()
+        raise ValueError(f"{caminho.name}: horas sem tarifa em dias úteis: {faltando}")
+
+    # Fim de semana e feriado sem tabela própria: o dia todo no posto fora de ponta
+    if (codigos[FIM_DE_SEMANA] == -1).all():
+        fora_ponta = precos[DIA_UTIL][codigos[DIA_UTIL] == FORA_PONTA]
+        codigos[FIM_DE_SEMANA] = FORA_PONTA
+        precos[FIM_DE_SEMANA] = fora_ponta.min() if fora_ponta.size else precos[DIA_UTIL].min()
+    elif (codigos[FIM_DE_SEMANA] == -1).any():
+        raise ValueError(f"{caminho.name}: tabela de fim de semana incompleta.")
+
+    return codigos, precos
+
+
+def _ler_feriados(caminho):
+    if not caminho.exists():
+        return np.array([], dtype='datetime64[D]')
+    with open(caminho, newline='', encoding='utf-8') as f:
+        datas = [date.fromisoformat(linha['data'].strip()) for linha in csv.DictReader(f)]
+    return np.unique(np.array(datas, dtype='datetime64[D]'))
+
+
+def _ler_csv(leitor, caminho):
+    """leitor(caminho) com qualquer falha de leitura (arquivo ausente, coluna faltando, linha curta) como ValueError."""
+    try:
+        return leitor(caminho)
+    except ValueError:
+        raise
+    except (OSError, csv.Error, KeyError, IndexError, AttributeError, TypeError) as e:
+        raise ValueError(f"{caminho.name}: não foi possível ler o arquivo ({type(e).__name__}: {e})") from e
+
+
+def carregar_tarifas(caminho=PATH_TARIFAS, caminho_feriados=PATH_FERIADOS):
+    """Compila as tabelas de tarifa e feriados (levanta ValueError se algum CSV faltar ou for inválido)."""
+    codigos, precos = _ler_csv(_ler_tabela, Path(caminho))
+    return MotorTarifas(codigos, precos, _ler_csv(_ler_feriados, Path(caminho_feriados)))
+
+
+_motor = None
+_versao_arquivos = None
+
+def obter_motor_tarifas():
+    """Motor compartilhado; só recompila quando algum dos CSVs muda no disco."""
+    global _motor, _versao_arquivos
+    versao = tuple(p.stat().st_mtime_ns if p.exists() else 0 for p in (PATH_TARIFAS, PATH_FERIADOS))
+    if _motor is None or versao != _versao_arquivos:
+        _motor = carregar_tarifas()
+        _versao_arquivos = versao
+    return _motor
+
+
+def eh_ponta(rotulo):
+    """True se o rótulo corresponde ao posto de ponta (energia cara)."""
+    return ROTULOS_TARIFA.get(rotulo) == PONTA
@@ -0,0 +1,144 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Sem métricas: o teste não grava nada no banco de verdade
+os.environ.setdefault("GREEN_HORIZON_METRICAS", "0")
+from clima_API import CircuitoAbertoError, ClienteClima
+
+# --- 1. CONFIGURAÇÃO ---
+PARAMS = {"latitude": -22.95, "longitude": -43.21, "hourly": ["temperature_2m", "precipitation"]}
+BACKOFF_S = 0.1
+ESPERA_MAXIMA_S = 5.0
+
+
+# --- 2. SERVIDOR FALSO ---
+class _ApiFalsa(BaseHTTPRequestHandler):
+    """Responde com os status da fila do servidor (200 quando acaba) e conta as requisições."""
+
+    def do_GET(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.requisicoes += 1
+            status = servidor.respostas.popleft() if servidor.respostas else 200
+            numero = servidor.requisicoes
+        time.sleep(servidor.atraso_s)
+        corpo = json.dumps({"requisicao": numero}).encode() if status == 200 else b'{"error": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+def iniciar_api_falsa():
+    """Servidor HTTP local em porta livre, numa thread. Retorna (servidor, url)."""
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _ApiFalsa)
+    servidor.lock = threading.Lock()
+    servidor.respostas = deque()
+    servidor.requisicoes = 0
+    servidor.atraso_s = 0.0
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/v1/forecast"
+
+
+def _esperar(condicao, limite_s=ESPERA_MAXIMA_S):
+    fim = time.monotonic() + limite_s
+    while not condicao():
+        if time.monotonic() > fim:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+# --- 3. CENÁRIOS ---
+def testar_retentativas(servidor, url):
+    """503, 503, 200: o Retry repete com backoff e o chamador recebe a terceira resposta."""
+    servidor.respostas.extend([503, 503])
+    cliente = ClienteClima(url_base=url, tentativas=3, backoff=BACKOFF_S)
+    inicio = time.monotonic()
+    dados = cliente.buscar(PARAMS)
+    decorrido = time.monotonic() - inicio
+
+    assert servidor.requisicoes == 3, f"esperava 3 requisições, houve {servidor.requisicoes}"
+    assert dados == {"requisicao": 3}, dados
+    # urllib3: a primeira retentativa sai na hora, a segunda espera backoff * 2
+    assert decorrido >= BACKOFF_S * 2, f"sem backoff entre as tentativas ({decorrido:.3f}s)"
+
+def testar_circuito(servidor, url):
+    """limite_falhas falhas seguidas abrem o circuito: a chamada seguinte nem chega ao servidor."""
+    servidor.respostas.extend([500] * 10)
+    cliente = ClienteClima(url_base=url, tentativas=0, limite_falhas=2, pausa_circuito=60)
+    for _ in range(2):
+        try:
+            cliente.buscar(PARAMS)
+        except CircuitoAbertoError:
+            raise AssertionError("circuito aberto antes do limite de falhas")
+        except Exception:
+            pass
+    antes = servidor.requisicoes
+    try:
+        cliente.buscar(PARAMS)
+        raise AssertionError("esperava CircuitoAbertoError")
+    except CircuitoAbertoError:
+        pass
+    assert servidor.requisicoes == antes, "a chamada com o circuito aberto foi ao servidor"
+    assert antes == 2, f"esperava 2 requisições antes de abrir o circuito, houve {antes}"
+
+def testar_cache_vencido(servidor, url):
+    """
+    Passado o TTL, buscar() devolve na hora a previsão antiga e atualiza em segundo plano;
+    se a atualização falhar, a antiga continua servida.
+    """
+    cliente = ClienteClima(url_base=url, tentativas=0, ttl_segundos=0.2, idade_maxima_segundos=60)
+    primeira = cliente.buscar(PARAMS)
+    time.sleep(0.3)
+
+    # Atualização lenta: a resposta vem do cache, sem esperar o servidor
+    servidor.atraso_s = 0.5
+    inicio = time.monotonic()
+    assert cliente.buscar(PARAMS) == primeira
+    assert time.monotonic() - inicio < servidor.atraso_s, "buscar() esperou a atualização"
+    assert _esperar(lambda: cliente.buscar(PARAMS) != primeira), "a atualização em segundo plano não chegou ao cache"
+    servidor.atraso_s = 0.0
+    segunda = cliente.buscar(PARAMS)
+    assert segunda["requisicao"] > primeira["requisicao"], segunda
+
+    # Atualização que falha: a previsão em cache é mantida
+    time.sleep(0.3)
+    servidor.respostas.append(500)
+    antes = servidor.requisicoes
+    assert cliente.buscar(PARAMS) == segunda
+    assert _esperar(lambda: servidor.requisicoes > antes and not cliente._atualizando)
+    assert cliente.buscar(PARAMS) == segunda
+
+
+CENARIOS = (testar_retentativas, testar_circuito, testar_cache_vencido)
+
+
+def executar_testes():
+    """Roda cada cenário contra um servidor falso novo. Retorna quantos falharam."""
+    falhas = 0
+    for cenario in CENARIOS:
+        servidor, url = iniciar_api_falsa()
+        try:
+            cenario(servidor, url)
+            print(f"✅ {cenario.__name__}")
+        except AssertionError as e:
+            falhas += 1
+            print(f"❌ {cenario.__name__}: {e}")
+        finally:
+            servidor.shutdown()
+            servidor.server_close()
+    return falhas
+
+
+if __name__ == "__main__":
+    sys.exit(1 if executar_testes() else 0)
@@ -0,0 +1,296 @@
+import io
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import clima_API
+import decisao_irrigacao
+import decisao_rapida
+import escritor_lote
+from decisao_irrigacao import (buscar_ultima_leitura_real, processar_decisao, processar_decisao_lote,
+                               salvar_tudo_sincronizado)
+
+# --- 1. CONFIGURAÇÃO ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR))
+sys.path.append(str(BASE_DIR / 'etl'))
+import limpar_dados
+import roteador_shards
+from esquema_db import COLUNAS_HISTORICO
+from dashboard.dados import CachePeriodo, CachePeriodoFrota
+
+PATH_RELATORIOS = BASE_DIR / 'data' / 'benchmarks'
+
+# Tamanhos medidos por padrão (linhas do CSV sujo); escolha outros pela linha de comando
+TAMANHOS_PADRAO = (10_000, 1_000_000, 10_000_000)
+
+# Gerador: ~20 mil leituras por sensor, entre 10 e 1000 sensores conforme o tamanho
+LEITURAS_POR_SENSOR = 20_000
+INTERVALO_LEITURA_MIN = 15
+PROP_NULOS = 0.01           # umidade_solo vazia
+PROP_PICOS = 0.005          # temp_ambiente absurda (> 60 °C)
+PROP_CORROMPIDAS = 0.001    # linha sem id_leitura (colunas deslocadas)
+SEMENTE = 42
+INICIO_DADOS = datetime(2025, 1, 1)
+LINHAS_POR_BLOCO = 500_000
+
+# Repetições dos caminhos rápidos (o relatório traz mediana, mínimo e máximo)
+REPETICOES = 20
+CHAMADAS_SALVAR = 1000
+
+# Arquivos de configuração copiados para a pasta isolada de cada tamanho
+ARQUIVOS_CONFIG = ('config_culturas.csv', 'tarifas_energia.csv', 'feriados.csv', 'config_talhoes.csv')
+
+
+# --- 2. GERADOR DE DADOS SINTÉTICOS ---
+def gerar_historico(caminho, linhas, sensores=None, intervalo_min=INTERVALO_LEITURA_MIN,
+                    prop_nulos=PROP_NULOS, prop_picos=PROP_PICOS, prop_corrompidas=PROP_CORROMPIDAS,
+                    semente=SEMENTE, inicio=INICIO_DADOS, linhas_por_bloco=LINHAS_POR_BLOCO):
+    """
+    Gera um CSV no formato de historico_leituras_sujo.csv, determinístico para a mesma semente
+    e os mesmos parâmetros. Os sensores leem juntos a cada intervalo_min (ordem por tempo), com
+    ciclo diário de temperatura e radiação, chuva esporádica e umidade que seca de dia e sobe
+    com a chuva. A sujeira imita a do CSV real: umidade vazia, picos de temperatura e linhas
+    sem id_leitura. Escreve em blocos (memória limitada a linhas_por_bloco).
+    """
+    sensores = sensores or int(np.clip(linhas // LEITURAS_POR_SENSOR, 10, 1000))
+    largura = len(str(sensores))
+    nomes_sensores = np.array([f"S-{i + 1:0{max(largura, 2)}d}" for i in range(sensores)])
+    culturas_sensores = np.arange(sensores) % 3 + 1
+    base_sensores = np.random.default_rng(semente).uniform(35, 75, sensores)
+
+    with open(caminho, 'w', newline='', encoding='utf-8') as f:
+        f.write(",".join(COLUNAS_HISTORICO) + "\n")
+        for numero_bloco, primeira in enumerate(range(0, linhas, linhas_por_bloco)):
+            rng = np.random.default_rng([semente, numero_bloco])
+            indice = np.arange(primeira, min(primeira + linhas_por_bloco, linhas))
+            passo, sensor = np.divmod(indice, sensores)
+
+            minutos = passo * intervalo_min
+            hora_do_dia = (minutos / 60) % 24
+            sol = np.clip(np.sin((hora_do_dia - 6) / 12 * np.pi), 0, None)
+            chuva = np.where(rng.random(len(indice)) < 0.03, rng.exponential(4, len(indice)).round(1), 0.0)
+
+            df = pd.DataFrame({
+                'id_leitura': indice + 1,
+                'timestamp': np.datetime64(inicio, 's') + (minutos * 60).astype('timedelta64[s]'),
+                'id_sensor': nomes_sensores[sensor],
+                'id_cultura': culturas_sensores[sensor],
+                'umidade_solo': np.clip(base_sensores[sensor] - 12 * sol + 2 * chuva
+                                        + rng.normal(0, 3, len(indice)), 5, 95).round(2),
+                'temp_ambiente': (18 + 12 * sol + rng.normal(0, 1.5, len(indice))).round(2),
+                'vento_kmh': rng.gamma(2, 5, len(indice)).round(1),
+                'radiacao_solar': (900 * sol * rng.uniform(0.6, 1, len(indice))).round(1),
+                'chuva_mm': chuva,
+            })
+            df.loc[rng.random(len(df)) < prop_nulos, 'umidade_solo'] = np.nan
+            picos = rng.random(len(df)) < prop_picos
+            df.loc[picos, 'temp_ambiente'] = rng.uniform(80, 300, int(picos.sum())).round(1)
+
+            texto = df.to_csv(header=False, index=False).split("\n")
+            for posicao in np.flatnonzero(rng.random(len(df)) < prop_corrompidas):
+                texto[posicao] = texto[posicao].split(",", 1)[1]
+            f.write("\n".join(texto))
+
+    return {"linhas": linhas, "sensores": sensores, "intervalo_min": intervalo_min,
+            "inicio": str(inicio), "fim": str(inicio + timedelta(minutes=int((linhas - 1) // sensores) * intervalo_min))}
+
+
+# --- 3. AMBIENTE ISOLADO ---
+class ClienteClimaFalso:
+    """Substitui o ClienteClima: mesma interface buscar(params), resposta fixa e sem rede."""
+
+    def buscar(self, params):
+        # Horários no relógio local, com o deslocamento dele (a API real manda o do fuso pedido)
+        agora = datetime.now().astimezone()
+        inicio = agora.replace(minute=0, second=0, microsecond=0, tzinfo=None)
+        horas = 24 * int(params.get('forecast_days', 2))
+        return {"utc_offset_seconds": int(agora.utcoffset().total_seconds()), "hourly": {
+            "time": [(inicio + timedelta(hours=h)).strftime("%Y-%m-%dT%H:00") for h in range(horas)],
+            "temperature_2m": [24.0 + (h % 24) / 4 for h in range(horas)],
+            "precipitation": [0.0] * horas,
+            "wind_speed_10m": [8.0] * horas,
+            "shortwave_radiation": [0.0] * horas,
+        }}
+
+
+@contextmanager
+def ambiente_isolado(pasta):
+    """
+    Aponta ETL, decisão, escritor e clima para uma pasta temporária (banco, CSV e configs
+    próprios), sem tocar nos dados reais. Restaura tudo na saída.
+    Com GREEN_HORIZON_SHARDS=1 o roteador grava e lê em pasta/shards (o banco vira só o catálogo).
+    """
+    pasta = Path(pasta)
+    for nome in ARQUIVOS_CONFIG:
+        if (BASE_DIR / 'data' / nome).exists():
+            shutil.copy(BASE_DIR / 'data' / nome, pasta / nome)
+
+    caminho_db = pasta / 'green_horizon.db'
+    caminho_csv = pasta / 'historico_leituras_sujo.csv'
+    roteador = roteador_shards.RoteadorShards(raiz=pasta / 'shards', caminho_unico=caminho_db)
+    trocas = [(limpar_dados, 'DB_NAME', caminho_db), (limpar_dados, 'DATA_DIR', pasta),
+              (limpar_dados, 'PATH_HISTORICO', caminho_csv),
+              (decisao_irrigacao, 'PATH_CSV', caminho_csv),
+              (decisao_rapida, 'PATH_SNAPSHOT', pasta / 'config_decisao.marshal'),
+              (roteador_shards, '_roteador', roteador),
+              (clima_API, 'cliente_clima', ClienteClimaFalso()),
+              (escritor_lote, '_escritor', escritor_lote.EscritorLote(caminho_csv=caminho_csv, roteador=roteador))]
+    originais = [(modulo, nome, getattr(modulo, nome)) for modulo, nome, _ in trocas]
+    for modulo, nome, valor in trocas:
+        setattr(modulo, nome, valor)
+    try:
+        yield caminho_db, caminho_csv
+    finally:
+        escritor_lote._escritor.fechar()
+        for modulo, nome, valor in originais:
+            setattr(modulo, nome, valor)
+
+
+def cronometrar(funcao, repeticoes=1):
+    """Executa `funcao` `repeticoes` vezes (saída suprimida) e resume os tempos em segundos."""
+    tempos = []
+    for _ in range(repeticoes):
+        with redirect_stdout(io.StringIO()):
+            inicio = time.perf_counter()
+            funcao()
+            tempos.append(time.perf_counter() - inicio)
+    return {"repeticoes": repeticoes, "mediana_s": statistics.median(tempos),
+            "min_s": min(tempos), "max_s": max(tempos)}
+
+def cronometrar_partida_fria(modulo, repeticoes=5):
+    """Processo Python novo que só importa `modulo`: o custo fixo que o cron paga a cada execução."""
+    comando = [sys.executable, "-c", f"import sys; sys.path.insert(0, {str(BASE_DIR / 'backend')!r}); import {modulo}"]
+    return cronometrar(lambda: subprocess.run(comando, check=True, capture_output=True), repeticoes)
+
+
+# --- 4. CAMINHOS MEDIDOS ---
+def medir_tamanho(linhas, repeticoes=REPETICOES, chamadas_salvar=CHAMADAS_SALVAR):
+    """Gera o CSV de `linhas` linhas numa pasta temporária e mede os caminhos principais."""
+    resultados = []
+
+    def registrar(caminho, medida, **extras):
+        resultados.append(dict({"linhas": linhas, "caminho": caminho}, **medida, **extras))
+        print(f"   ↳ {caminho:<32} mediana {medida['mediana_s'] * 1000:>10.1f} ms "
+              f"({medida['repeticoes']}x)")
+
+    with tempfile.TemporaryDirectory(prefix="gh_bench_") as pasta, ambiente_isolado(pasta) as (caminho_db, caminho_csv):
+        print(f"\n⏱️ {linhas:,} linhas")
+        dados = {}
+        medida = cronometrar(lambda: dados.update(gerar_historico(caminho_csv, linhas)))
+        registrar("gerar_historico", medida, linhas_por_s=linhas / medida['mediana_s'])
+
+        medida = cronometrar(limpar_dados.run_etl)
+        _, contagens = roteador_shards.obter_roteador().consultar("SELECT COUNT(*) FROM historico_clima")
+        carregadas = sum(total for total, in contagens)
+        registrar("run_etl", medida, linhas_por_s=linhas / medida['mediana_s'], linhas_validas=carregadas)
+
+        # Recarga do mesmo arquivo (upsert sobre o que o run_etl gravou): a limpeza é a parte paralela
+        paralelo = {}
+        medida = cronometrar(lambda: paralelo.update(limpar_dados.run_etl_paralelo()))
+        registrar("run_etl_paralelo", medida, linhas_por_s=linhas / medida['mediana_s'],
+                  processos=paralelo['processos'], linhas_por_s_limpeza=linhas / paralelo['segundos_limpeza'])
+
+        registrar("buscar_ultima_leitura_real", cronometrar(buscar_ultima_leitura_real, repeticoes))
+        registrar("processar_decisao", cronometrar(processar_decisao, repeticoes))
+        cliente_falso = ClienteClimaFalso()
+        registrar("processar_decisao_rapida",
+                  cronometrar(lambda: decisao_rapida.processar_decisao_rapida(cliente_falso), repeticoes))
+        registrar("partida_fria decisao_irrigacao", cronometrar_partida_fria("decisao_irrigacao"))
+        registrar("partida_fria decisao_rapida", cronometrar_partida_fria("decisao_rapida"))
+        registrar("processar_decisao_lote", cronometrar(processar_decisao_lote, repeticoes),
+                  sensores=dados['sensores'])
+
+        dados_reais = buscar_ultima_leitura_real()
+        decisao = {"timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                   "umidade_solo": dados_reais['umidade_solo'], "volume_chuva": 0.0,
+                   "tarifa": "Fora Ponta (Barato)", "acao": "AGUARDAR", "motivo": "benchmark"}
+
+        def salvar_varias():
+            for _ in range(chamadas_salvar):
+                salvar_tudo_sincronizado(decisao, dados_reais)
+            escritor_lote._escritor.descarregar()
+        medida = cronometrar(salvar_varias)
+        registrar("salvar_tudo_sincronizado", medida, chamadas=chamadas_salvar,
+                  por_chamada_s=medida['mediana_s'] / chamadas_salvar)
+
+        # carregar_dados_reais (app.py) é um CachePeriodo (nos shards, CachePeriodoFrota) guardado no
+        # st.cache_resource: mede a carga fria do período inteiro e a atualização incremental depois de novas gravações
+        inicio = datetime.fromisoformat(dados['inicio']).date()
+        fim = datetime.fromisoformat(dados['fim']).date()
+        roteador = roteador_shards.obter_roteador()
+        novo_cache = ((lambda: CachePeriodoFrota(inicio, fim, roteador, caminho_csv)) if roteador.ativo
+                      else (lambda: CachePeriodo(inicio, fim, caminho_db, caminho_csv)))
+        cache = {}
+        registrar("carregar_dados_reais (frio)", cronometrar(lambda: cache.update(c=novo_cache())))
+        with redirect_stdout(io.StringIO()):
+            salvar_varias()
+        registrar("carregar_dados_reais (incremental)", cronometrar(cache['c'].atualizar),
+                  linhas_novas=chamadas_salvar)
+
+    return resultados
+
+
+# --- 5. RELATÓRIO ---
+def versao_codigo():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return None
+
+def executar_benchmark(tamanhos=TAMANHOS_PADRAO, repeticoes=REPETICOES, pasta_relatorio=PATH_RELATORIOS):
+    """Mede todos os tamanhos e grava o relatório JSON (um arquivo por execução). Retorna o caminho."""
+    relatorio = {
+        "versao": versao_codigo(),
+        "gerado_em": datetime.now().isoformat(timespec='seconds'),
+        "ambiente": {"python": platform.python_version(), "pandas": pd.__version__, "numpy": np.__version__,
+                     "plataforma": platform.platform(), "processador": platform.processor()},
+        "gerador": {"semente": SEMENTE, "intervalo_min": INTERVALO_LEITURA_MIN, "prop_nulos": PROP_NULOS,
+                    "prop_picos": PROP_PICOS, "prop_corrompidas": PROP_CORROMPIDAS},
+        "resultados": [],
+    }
+    for linhas in tamanhos:
+        relatorio["resultados"].extend(medir_tamanho(linhas, repeticoes))
+
+    pasta_relatorio = Path(pasta_relatorio)
+    pasta_relatorio.mkdir(parents=True, exist_ok=True)
+    caminho = pasta_relatorio / f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json"
+    caminho.write_text(json.dumps(relatorio, indent=2, ensure_ascii=False), encoding='utf-8')
+    print(f"\n📄 Relatório salvo em {caminho}")
+    return caminho
+
+def comparar_relatorios(caminho_anterior, caminho_atual):
+    """Mediana atual / anterior para cada (linhas, caminho) presente nos dois relatórios (> 1 = mais lento)."""
+    def medianas(caminho):
+        dados = json.loads(Path(caminho).read_text(encoding='utf-8'))
+        return dados.get("versao"), {(r["linhas"], r["caminho"]): r["mediana_s"] for r in dados["resultados"]}
+
+    versao_anterior, anterior = medianas(caminho_anterior)
+    versao_atual, atual = medianas(caminho_atual)
+    print(f"\n📊 {versao_anterior} -> {versao_atual}")
+    razoes = {}
+    for chave in sorted(anterior.keys() & atual.keys()):
+        razoes[chave] = atual[chave] / anterior[chave] if anterior[chave] else float('inf')
+        alerta = " ⚠️" if razoes[chave] > 1.2 else ""
+        print(f"   {chave[0]:>12,} | {chave[1]:<36} x{razoes[chave]:.2f}{alerta}")
+    return razoes
+
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    tamanhos = tuple(int(a) for a in argumentos) or TAMANHOS_PADRAO
+    caminho = executar_benchmark(tamanhos)
+    if "--comparar" in sys.argv:
+        anteriores = sorted(PATH_RELATORIOS.glob("benchmark_*.json"))
+        if len(anteriores) >= 2:
+            comparar_relatorios(anteriores[-2], caminho)
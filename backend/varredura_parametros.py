@@ -0,0 +1,254 @@
+import itertools
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from decisao_irrigacao import LIMIAR_UMIDADE_PADRAO, MOTIVO_EXECUCAO, aplicar_regras, carregar_culturas
+from regras_decisao import HORAS_PREVISAO, LIMIAR_CHUVA_MM
+from simulador_historico import CONSUMO_BOMBA_KWH, TAMANHO_CHUNK, VOLUME_AGUA_POR_CICLO_L, ler_blocos
+from tarifas import PONTA, obter_motor_tarifas
+
+# --- 1. CONFIGURAÇÃO ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BASE_DIR / 'etl'))
+from metricas import medido, medir
+
+PATH_SAIDA = BASE_DIR / 'data' / 'varredura_parametros.csv'
+
+PROCESSOS_VARREDURA = os.cpu_count() or 1
+# Combinações por tarefa do pool (todas da mesma cultura e janela de previsão)
+COMBINACOES_POR_TAREFA = 250
+
+# Parâmetros varridos, aplicados a cada cultura:
+#   deslocamento_umidade: pontos somados ao umidade_min da cultura para o limiar de "solo seco"
+#                         (cultura fora do cadastro parte de LIMIAR_UMIDADE_PADRAO)
+#   limiar_chuva_mm: chuva prevista acima disto adia a irrigação
+#   horas_previsao: janela da previsão de chuva
+GRADE_PADRAO = {
+    "deslocamento_umidade": (-10, -5, 0, 5, 10),
+    "limiar_chuva_mm": (0.0, LIMIAR_CHUVA_MM, 0.5, 1.0, 2.0),
+    "horas_previsao": (1, 2, HORAS_PREVISAO, 6, 12),
+}
+# Busca aleatória: sorteio uniforme dentro das faixas (horas inteiras)
+FAIXAS_PADRAO = {
+    "deslocamento_umidade": (-15.0, 15.0),
+    "limiar_chuva_mm": (0.0, 3.0),
+    "horas_previsao": (1, 12),
+}
+# O que roda hoje no lote, no serviço e no backtest: o umidade_min da cultura, sem deslocamento.
+# processar_decisao e decisao_rapida (um sensor) ainda comparam com o fixo LIMIAR_UMIDADE_PADRAO
+PARAMETROS_ATUAIS = {"deslocamento_umidade": 0, "limiar_chuva_mm": LIMIAR_CHUVA_MM, "horas_previsao": HORAS_PREVISAO}
+
+# Intervalo entre leituras contado como "abaixo do mínimo": a lacuna de um sensor fora do ar
+# conta no máximo isto
+MAX_HORAS_ENTRE_LEITURAS = 6.0
+
+# Arrays do histórico gravados em .npy e abertos em modo mmap pelos processos (só leitura)
+ARRAYS = ("chave", "inicio_janela", "chuva_acumulada", "linhas_cultura", "umidade", "abaixo_minimo_h", "ponta",
+          "tarifa_kwh")
+
+
+# --- 2. COMBINAÇÕES ---
+def grade_parametros(grade=None):
+    """Todas as combinações da grade ({parâmetro: valores}) como lista de dicts."""
+    grade = grade or GRADE_PADRAO
+    return [dict(zip(grade, valores)) for valores in itertools.product(*grade.values())]
+
+def amostrar_parametros(quantidade, faixas=None, semente=0):
+    """Busca aleatória: `quantidade` combinações sorteadas dentro das faixas ({parâmetro: (mín, máx)})."""
+    faixas = faixas or FAIXAS_PADRAO
+    rng = np.random.default_rng(semente)
+    sorteios = {nome: (rng.integers(minimo, maximo + 1, quantidade) if nome == "horas_previsao"
+                       else rng.uniform(minimo, maximo, quantidade).round(2))
+                for nome, (minimo, maximo) in faixas.items()}
+    return [{nome: valores[i].item() for nome, valores in sorteios.items()} for i in range(quantidade)]
+
+
+# --- 3. HISTÓRICO EM ARRAYS ---
+def preparar_historico(pasta, origem='db', tamanho_chunk=TAMANHO_CHUNK):
+    """
+    Lê o histórico uma vez (mesmos blocos do backtest), ordena por (sensor, tempo) e grava em `pasta`
+    os arrays de ARRAYS. O que não depende dos parâmetros já sai pronto: tarifa e posto de cada
+    leitura, chuva acumulada (previsão perfeita, como no backtest) e as horas até a próxima leitura
+    do sensor quando a umidade está abaixo do umidade_min da cultura.
+    As linhas de cada cultura ficam juntas em linhas_cultura (um sensor pode mudar de cultura, mas a
+    chuva prevista é sempre a do sensor). Retorna {id_cultura: (início, fim)} em linhas_cultura.
+    """
+    df_culturas = carregar_culturas()
+    motor_tarifas = obter_motor_tarifas()
+    sensores = {}
+    partes = {nome: [] for nome in ("cultura", "sensor", "segundos", "chuva", "umidade", "ponta", "tarifa_kwh")}
+
+    for chunk in ler_blocos(origem, tamanho_chunk):
+        if chunk.empty:
+            continue
+        codigos, unicos = pd.factorize(chunk['id_sensor'].fillna(''))
+        partes["sensor"].append(np.array([sensores.setdefault(u, len(sensores)) for u in unicos],
+                                         dtype=np.int64)[codigos])
+        partes["cultura"].append(chunk['id_cultura'].fillna(-1).to_numpy(dtype=np.int64))
+        partes["segundos"].append(chunk['timestamp'].to_numpy(dtype='datetime64[s]').astype(np.int64))
+        partes["chuva"].append(np.nan_to_num(chunk['chuva_mm'].to_numpy(dtype=float)))
+        partes["umidade"].append(chunk['umidade_solo'].to_numpy(dtype=float))
+        codigo_tarifa, tarifa_kwh = motor_tarifas.consultar_vetor(chunk['timestamp'])
+        partes["ponta"].append(np.asarray(codigo_tarifa) == PONTA)
+        partes["tarifa_kwh"].append(np.asarray(tarifa_kwh, dtype=float))
+
+    colunas = {nome: np.concatenate(valores) if valores else np.empty(0) for nome, valores in partes.items()}
+    ordem = np.lexsort((colunas["segundos"], colunas["sensor"]))
+    colunas = {nome: valores[ordem] for nome, valores in colunas.items()}
+    cultura, segundos = colunas["cultura"].astype(np.int64), colunas["segundos"].astype(np.int64)
+
+    # Mesma chave do backtest (sensor e tempo): crescente no histórico inteiro, e a janela de
+    # previsão nunca cruza de um sensor para outro
+    sensor = colunas["sensor"].astype(np.int64)
+    chave = sensor * 10**11 + segundos
+    nova_serie = np.r_[True, sensor[1:] != sensor[:-1]]
+
+    umidade_min = pd.Series(cultura).map(df_culturas['umidade_min']).fillna(LIMIAR_UMIDADE_PADRAO).to_numpy(dtype=float)
+    ate_proxima = np.r_[np.where(nova_serie[1:], 0, np.diff(segundos)), 0] / 3600
+    abaixo_minimo_h = np.where(colunas["umidade"] < umidade_min,
+                               np.minimum(ate_proxima, MAX_HORAS_ENTRE_LEITURAS), 0.0)
+
+    linhas_cultura = np.argsort(cultura, kind='stable')
+    arrays = {
+        "chave": chave,
+        "inicio_janela": np.searchsorted(chave, chave, side='right'),
+        "chuva_acumulada": np.concatenate(([0.0], np.cumsum(colunas["chuva"]))),
+        "linhas_cultura": linhas_cultura,
+        "umidade": colunas["umidade"].astype(float),
+        "abaixo_minimo_h": abaixo_minimo_h,
+        "ponta": colunas["ponta"].astype(bool),
+        "tarifa_kwh": colunas["tarifa_kwh"].astype(float),
+    }
+    for nome in ARRAYS:
+        np.save(Path(pasta) / f"{nome}.npy", arrays[nome])
+
+    culturas, inicios = np.unique(cultura[linhas_cultura], return_index=True)
+    fins = np.r_[inicios[1:], len(cultura)]
+    return {int(c): (int(a), int(b)) for c, a, b in zip(culturas, inicios, fins)}
+
+
+# --- 4. AVALIAÇÃO (PROCESSOS DO POOL) ---
+_arrays = None
+
+def _abrir_arrays(pasta):
+    """Inicializador do pool: cada processo mapeia os arrays do disco (as páginas são compartilhadas)."""
+    global _arrays
+    _arrays = {nome: np.load(Path(pasta) / f"{nome}.npy", mmap_mode='r') for nome in ARRAYS}
+
+def _avaliar_tarefa(inicio, fim, limiar_base, horas_previsao, combinacoes):
+    """
+    Processo do pool: as combinações de uma cultura (faixa [inicio, fim) de linhas_cultura) com a
+    mesma janela. A chuva prevista é calculada uma vez; cada combinação só refaz as regras
+    (aplicar_regras). Retorna [(ciclos, água, custo, horas abaixo do mínimo)] na ordem das combinações.
+    """
+    a = _arrays
+    linhas = np.asarray(a["linhas_cultura"][inicio:fim])
+    fim_janela = np.searchsorted(a["chave"], a["chave"][linhas] + horas_previsao * 3600, side='right')
+    chuva_prevista = a["chuva_acumulada"][fim_janela] - a["chuva_acumulada"][a["inicio_janela"][linhas]]
+    umidade = a["umidade"][linhas]
+    abaixo_minimo_h = a["abaixo_minimo_h"][linhas]
+    ponta = a["ponta"][linhas]
+    tarifa_kwh = a["tarifa_kwh"][linhas]
+
+    resultados = []
+    for deslocamento, limiar_chuva in combinacoes:
+        ligar = aplicar_regras(umidade < limiar_base + deslocamento, chuva_prevista > limiar_chuva,
+                               ponta) == MOTIVO_EXECUCAO
+        ciclos = int(ligar.sum())
+        resultados.append((ciclos, ciclos * VOLUME_AGUA_POR_CICLO_L,
+                           float(CONSUMO_BOMBA_KWH * tarifa_kwh[ligar].sum()),
+                           float(abaixo_minimo_h[~ligar].sum())))
+    return resultados
+
+
+# --- 5. VARREDURA ---
+@medido('varredura.total')
+def executar_varredura(combinacoes=None, origem='db', processos=PROCESSOS_VARREDURA, caminho_saida=None):
+    """
+    Avalia cada combinação de parâmetros (grade_parametros ou amostrar_parametros) em cada cultura
+    contra o histórico, com as mesmas regras e premissas do backtest (previsão perfeita a partir da
+    chuva registrada). Para cada cultura e combinação: ciclos, água (L), custo de energia (R$, pelo
+    tarifa_kwh da hora) e horas em que o solo ficou abaixo do umidade_min sem irrigação.
+    O histórico é lido uma vez para arrays em disco, abertos em mmap pelos processos do pool.
+    """
+    combinacoes = combinacoes or grade_parametros()
+    df_culturas = carregar_culturas()
+    inicio = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(prefix="gh_varredura_") as pasta:
+        with medir('varredura.preparar'):
+            faixas = preparar_historico(pasta, origem)
+        leituras = sum(fim - ini for ini, fim in faixas.values())
+        print(f"🧪 Varredura: {len(combinacoes)} combinações × {len(faixas)} cultura(s) sobre {leituras:,} leituras "
+              f"em {processos} processo(s)...")
+
+        # Uma tarefa por (cultura, janela), em pedaços de COMBINACOES_POR_TAREFA
+        tarefas, chaves = [], []
+        por_janela = {}
+        for indice, combinacao in enumerate(combinacoes):
+            por_janela.setdefault(int(combinacao["horas_previsao"]), []).append(indice)
+        for id_cultura, (ini, fim) in faixas.items():
+            limiar_base = float(df_culturas['umidade_min'].get(id_cultura, LIMIAR_UMIDADE_PADRAO))
+            for horas, indices in por_janela.items():
+                for n in range(0, len(indices), COMBINACOES_POR_TAREFA):
+                    pedaco = indices[n:n + COMBINACOES_POR_TAREFA]
+                    tarefas.append((ini, fim, limiar_base, horas,
+                                    [(combinacoes[i]["deslocamento_umidade"], combinacoes[i]["limiar_chuva_mm"])
+                                     for i in pedaco]))
+                    chaves.append((id_cultura, limiar_base, pedaco))
+
+        with medir('varredura.avaliar'), ProcessPoolExecutor(max_workers=processos, initializer=_abrir_arrays,
+                                                              initargs=(pasta,)) as pool:
+            respostas = list(pool.map(_avaliar_tarefa, *zip(*tarefas))) if tarefas else []
+
+    linhas = []
+    for (id_cultura, limiar_base, pedaco), resultados in zip(chaves, respostas):
+        for i, (ciclos, agua, custo, horas_abaixo) in zip(pedaco, resultados):
+            combinacao = combinacoes[i]
+            linhas.append({
+                "id_cultura": id_cultura,
+                "cultura": df_culturas['nome'].get(id_cultura, "não cadastrada"),
+                "combinacao": i,
+                "limiar_umidade": limiar_base + combinacao["deslocamento_umidade"],
+                **combinacao,
+                "ciclos": ciclos,
+                "agua_litros": agua,
+                "custo_energia": round(custo, 2),
+                "horas_abaixo_minimo": round(horas_abaixo, 1),
+            })
+    df = pd.DataFrame(linhas)
+    if not df.empty:
+        df = df.sort_values(['id_cultura', 'horas_abaixo_minimo', 'custo_energia'], ignore_index=True)
+
+    decorrido = time.perf_counter() - inicio
+    print(f"✅ Varredura concluída em {decorrido:.1f}s ({len(df) / decorrido:,.0f} avaliações/s).")
+    if caminho_saida is not None:
+        df.to_csv(caminho_saida, index=False)
+        print(f"📄 Resultado salvo em {caminho_saida}")
+    return df
+
+def resumo_varredura(df, melhores=5):
+    """Por cultura: a combinação atual (PARAMETROS_ATUAIS, se varrida) e as `melhores` por horas abaixo do mínimo e custo."""
+    if df.empty:
+        return df
+    atual = np.logical_and.reduce([np.isclose(df[nome], valor) for nome, valor in PARAMETROS_ATUAIS.items()])
+    return pd.concat([df[atual].assign(posicao="atual"),
+                      df.groupby('id_cultura', sort=True).head(melhores).assign(posicao="melhor")],
+                     ignore_index=True).sort_values(['id_cultura', 'posicao'], kind='stable', ignore_index=True)
+
+
+if __name__ == "__main__":
+    argumentos = sys.argv[1:]
+    origem = 'csv' if "--csv" in argumentos else 'db'
+    processos = int(argumentos[argumentos.index("--processos") + 1]) if "--processos" in argumentos else PROCESSOS_VARREDURA
+    if "--aleatoria" in argumentos:
+        combinacoes = amostrar_parametros(int(argumentos[argumentos.index("--aleatoria") + 1]))
+    else:
+        combinacoes = grade_parametros()
+    df = executar_varredura(combinacoes, origem, processos, caminho_saida=PATH_SAIDA)
+    print(resumo_varredura(df).to_string(index=False))
@@ -0,0 +1,463 @@
+import calendar
+import io
+import threading
+import pandas as pd
+from datetime import date, timedelta
+from pathlib import Path
+from etl.esquema_db import PATH_DB, conectar, ler_cortes, ler_gravacoes, serie_de_epoch
+from etl.metricas import medir
+from etl.roteador_shards import RoteadorShards, obter_roteador
+
+# --- 1. CONFIGURAÇÃO ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+PATH_CSV_SUJO = BASE_DIR / 'data' / 'historico_leituras_sujo.csv'
+
+# Acima destes volumes o período é lido dos rollups (15 min, horário, depois diário)
+MAX_PONTOS_BRUTOS = 20_000
+MAX_PONTOS_HORARIOS = 20_000
+# Decisões individuais (gráfico de dispersão e último status): só as mais recentes do período
+MAX_LOGS = 5_000
+TAMANHO_CHUNK_CSV = 200_000
+
+BRUTO, QUINZE_MIN, HORARIO, DIARIO = "bruto", "de 15 min", "horário", "diário"
+ORDEM_GRANULARIDADE = (BRUTO, QUINZE_MIN, HORARIO, DIARIO)
+TABELA_ROLLUP = {QUINZE_MIN: ("rollup_15min_sensor", "quinze_min", 900),
+                 HORARIO: ("rollup_horario_sensor", "hora", 3600),
+                 DIARIO: ("rollup_diario_sensor", "dia", 86400)}
+COLUNAS_BALDE = ("leituras, qtd_umidade, soma_umidade, min_umidade, max_umidade, "
+                 "qtd_temp, soma_temp, min_temp, max_temp, soma_chuva")
+SQL_GRAVADAS_DEPOIS = "SELECT id_leitura FROM gravacoes_historico WHERE seq > ?"
+
+
+# --- 2. PERÍODO ---
+def limites_epoch(inicio, fim):
+    """Datas do filtro -> [início do primeiro dia, último segundo do último dia] em epoch."""
+    return calendar.timegm(inicio.timetuple()), calendar.timegm(fim.timetuple()) + 86399
+
+def intervalo_disponivel(caminho_db=None):
+    """
+    (primeira data, última data) do histórico, ou None com o banco vazio. Só consultas por índice;
+    o rollup diário guarda o começo do histórico mesmo depois da retenção apagar o dado bruto.
+    Sem caminho_db, consulta todos os shards do roteador.
+    """
+    roteador = RoteadorShards(caminho_unico=caminho_db, ativo=False) if caminho_db else obter_roteador()
+    _, linhas = roteador.consultar("""SELECT MIN(timestamp), MAX(timestamp),
+                                             (SELECT MIN(dia) FROM rollup_diario_sensor),
+                                             (SELECT MAX(dia) FROM rollup_diario_sensor)
+                                      FROM historico_clima""")
+    extremos = [t for linha in linhas for t in linha if t is not None]
+    if not extremos:
+        return None
+    minimo, maximo = min(extremos), max(extremos)
+    return date(1970, 1, 1) + timedelta(seconds=minimo), date(1970, 1, 1) + timedelta(seconds=maximo)
+
+
+def _contar_ate(conn, sql, params, limite):
+    """COUNT(*) que para de contar em limite + 1 (não varre anos de dados só para saber que é muito)."""
+    return conn.execute(f"SELECT COUNT(*) FROM ({sql} LIMIT {limite + 1})", params).fetchone()[0]
+
+def escolher_granularidade(conn, ini, fim, divisor=1):
+    """
+    A camada mais fina que cubra o período inteiro e caiba no gráfico. A retenção apaga o dado
+    bruto e os baldes de 15 min/horários antigos; o corte de cada camada fica em retencao_cortes.
+    `divisor` reparte o limite de pontos entre os shards que vão para o mesmo gráfico.
+    """
+    cortes = ler_cortes(conn)
+    cobre = lambda camada: ini >= cortes.get(camada, ini)
+    max_brutos, max_horarios = MAX_PONTOS_BRUTOS // divisor, MAX_PONTOS_HORARIOS // divisor
+
+    if cobre('bruto') and _contar_ate(conn, "SELECT 1 FROM historico_clima WHERE timestamp BETWEEN ? AND ?",
+                                      (ini, fim), max_brutos) <= max_brutos:
+        return BRUTO
+
+    # Baldes horários estimam os de 15 min (no máximo 4 por hora)
+    horarios = _contar_ate(conn, "SELECT 1 FROM rollup_horario_sensor WHERE hora BETWEEN ? AND ?",
+                           (ini, fim), max_horarios)
+    if cobre('15min') and horarios * 4 <= max_horarios:
+        return QUINZE_MIN
+    if cobre('horario') and horarios <= max_horarios:
+        return HORARIO
+    return DIARIO
+
+
+def _sql_baldes(granularidade):
+    """
+    Subconsulta (balde, id_sensor, contagens/somas/extremos) de uma camada entre ? e ?.
+    A de 15 min junta a tabela compactada com o dado bruto ainda não compactado, agregado na hora.
+    """
+    tabela, coluna, segundos = TABELA_ROLLUP[granularidade]
+    if granularidade != QUINZE_MIN:
+        return f"SELECT {coluna} AS balde, id_sensor, {COLUNAS_BALDE} FROM {tabela} WHERE {coluna} BETWEEN ? AND ?", 1
+    return f"""SELECT balde, id_sensor, SUM(leituras) AS leituras,
+                      SUM(qtd_umidade) AS qtd_umidade, SUM(soma_umidade) AS soma_umidade,
+                      MIN(min_umidade) AS min_umidade, MAX(max_umidade) AS max_umidade,
+                      SUM(qtd_temp) AS qtd_temp, SUM(soma_temp) AS soma_temp,
+                      MIN(min_temp) AS min_temp, MAX(max_temp) AS max_temp, SUM(soma_chuva) AS soma_chuva
+               FROM (SELECT {coluna} AS balde, id_sensor, {COLUNAS_BALDE} FROM {tabela} WHERE {coluna} BETWEEN ? AND ?
+                     UNION ALL
+                     SELECT timestamp - timestamp % {segundos}, COALESCE(id_sensor, ''), COUNT(*),
+                            COUNT(umidade_solo), TOTAL(umidade_solo), MIN(umidade_solo), MAX(umidade_solo),
+                            COUNT(temp_ambiente), TOTAL(temp_ambiente), MIN(temp_ambiente), MAX(temp_ambiente),
+                            TOTAL(chuva_mm)
+                     FROM historico_clima WHERE timestamp BETWEEN ? AND ?
+                     GROUP BY 1, 2)
+               GROUP BY balde, id_sensor""", 2
+
+
+# --- 3. CONSULTAS ---
+def carregar_leituras(conn, ini, fim, granularidade, desde_seq=None):
+    """
+    Leituras do período. Nos rollups cada linha é um balde (15 min, hora ou dia) por sensor:
+    umidade_solo/temp_ambiente trazem a média e *_min/*_max os extremos do balde.
+    desde_seq limita o dado bruto às leituras gravadas depois dessa seq de gravacoes_historico
+    (atualização incremental).
+    """
+    if granularidade == BRUTO:
+        filtro, params = "", (ini, fim)
+        if desde_seq is not None:
+            filtro, params = f"AND id_leitura IN ({SQL_GRAVADAS_DEPOIS})", (ini, fim, desde_seq)
+        df = pd.read_sql_query(f"""SELECT id_leitura, timestamp, id_sensor, id_cultura, umidade_solo, temp_ambiente,
+                                          vento_kmh, radiacao_solar, chuva_mm
+                                   FROM historico_clima
+                                   WHERE timestamp BETWEEN ? AND ? {filtro}
+                                   ORDER BY timestamp""", conn, params=params)
+    else:
+        segundos = TABELA_ROLLUP[granularidade][2]
+        baldes, repeticoes = _sql_baldes(granularidade)
+        df = pd.read_sql_query(f"""SELECT balde AS timestamp, id_sensor, leituras,
+                                          soma_umidade / NULLIF(qtd_umidade, 0) AS umidade_solo, min_umidade, max_umidade,
+                                          soma_temp / NULLIF(qtd_temp, 0) AS temp_ambiente, min_temp, max_temp,
+                                          soma_chuva AS chuva_mm
+                                   FROM ({baldes})
+                                   ORDER BY balde""", conn, params=(ini - ini % segundos, fim) * repeticoes)
+    df['timestamp'] = serie_de_epoch(df['timestamp'])
+    return df
+
+def carregar_logs(conn, ini, fim, limite=MAX_LOGS, desde_id=0):
+    """Últimas `limite` decisões do período, em ordem cronológica, com a temperatura da leitura correspondente."""
+    df = pd.read_sql_query("""SELECT * FROM (
+                                  SELECT l.*,
+                                         (SELECT h.temp_ambiente FROM historico_clima h
+                                          WHERE h.id_sensor = l.id_sensor AND h.timestamp = l.timestamp
+                                          LIMIT 1) AS temp_ambiente
+                                  FROM logs_decisao l
+                                  WHERE l.timestamp BETWEEN ? AND ? AND l.id > ?
+                                  ORDER BY l.timestamp DESC, l.id DESC
+                                  LIMIT ?)
+                              ORDER BY timestamp, id""", conn, params=(ini, fim, desde_id, limite))
+    df['timestamp'] = serie_de_epoch(df['timestamp'])
+    return df
+
+def contar_acoes(conn, ini, fim):
+    """Total de decisões por ação no período, lido do rollup diário (coluna 'count', como value_counts)."""
+    return pd.read_sql_query("""SELECT acao, SUM(total) AS count
+                                FROM rollup_acoes_diario
+                                WHERE dia BETWEEN ? AND ?
+                                GROUP BY acao
+                                ORDER BY count DESC""", conn, params=(ini - ini % 86400, fim))
+
+class _TrechoArquivo(io.RawIOBase):
+    """Expõe só os próximos `tamanho` bytes de um arquivo aberto (o pandas lê em blocos até o limite)."""
+
+    def __init__(self, arquivo, tamanho):
+        self.arquivo = arquivo
+        self.restante = tamanho
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        dados = self.arquivo.read(min(len(buffer), self.restante))
+        buffer[:len(dados)] = dados
+        self.restante -= len(dados)
+        return len(dados)
+
+def _fim_ultima_linha(f, ate):
+    """Posição logo após o último '\n' antes de `ate` (0 se não houver nenhum)."""
+    posicao = ate
+    while posicao > 0:
+        bloco = min(64 * 1024, posicao)
+        f.seek(posicao - bloco)
+        achado = f.read(bloco).rfind(b'\n')
+        if achado != -1:
+            return posicao - bloco + achado + 1
+        posicao -= bloco
+    return 0
+
+def carregar_bruto_csv(ini, fim, caminho=PATH_CSV_SUJO, tamanho_chunk=TAMANHO_CHUNK_CSV, offset=0):
+    """
+    Temperaturas do CSV bruto no período: lido em blocos, só com as colunas do gráfico de auditoria.
+    Com offset, lê só o que foi escrito depois dele. Retorna (df, offset do fim da última linha completa).
+    """
+    with open(caminho, 'rb') as f:
+        cabecalho = f.readline().decode('utf-8').strip().split(',')
+        offset = max(offset, f.tell())
+        fim_arquivo = f.seek(0, io.SEEK_END)
+        novo_offset = max(offset, _fim_ultima_linha(f, fim_arquivo))
+
+        partes = []
+        if novo_offset > offset:
+            # Só as linhas completas: uma linha ainda sendo gravada fica para a próxima leitura
+            f.seek(offset)
+            trecho = io.BufferedReader(_TrechoArquivo(f, novo_offset - offset))
+            for chunk in pd.read_csv(trecho, header=None, names=cabecalho,
+                                     usecols=['timestamp', 'temp_ambiente'], chunksize=tamanho_chunk):
+                chunk['timestamp'] = pd.to_datetime(chunk['timestamp'], errors='coerce', format='mixed')
+                segundos = chunk['timestamp'].to_numpy(dtype='datetime64[s]').astype('int64')
+                no_periodo = chunk['timestamp'].notna().to_numpy() & (segundos >= ini) & (segundos <= fim)
+                partes.append(chunk[no_periodo])
+
+    df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=['timestamp', 'temp_ambiente'])
+    return df, novo_offset
+
+
+def _csv_bruto(ini, fim, caminho_csv):
+    """carregar_bruto_csv do período inteiro (frame vazio e offset 0 sem CSV)."""
+    if caminho_csv is None:
+        return pd.DataFrame(columns=['timestamp', 'temp_ambiente']), 0
+    with medir('dashboard.csv_bruto'):
+        return carregar_bruto_csv(ini, fim, caminho_csv)
+
+def _anexar_csv(ini, fim, caminho_csv, df_sujo, offset):
+    """Anexa a df_sujo o que foi escrito no CSV depois de offset. Retorna (df_sujo, novo offset)."""
+    if caminho_csv is None:
+        return df_sujo, offset
+    novas, offset = carregar_bruto_csv(ini, fim, caminho_csv, offset=offset)
+    if not novas.empty:
+        df_sujo = pd.concat([df_sujo, novas], ignore_index=True)
+    return df_sujo, offset
+
+
+# --- 4. CACHE INCREMENTAL ---
+def _maior_id_log(conn):
+    """Maior id de logs_decisao: AUTOINCREMENT atribuído no INSERT, então segue a ordem dos commits."""
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM logs_decisao").fetchone()[0]
+
+def _revisao(conn):
+    """Contador de leituras alteradas/apagadas sem id novo (triggers de UPDATE/DELETE do histórico)."""
+    return conn.execute("SELECT COALESCE(MAX(revisao), 0) FROM revisoes_historico").fetchone()[0]
+
+
+class CachePeriodo:
+    """
+    Frames de um período do dashboard mais a marca d'água do que já foi lido: última gravação
+    de historico_clima (seq de gravacoes_historico), maior id de logs_decisao e o offset do CSV
+    bruto. atualizar() busca só o que entrou depois da marca e anexa aos frames, então o dashboard
+    pode consultar a cada poucos segundos. A marca das leituras não é o id_leitura: ele é reservado
+    antes da gravação e uma leitura pode chegar depois de outra de id maior.
+
+    Uma rodada de retenção ou uma leitura alterada sem id novo (upsert do ETL, que os triggers
+    já refletiram nos rollups) força a recarga.
+
+    Como parte de um CachePeriodoFrota: caminho_csv=None deixa o CSV bruto de fora, `divisor`
+    reparte o limite de pontos entre os shards e `granularidade` fixa a camada.
+    """
+
+    def __init__(self, inicio, fim, caminho_db=PATH_DB, caminho_csv=PATH_CSV_SUJO, divisor=1, granularidade=None):
+        self.inicio, self.fim = inicio, fim
+        self.ini, self.fim_epoch = limites_epoch(inicio, fim)
+        self.caminho_db = caminho_db
+        self.caminho_csv = caminho_csv
+        self.divisor = divisor
+        self.granularidade_fixa = granularidade
+        self.recargas = 0
+        self._lock = threading.Lock()
+        self.recarregar()
+
+    @property
+    def marca(self):
+        return self.seq_leituras, self.max_id_log, self.offset_csv
+
+    @property
+    def estado(self):
+        """Tudo que muda os frames: marca d'água, revisão, cortes da retenção, camada e recargas."""
+        return self.marca, self.revisao, tuple(sorted(self.cortes.items())), self.granularidade, self.recargas
+
+    def _abrir_leitura(self):
+        # Todas as consultas de uma atualização no mesmo snapshot do WAL: marca e dados coerentes
+        conn = conectar(self.caminho_db)
+        conn.execute("BEGIN")
+        return conn
+
+    def recarregar(self, granularidade=None):
+        """Lê o período inteiro de novo (primeira carga ou quando a marca não serve mais)."""
+        with self._lock, medir('dashboard.recarregar'):
+            self.granularidade_fixa = granularidade
+            self._recarregar()
+
+    def _recarregar(self):
+        self.recargas += 1
+        conn = self._abrir_leitura()
+        try:
+            self.seq_leituras = ler_gravacoes(conn)[1]
+            self.max_id_log = _maior_id_log(conn)
+            self.cortes = ler_cortes(conn)
+            self.revisao = _revisao(conn)
+            self.granularidade = (self.granularidade_fixa
+                                  or escolher_granularidade(conn, self.ini, self.fim_epoch, self.divisor))
+            with medir('dashboard.leituras'):
+                self.df_leituras = carregar_leituras(conn, self.ini, self.fim_epoch, self.granularidade)
+            with medir('dashboard.logs'):
+                self.df_logs = carregar_logs(conn, self.ini, self.fim_epoch)
+                self.df_acoes = contar_acoes(conn, self.ini, self.fim_epoch)
+        finally:
+            conn.rollback()
+            conn.close()
+        self.df_sujo, self.offset_csv = _csv_bruto(self.ini, self.fim_epoch, self.caminho_csv)
+
+    def atualizar(self):
+        """Anexa aos frames o que chegou depois da marca d'água. Retorna True se algo mudou."""
+        with self._lock, medir('dashboard.atualizar'):
+            marca_anterior = self.marca
+            if self.caminho_csv is not None and Path(self.caminho_csv).stat().st_size < self.offset_csv:
+                self._recarregar()  # CSV reescrito
+                return True
+
+            conn = self._abrir_leitura()
+            try:
+                primeira_seq, seq_leituras = ler_gravacoes(conn)
+                max_id_log = _maior_id_log(conn)
+                if seq_leituras < self.seq_leituras or max_id_log < self.max_id_log:
+                    precisa_recarregar = True  # tabelas recriadas
+                elif primeira_seq > self.seq_leituras + 1:
+                    precisa_recarregar = True  # a retenção podou gravações que ainda não foram lidas
+                elif ler_cortes(conn) != self.cortes:
+                    precisa_recarregar = True  # a retenção podou alguma camada
+                elif _revisao(conn) != self.revisao:
+                    precisa_recarregar = True  # leituras já carregadas mudaram
+                else:
+                    precisa_recarregar = self._anexar_leituras(conn, seq_leituras)
+                    self._anexar_logs(conn, max_id_log)
+            finally:
+                conn.rollback()
+                conn.close()
+
+            if precisa_recarregar:
+                self._recarregar()
+                return True
+
+            self.df_sujo, self.offset_csv = _anexar_csv(self.ini, self.fim_epoch, self.caminho_csv,
+                                                        self.df_sujo, self.offset_csv)
+            return self.marca != marca_anterior
+
+    def _anexar_leituras(self, conn, seq_leituras):
+        """Retorna True se o período cresceu além do dado bruto e precisa trocar para o rollup."""
+        if seq_leituras == self.seq_leituras:
+            return False
+
+        if self.granularidade == BRUTO:
+            novas = carregar_leituras(conn, self.ini, self.fim_epoch, BRUTO, desde_seq=self.seq_leituras)
+            if self.granularidade_fixa is None and len(self.df_leituras) + len(novas) > MAX_PONTOS_BRUTOS // self.divisor:
+                return True
+            if not novas.empty:
+                self.df_leituras = (pd.concat([self.df_leituras, novas], ignore_index=True)
+                                    .sort_values('timestamp', kind='stable', ignore_index=True))
+        else:
+            # Nos rollups, só os baldes a partir da leitura nova mais antiga mudaram: relê esses baldes
+            primeira = conn.execute(f"""SELECT MIN(timestamp) FROM historico_clima
+                                        WHERE id_leitura IN ({SQL_GRAVADAS_DEPOIS})""",
+                                    (self.seq_leituras,)).fetchone()[0]
+            if primeira is not None and primeira <= self.fim_epoch:
+                segundos = TABELA_ROLLUP[self.granularidade][2]
+                balde = max(primeira - primeira % segundos, self.ini - self.ini % segundos)
+                novas = carregar_leituras(conn, balde, self.fim_epoch, self.granularidade)
+                mantidas = self.df_leituras[self.df_leituras['timestamp'] < serie_de_epoch(pd.Series([balde]))[0]]
+                self.df_leituras = pd.concat([mantidas, novas], ignore_index=True)
+
+        self.seq_leituras = seq_leituras
+        return False
+
+    def _anexar_logs(self, conn, max_id_log):
+        if max_id_log == self.max_id_log:
+            return
+        novos = carregar_logs(conn, self.ini, self.fim_epoch, desde_id=self.max_id_log)
+        if not novos.empty:
+            self.df_logs = (pd.concat([self.df_logs, novos], ignore_index=True)
+                            .sort_values(['timestamp', 'id'], kind='stable', ignore_index=True)
+                            .tail(MAX_LOGS).reset_index(drop=True))
+            self.df_acoes = contar_acoes(conn, self.ini, self.fim_epoch)
+        self.max_id_log = max_id_log
+
+
+class CachePeriodoFrota:
+    """
+    CachePeriodo sobre os shards do roteador (uma fazenda e um mês por shard): uma parte por
+    shard do período, cada uma com a sua marca d'água, atualizadas em paralelo e juntadas
+    nos mesmos frames e atributos do CachePeriodo. Um balde de rollup é de um sensor só, então
+    juntar é concatenar; só a contagem de ações é somada. O limite de pontos do gráfico é
+    repartido entre os shards e todas as partes usam a camada mais grossa entre elas.
+    """
+
+    def __init__(self, inicio, fim, roteador=None, caminho_csv=PATH_CSV_SUJO):
+        self.inicio, self.fim = inicio, fim
+        self.ini, self.fim_epoch = limites_epoch(inicio, fim)
+        self.roteador = roteador or obter_roteador()
+        self.caminho_csv = caminho_csv
+        self.recargas = 0
+        self._lock = threading.Lock()
+        self.recarregar()
+
+    @property
+    def marca(self):
+        return tuple(parte.marca for parte in self.partes.values()), self.offset_csv
+
+    @property
+    def estado(self):
+        return tuple(parte.estado for parte in self.partes.values()), self.offset_csv, self.recargas
+
+    def _shards(self):
+        return self.roteador.shards(inicio=self.ini, fim=self.fim_epoch)
+
+    def recarregar(self):
+        with self._lock, medir('dashboard.frota_recarregar'):
+            self._recarregar()
+
+    def _recarregar(self):
+        self.recargas += 1
+        shards = self._shards()
+        divisor = max(len(shards), 1)
+        partes = self.roteador.mapear(
+            lambda caminho: CachePeriodo(self.inicio, self.fim, caminho, caminho_csv=None, divisor=divisor), shards)
+        self.partes = dict(zip(shards, partes))
+        self._igualar_granularidade()
+        self._juntar()
+        self.df_sujo, self.offset_csv = _csv_bruto(self.ini, self.fim_epoch, self.caminho_csv)
+
+    def atualizar(self):
+        """Atualiza cada shard a partir da sua marca. Retorna True se algo mudou."""
+        with self._lock, medir('dashboard.frota_atualizar'):
+            marca_anterior = self.marca
+            if self._shards() != list(self.partes) or (
+                    self.caminho_csv is not None and Path(self.caminho_csv).stat().st_size < self.offset_csv):
+                self._recarregar()  # shard novo (mês que começou, fazenda nova) ou CSV reescrito
+                return True
+
+            mudou = self.roteador.mapear(lambda parte: parte.atualizar(), self.partes.values())
+            if any(mudou):
+                self._igualar_granularidade()
+                self._juntar()
+            self.df_sujo, self.offset_csv = _anexar_csv(self.ini, self.fim_epoch, self.caminho_csv,
+                                                        self.df_sujo, self.offset_csv)
+            return self.marca != marca_anterior
+
+    def _igualar_granularidade(self):
+        partes = list(self.partes.values())
+        self.granularidade = max((parte.granularidade for parte in partes), key=ORDEM_GRANULARIDADE.index,
+                                 default=BRUTO)
+        desiguais = [parte for parte in partes if parte.granularidade != self.granularidade]
+        if desiguais:
+            self.roteador.mapear(lambda parte: parte.recarregar(self.granularidade), desiguais)
+
+    def _juntar(self):
+        partes = list(self.partes.values())
+        if not partes:
+            self.df_leituras = self.df_logs = self.df_acoes = pd.DataFrame()
+            return
+        self.df_leituras = (pd.concat([parte.df_leituras for parte in partes], ignore_index=True)
+                            .sort_values('timestamp', kind='stable', ignore_index=True))
+        self.df_logs = (pd.concat([parte.df_logs for parte in partes], ignore_index=True)
+                        .sort_values(['timestamp', 'id'], kind='stable', ignore_index=True)
+                        .tail(MAX_LOGS).reset_index(drop=True))
+        self.df_acoes = (pd.concat([parte.df_acoes for parte in partes], ignore_index=True)
+                         .groupby('acao', as_index=False)['count'].sum()
+                         .sort_values('count', ascending=False, ignore_index=True))
@@ -0,0 +1,56 @@
+import numpy as np
+import plotly.graph_objects as go
+
+# --- 1. CONFIGURAÇÃO ---
+# Largura útil do gráfico em tela larga: mais pontos que pixels não aparecem, só pesam no navegador
+LARGURA_GRAFICO_PX = 1400
+PONTOS_POR_PIXEL = 1
+# Acima disto a série vai como WebGL (Scattergl) em vez de SVG
+LIMIAR_WEBGL = 1000
+
+
+# --- 2. DOWNSAMPLING ---
+def lttb(x, y, n_saida):
+    """
+    Largest-Triangle-Three-Buckets: escolhe n_saida pontos que preservam a forma da série
+    (picos e vales ficam, trechos planos são resumidos). Devolve os índices escolhidos,
+    sempre incluindo o primeiro e o último. x deve estar ordenado.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_saida >= n or n_saida < 3:
+        return np.arange(n)
+
+    # n_saida - 2 baldes entre o primeiro e o último ponto
+    limites = np.linspace(1, n - 1, n_saida - 1).astype(np.intp)
+    indices = np.empty(n_saida, dtype=np.intp)
+    indices[0], indices[-1] = 0, n - 1
+
+    anterior = 0
+    for i in range(n_saida - 2):
+        inicio, fim = limites[i], limites[i + 1]
+        fim_proximo = limites[i + 2] if i + 2 < len(limites) else n
+        media_x = x[fim:fim_proximo].mean()
+        media_y = y[fim:fim_proximo].mean()
+
+        # Área do triângulo (ponto escolhido antes, candidato, média do próximo balde)
+        area = np.abs((x[anterior] - media_x) * (y[inicio:fim] - y[anterior])
+                      - (x[anterior] - x[inicio:fim]) * (media_y - y[anterior]))
+        anterior = inicio + int(np.argmax(area))
+        indices[i + 1] = anterior
+
+    return indices
+
+
+def reduzir_serie(df, coluna_y, largura_px=LARGURA_GRAFICO_PX, pontos_por_pixel=PONTOS_POR_PIXEL):
+    """Ordena por timestamp, descarta valores vazios e reduz a série com LTTB ao tamanho do gráfico."""
+    serie = df[['timestamp', coluna_y]].dropna().sort_values('timestamp', kind='stable')
+    segundos = serie['timestamp'].to_numpy(dtype='datetime64[s]').astype(np.int64)
+    indices = lttb(segundos, serie[coluna_y].to_numpy(dtype=float), largura_px * pontos_por_pixel)
+    return serie.iloc[indices].reset_index(drop=True)
+
+
+def tipo_trace(quantidade_pontos, limiar=LIMIAR_WEBGL):
+    """go.Scattergl para séries grandes (WebGL), go.Scatter (SVG) para as pequenas."""
+    return go.Scattergl if quantidade_pontos > limiar else go.Scatter
@@ -0,0 +1,217 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+from esquema_db import COLUNAS_HISTORICO, PATH_DB, conectar, registrar_corte, serie_de_epoch
+from roteador_shards import obter_roteador
+
+# --- 1. CONFIGURAÇÃO ---
+BASE_DIR = Path(__file__).resolve().parent.parent
+PATH_ARQUIVO = BASE_DIR / 'data' / 'arquivo'
+
+# Leituras com mais de DIAS_NO_BANCO dias saem do SQLite para o arquivo colunar
+DIAS_NO_BANCO = 90
+
+# Layout: arquivo/data=AAAA-MM-DD/sensor=S-01/<coluna>.npy + _estatisticas.json
+# Cada coluna é um .npy independente (np.load com mmap_mode='r' lê só as páginas tocadas).
+# id_sensor é a chave da partição; id_cultura nulo vira -1.
+TIPOS_COLUNAS = {
+    'id_leitura': np.int64,
+    'timestamp': np.int64,        # epoch, como no banco
+    'id_cultura': np.int64,
+    'umidade_solo': np.float64,
+    'temp_ambiente': np.float64,
+    'vento_kmh': np.float64,
+    'radiacao_solar': np.float64,
+    'chuva_mm': np.float64,
+}
+ARQUIVO_ESTATISTICAS = '_estatisticas.json'
+SENSOR_NULO = '_sem_sensor'
+
+
+# --- 2. ESCRITA ---
+def caminho_particao(dia, id_sensor, raiz=PATH_ARQUIVO):
+    return Path(raiz) / f"data={dia.isoformat()}" / f"sensor={id_sensor if id_sensor is not None else SENSOR_NULO}"
+
+def _estatisticas(colunas):
+    """Mínimo e máximo de cada coluna (None se a coluna só tiver nulos)."""
+    resumo = {}
+    for nome, valores in colunas.items():
+        validos = valores[~np.isnan(valores)] if valores.dtype.kind == 'f' else valores
+        resumo[nome] = ({"min": validos.min().item(), "max": validos.max().item()} if validos.size
+                        else {"min": None, "max": None})
+    return {"linhas": len(colunas['timestamp']), "colunas": resumo}
+
+def escrever_particao(pasta, df):
+    """
+    Grava (ou mescla com o que já existe) uma partição dia/sensor, ordenada por timestamp.
+    Cada arquivo é trocado atomicamente; as estatísticas vão por último e valem como marca de partição completa.
+    """
+    pasta = Path(pasta)
+    existente = ler_particao(pasta) if (pasta / ARQUIVO_ESTATISTICAS).exists() else None
+    if existente is not None:
+        df = (pd.concat([existente, df], ignore_index=True)
+              .drop_duplicates(subset='id_leitura', keep='last'))
+    df = df.sort_values(['timestamp', 'id_leitura'], kind='stable')
+
+    colunas = {nome: df[nome].fillna(-1 if np.dtype(tipo).kind == 'i' else np.nan).to_numpy(dtype=tipo)
+               for nome, tipo in TIPOS_COLUNAS.items()}
+
+    pasta.mkdir(parents=True, exist_ok=True)
+    for nome, valores in colunas.items():
+        temporario = pasta / f"{nome}.npy.tmp"
+        with open(temporario, 'wb') as f:
+            np.save(f, valores)
+        os.replace(temporario, pasta / f"{nome}.npy")
+
+    temporario = pasta / f"{ARQUIVO_ESTATISTICAS}.tmp"
+    temporario.write_text(json.dumps(_estatisticas(colunas)), encoding='utf-8')
+    os.replace(temporario, pasta / ARQUIVO_ESTATISTICAS)
+    return len(df)
+
+def arquivar_historico(dias_no_banco=DIAS_NO_BANCO, caminho_db=PATH_DB, raiz=PATH_ARQUIVO, hoje=None):
+    """
+    Move para o arquivo colunar as leituras de dias inteiros mais antigos que `dias_no_banco`.
+    Um dia por vez (memória limitada a um dia de leituras): lê, grava as partições e apaga
+    do banco na mesma transação, então uma falha no meio não perde nem duplica leituras.
+    Os rollups não são tocados: o dashboard continua com as tendências de longo prazo.
+    O corte 'bruto' registrado aqui faz qualquer modo do ETL ignorar as leituras arquivadas.
+    """
+    hoje = hoje or date.today()
+    corte = int((pd.Timestamp(hoje) - pd.Timedelta(days=dias_no_banco)).timestamp())
+    colunas = ", ".join(COLUNAS_HISTORICO)
+
+    conn = conectar(caminho_db)
+    total, dias = 0, 0
+    try:
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                primeiro = conn.execute("SELECT MIN(timestamp) FROM historico_clima WHERE timestamp < ?",
+                                        (corte,)).fetchone()[0]
+                if primeiro is None:
+                    conn.rollback()
+                    break
+
+                inicio_dia = primeiro - primeiro % 86400
+                fim_dia = min(inicio_dia + 86400, corte)
+                df = pd.read_sql_query(f"""SELECT {colunas} FROM historico_clima
+                                           WHERE timestamp >= ? AND timestamp < ?""",
+                                       conn, params=(inicio_dia, fim_dia))
+
+                dia = date(1970, 1, 1) + timedelta(seconds=inicio_dia)
+                for id_sensor, grupo in df.groupby('id_sensor', dropna=False, sort=True):
+                    escrever_particao(caminho_particao(dia, None if pd.isna(id_sensor) else id_sensor, raiz),
+                                      grupo.drop(columns='id_sensor'))
+
+                # Corte antes do DELETE: o trigger não tira dos rollups as leituras anteriores a ele
+                registrar_corte(conn, 'bruto', fim_dia)
+                conn.execute("DELETE FROM historico_clima WHERE timestamp >= ? AND timestamp < ?",
+                             (inicio_dia, fim_dia))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+            total += len(df)
+            dias += 1
+    finally:
+        conn.close()
+
+    print(f"🗄️ {total} leituras de {dias} dia(s) movidas para o arquivo colunar em {raiz}.")
+    return total
+
+
+# --- 3. LEITURA ---
+def listar_particoes(raiz=PATH_ARQUIVO, inicio=None, fim=None, sensores=None):
+    """Partições completas (com estatísticas) como (dia, id_sensor, pasta), podadas só pelos nomes das pastas."""
+    raiz = Path(raiz)
+    if not raiz.exists():
+        return []
+
+    sensores = set(sensores) if sensores is not None else None
+    particoes = []
+    for pasta_dia in sorted(raiz.glob('data=*')):
+        dia = date.fromisoformat(pasta_dia.name.split('=', 1)[1])
+        if (inicio is not None and dia < inicio) or (fim is not None and dia > fim):
+            continue
+        for pasta in sorted(pasta_dia.glob('sensor=*')):
+            id_sensor = pasta.name.split('=', 1)[1]
+            id_sensor = None if id_sensor == SENSOR_NULO else id_sensor
+            if sensores is not None and id_sensor not in sensores:
+                continue
+            if (pasta / ARQUIVO_ESTATISTICAS).exists():
+                particoes.append((dia, id_sensor, pasta))
+    return particoes
+
+def _pode_conter(estatisticas, filtros):
+    """False quando as estatísticas garantem que nenhuma linha da partição passa nos filtros {coluna: (min, max)}."""
+    for coluna, (minimo, maximo) in filtros.items():
+        faixa = estatisticas['colunas'].get(coluna)
+        if faixa is None or faixa['min'] is None:
+            return False
+        if (minimo is not None and faixa['max'] < minimo) or (maximo is not None and faixa['min'] > maximo):
+            return False
+    return True
+
+def ler_particao(pasta, colunas=None, mmap=False):
+    """Lê as colunas pedidas de uma partição (com mmap=True os arrays ficam mapeados do disco)."""
+    pasta = Path(pasta)
+    colunas = colunas or list(TIPOS_COLUNAS)
+    return pd.DataFrame({nome: np.load(pasta / f"{nome}.npy", mmap_mode='r' if mmap else None)
+                         for nome in colunas}, copy=False)
+
+def iterar_arquivo(inicio=None, fim=None, sensores=None, colunas=None, filtros=None, raiz=PATH_ARQUIVO):
+    """
+    Percorre o arquivo dia a dia, lendo só as partições e colunas necessárias:
+      - inicio/fim (datas) e sensores podam pelas pastas;
+      - filtros {coluna: (min, max)} podam pelas estatísticas e depois filtram as linhas.
+    Cada item é um DataFrame de um dia (todos os sensores), ordenado por timestamp,
+    com id_sensor e timestamp em datetime64.
+    """
+    filtros = filtros or {}
+    colunas = list(colunas or TIPOS_COLUNAS)
+    lidas = list(dict.fromkeys(colunas + ['timestamp'] + list(filtros)))
+
+    particoes = listar_particoes(raiz, inicio, fim, sensores)
+    for dia in sorted({dia for dia, _, _ in particoes}):
+        partes = []
+        for _, id_sensor, pasta in (p for p in particoes if p[0] == dia):
+            if filtros:
+                estatisticas = json.loads((pasta / ARQUIVO_ESTATISTICAS).read_text(encoding='utf-8'))
+                if not _pode_conter(estatisticas, filtros):
+                    continue
+
+            df = ler_particao(pasta, lidas, mmap=True)
+            if filtros:
+                mascara = np.ones(len(df), dtype=bool)
+                for coluna, (minimo, maximo) in filtros.items():
+                    valores = df[coluna].to_numpy()
+                    if minimo is not None:
+                        mascara &= valores >= minimo
+                    if maximo is not None:
+                        mascara &= valores <= maximo
+                df = df[mascara]
+            partes.append(df.assign(id_sensor=id_sensor))
+
+        if partes:
+            df_dia = pd.concat(partes, ignore_index=True).sort_values('timestamp', kind='stable', ignore_index=True)
+            df_dia['timestamp'] = serie_de_epoch(df_dia['timestamp'])
+            yield df_dia[['timestamp', 'id_sensor'] + [c for c in colunas if c != 'timestamp']]
+
+def ler_arquivo(inicio=None, fim=None, sensores=None, colunas=None, filtros=None, raiz=PATH_ARQUIVO):
+    """Mesmo que iterar_arquivo, num único DataFrame."""
+    partes = list(iterar_arquivo(inicio, fim, sensores, colunas, filtros, raiz))
+    if not partes:
+        return pd.DataFrame(columns=['timestamp', 'id_sensor'] + [c for c in (colunas or TIPOS_COLUNAS)
+                                                                  if c != 'timestamp'])
+    return pd.concat(partes, ignore_index=True)
+
+if __name__ == "__main__":
+    dias = int(sys.argv[1]) if len(sys.argv) > 1 else DIAS_NO_BANCO
+    # Um sensor é de uma fazenda e um dia é de um mês: shards diferentes não disputam partição
+    for caminho in obter_roteador().shards():
+        arquivar_historico(dias, caminho)
@@ -0,0 +1,447 @@
+import calendar
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# --- 1. CONFIGURAÇÃO ---
+BASE_DIR = Path(__file__).resolve().parent
+PATH_DB = BASE_DIR / 'green_horizon.db'
+
+# Versão gravada em PRAGMA user_version; bancos abaixo dela passam por migrar_banco()
+VERSAO_ESQUEMA = 3
+
+COLUNAS_HISTORICO = ['id_leitura', 'timestamp', 'id_sensor', 'id_cultura', 'umidade_solo',
+                     'temp_ambiente', 'vento_kmh', 'radiacao_solar', 'chuva_mm']
+
+# Timestamps são gravados como INTEGER: segundos desde 1970-01-01 no horário local da
+# fazenda (o mesmo relógio dos CSVs, sem conversão de fuso).
+ESQUEMA_SQL = """
+CREATE TABLE IF NOT EXISTS historico_clima (
+    id_leitura INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL,
+    id_sensor TEXT,
+    id_cultura INTEGER,
+    umidade_solo REAL,
+    temp_ambiente REAL,
+    vento_kmh REAL,
+    radiacao_solar REAL,
+    chuva_mm REAL
+);
+CREATE INDEX IF NOT EXISTS idx_historico_sensor_timestamp ON historico_clima (id_sensor, timestamp);
+CREATE INDEX IF NOT EXISTS idx_historico_timestamp ON historico_clima (timestamp);
+
+CREATE TABLE IF NOT EXISTS logs_decisao (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp INTEGER NOT NULL,
+    id_sensor TEXT,
+    umidade_solo REAL,
+    previsao_chuva REAL,
+    tarifa TEXT,
+    acao TEXT,
+    motivo TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_logs_timestamp ON logs_decisao (timestamp);
+
+CREATE TABLE IF NOT EXISTS etl_watermark (
+    arquivo TEXT PRIMARY KEY,
+    offset_bytes INTEGER,
+    ultimo_id INTEGER,
+    ultimo_timestamp TEXT,
+    atualizado_em TEXT
+);
+
+-- Rollups mantidos na escrita (triggers): o dashboard lê agregados em períodos longos.
+-- hora/dia = epoch truncado no início da hora/dia; médias = soma / qtd (qtd ignora NULLs).
+CREATE TABLE IF NOT EXISTS rollup_horario_sensor (
+    hora INTEGER NOT NULL,
+    id_sensor TEXT NOT NULL,
+    leituras INTEGER NOT NULL,
+    qtd_umidade INTEGER, soma_umidade REAL, min_umidade REAL, max_umidade REAL,
+    qtd_temp INTEGER, soma_temp REAL, min_temp REAL, max_temp REAL,
+    soma_chuva REAL,
+    PRIMARY KEY (hora, id_sensor)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_diario_sensor (
+    dia INTEGER NOT NULL,
+    id_sensor TEXT NOT NULL,
+    leituras INTEGER NOT NULL,
+    qtd_umidade INTEGER, soma_umidade REAL, min_umidade REAL, max_umidade REAL,
+    qtd_temp INTEGER, soma_temp REAL, min_temp REAL, max_temp REAL,
+    soma_chuva REAL,
+    PRIMARY KEY (dia, id_sensor)
+) WITHOUT ROWID;
+
+-- Até onde cada camada foi apagada pela retenção/arquivamento: dados anteriores ao corte
+-- só existem nas camadas mais grossas (ou no arquivo colunar)
+CREATE TABLE IF NOT EXISTS retencao_cortes (
+    camada TEXT PRIMARY KEY,
+    corte INTEGER NOT NULL,
+    atualizado_em TEXT
+);
+
+-- Camada de 15 minutos: preenchida pela retenção (retencao.py) ao compactar leituras brutas antigas
+CREATE TABLE IF NOT EXISTS rollup_15min_sensor (
+    quinze_min INTEGER NOT NULL,
+    id_sensor TEXT NOT NULL,
+    leituras INTEGER NOT NULL,
+    qtd_umidade INTEGER, soma_umidade REAL, min_umidade REAL, max_umidade REAL,
+    qtd_temp INTEGER, soma_temp REAL, min_temp REAL, max_temp REAL,
+    soma_chuva REAL,
+    PRIMARY KEY (quinze_min, id_sensor)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS rollup_acoes_diario (
+    dia INTEGER NOT NULL,
+    acao TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (dia, acao)
+) WITHOUT ROWID;
+
+-- Latência por etapa (metricas.py): uma linha por processo, etapa e janela de descarga.
+-- baldes = histograma {índice do balde: contagem} em JSON, somável entre janelas
+CREATE TABLE IF NOT EXISTS metricas_desempenho (
+    id INTEGER PRIMARY KEY,
+    timestamp INTEGER NOT NULL,
+    processo TEXT,
+    etapa TEXT NOT NULL,
+    qtd INTEGER NOT NULL,
+    soma_ms REAL NOT NULL,
+    max_ms REAL,
+    erros INTEGER NOT NULL DEFAULT 0,
+    retentativas INTEGER NOT NULL DEFAULT 0,
+    baldes TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_metricas_timestamp ON metricas_desempenho (timestamp);
+
+-- Leituras reprovadas pelas regras de qualidade (regras_qualidade.py) com a regra que falhou.
+-- Colunas da leitura sem tipo declarado: guardam o valor como chegou (texto de linha corrompida)
+CREATE TABLE IF NOT EXISTS quarentena_leituras (
+    id INTEGER PRIMARY KEY,
+    registrado_em INTEGER NOT NULL,
+    origem TEXT NOT NULL,
+    regra TEXT NOT NULL,
+    id_leitura, timestamp, id_sensor, id_cultura, umidade_solo,
+    temp_ambiente, vento_kmh, radiacao_solar, chuva_mm
+);
+CREATE INDEX IF NOT EXISTS idx_quarentena_origem_regra ON quarentena_leituras (origem, regra);
+
+-- Linhas que o EscritorLote não conseguiu gravar nem uma a uma (ex.: id repetido): saem do buffer
+-- para não segurar as outras. linha = valores do INSERT em JSON, na ordem das colunas
+CREATE TABLE IF NOT EXISTS falhas_gravacao (
+    id INTEGER PRIMARY KEY,
+    registrado_em INTEGER NOT NULL,
+    origem TEXT NOT NULL,
+    tabela TEXT NOT NULL,
+    erro TEXT,
+    linha TEXT NOT NULL
+);
+
+-- Próximo id_leitura livre, usado só no catálogo (RoteadorShards.reservar_ids): todo processo que
+-- grava leituras novas reserva os ids aqui, nenhum deixa o SQLite atribuir (MAX + 1)
+CREATE TABLE IF NOT EXISTS sequencias (
+    nome TEXT PRIMARY KEY,
+    proximo INTEGER NOT NULL
+);
+
+-- Cada alteração de leitura que os rollups já contaram (UPDATE do upsert do ETL, DELETE fora
+-- da retenção) soma 1 aqui: o cache do dashboard sabe que precisa reler o período
+CREATE TABLE IF NOT EXISTS revisoes_historico (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    revisao INTEGER NOT NULL
+);
+
+-- Ordem de gravação das leituras. O id_leitura é reservado antes do INSERT, então uma leitura pode
+-- ser gravada depois de outra de id maior; seq cresce na ordem dos commits (um escritor por vez) e é
+-- a marca d'água de quem lê só as leituras novas. A retenção poda as mais antigas (podar_gravacoes)
+CREATE TABLE IF NOT EXISTS gravacoes_historico (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id_leitura INTEGER NOT NULL
+);
+
+CREATE TRIGGER IF NOT EXISTS trg_historico_gravacoes AFTER INSERT ON historico_clima
+BEGIN
+    INSERT INTO gravacoes_historico (id_leitura) VALUES (NEW.id_leitura);
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_logs_rollup AFTER INSERT ON logs_decisao
+BEGIN
+    INSERT INTO rollup_acoes_diario (dia, acao, total)
+    VALUES (NEW.timestamp - NEW.timestamp % 86400, COALESCE(NEW.acao, ''), 1)
+    ON CONFLICT (dia, acao) DO UPDATE SET total = total + 1;
+END;
+"""
+
+# Triggers dos rollups horário/diário, montados por balde (tabela, coluna, segundos).
+# Somar (INSERT, e o valor novo no UPDATE): somas e contagens somam, MIN/MAX só se alargam.
+_SQL_SOMAR_AO_BALDE = """
+    INSERT INTO {tabela} ({coluna}, id_sensor, leituras,
+                          qtd_umidade, soma_umidade, min_umidade, max_umidade,
+                          qtd_temp, soma_temp, min_temp, max_temp, soma_chuva)
+    VALUES (NEW.timestamp - NEW.timestamp % {segundos}, COALESCE(NEW.id_sensor, ''), 1,
+            NEW.umidade_solo IS NOT NULL, COALESCE(NEW.umidade_solo, 0), NEW.umidade_solo, NEW.umidade_solo,
+            NEW.temp_ambiente IS NOT NULL, COALESCE(NEW.temp_ambiente, 0), NEW.temp_ambiente, NEW.temp_ambiente, COALESCE(NEW.chuva_mm, 0))
+    ON CONFLICT ({coluna}, id_sensor) DO UPDATE SET
+        leituras = leituras + 1,
+        qtd_umidade = qtd_umidade + excluded.qtd_umidade,
+        soma_umidade = soma_umidade + excluded.soma_umidade,
+        min_umidade = MIN(COALESCE(min_umidade, excluded.min_umidade), COALESCE(excluded.min_umidade, min_umidade)),
+        max_umidade = MAX(COALESCE(max_umidade, excluded.max_umidade), COALESCE(excluded.max_umidade, max_umidade)),
+        qtd_temp = qtd_temp + excluded.qtd_temp,
+        soma_temp = soma_temp + excluded.soma_temp,
+        min_temp = MIN(COALESCE(min_temp, excluded.min_temp), COALESCE(excluded.min_temp, min_temp)),
+        max_temp = MAX(COALESCE(max_temp, excluded.max_temp), COALESCE(excluded.max_temp, max_temp)),
+        soma_chuva = soma_chuva + excluded.soma_chuva;
+"""
+
+# Tirar (valor antigo no UPDATE, DELETE): somas e contagens saem exatas e o balde vazio some.
+# MIN/MAX não se desfazem: se o valor antigo era um extremo, são recalculados das leituras do
+# balde, desde que ele esteja inteiro em historico_clima (começa depois do corte 'bruto').
+_SQL_TIRAR_DO_BALDE = """
+    UPDATE {tabela} SET
+        leituras = leituras - 1,
+        qtd_umidade = qtd_umidade - (OLD.umidade_solo IS NOT NULL),
+        soma_umidade = soma_umidade - COALESCE(OLD.umidade_solo, 0),
+        qtd_temp = qtd_temp - (OLD.temp_ambiente IS NOT NULL),
+        soma_temp = soma_temp - COALESCE(OLD.temp_ambiente, 0),
+        soma_chuva = soma_chuva - COALESCE(OLD.chuva_mm, 0)
+    WHERE {coluna} = OLD.timestamp - OLD.timestamp % {segundos} AND id_sensor = COALESCE(OLD.id_sensor, '');
+
+    DELETE FROM {tabela}
+    WHERE {coluna} = OLD.timestamp - OLD.timestamp % {segundos} AND id_sensor = COALESCE(OLD.id_sensor, '')
+      AND leituras <= 0;
+"""
+
+_SQL_RECALCULAR_EXTREMOS = """
+    UPDATE {tabela} SET (min_umidade, max_umidade, min_temp, max_temp) = (
+        SELECT MIN(umidade_solo), MAX(umidade_solo), MIN(temp_ambiente), MAX(temp_ambiente)
+        FROM historico_clima
+        WHERE id_sensor IS OLD.id_sensor AND timestamp >= {tabela}.{coluna} AND timestamp < {tabela}.{coluna} + {segundos})
+    WHERE {coluna} = OLD.timestamp - OLD.timestamp % {segundos} AND id_sensor = COALESCE(OLD.id_sensor, '')
+      AND (min_umidade = OLD.umidade_solo OR max_umidade = OLD.umidade_solo
+           OR min_temp = OLD.temp_ambiente OR max_temp = OLD.temp_ambiente)
+      AND NOT EXISTS (SELECT 1 FROM retencao_cortes WHERE camada = 'bruto' AND corte > {tabela}.{coluna});
+"""
+
+_SQL_REVISAR = """
+    INSERT INTO revisoes_historico (id, revisao) VALUES (1, 1)
+    ON CONFLICT (id) DO UPDATE SET revisao = revisao + 1;
+"""
+
+_BALDES_ROLLUP = (('rollup_horario_sensor', 'hora', 3600), ('rollup_diario_sensor', 'dia', 86400))
+
+def _nos_baldes(*modelos):
+    return "".join(modelo.format(tabela=tabela, coluna=coluna, segundos=segundos)
+                   for tabela, coluna, segundos in _BALDES_ROLLUP for modelo in modelos)
+
+# A camada de 15 min não entra: ela só recebe leituras já compactadas (e apagadas) pela retenção.
+# O DELETE da retenção/arquivamento registra o corte 'bruto' antes de apagar, então as leituras
+# anteriores ao corte saem sem tirar nada dos rollups (elas continuam lá, é o objetivo).
+ESQUEMA_SQL += f"""
+-- Leitura anterior ao corte 'bruto' (chegou depois da retenção) já não é contada aqui
+CREATE TRIGGER IF NOT EXISTS trg_historico_rollups AFTER INSERT ON historico_clima
+WHEN NOT EXISTS (SELECT 1 FROM retencao_cortes WHERE camada = 'bruto' AND corte > NEW.timestamp)
+BEGIN{_nos_baldes(_SQL_SOMAR_AO_BALDE)}END;
+
+-- Upsert que não muda nada (o ETL regrava o que o escritor já gravou) não mexe nos rollups
+CREATE TRIGGER IF NOT EXISTS trg_historico_rollups_update AFTER UPDATE ON historico_clima
+WHEN OLD.timestamp IS NOT NEW.timestamp OR OLD.id_sensor IS NOT NEW.id_sensor
+  OR OLD.umidade_solo IS NOT NEW.umidade_solo OR OLD.temp_ambiente IS NOT NEW.temp_ambiente
+  OR OLD.chuva_mm IS NOT NEW.chuva_mm
+BEGIN{_nos_baldes(_SQL_TIRAR_DO_BALDE, _SQL_SOMAR_AO_BALDE, _SQL_RECALCULAR_EXTREMOS)}{_SQL_REVISAR}END;
+
+CREATE TRIGGER IF NOT EXISTS trg_historico_rollups_delete AFTER DELETE ON historico_clima
+WHEN NOT EXISTS (SELECT 1 FROM retencao_cortes WHERE camada = 'bruto' AND corte > OLD.timestamp)
+BEGIN{_nos_baldes(_SQL_TIRAR_DO_BALDE, _SQL_RECALCULAR_EXTREMOS)}{_SQL_REVISAR}END;
+"""
+
+_bancos_preparados = set()
+
+
+# --- 2. CONVERSÃO DE TIMESTAMPS ---
+def texto_para_epoch(texto):
+    """'2026-01-21 14:42:46[.ffffff]' -> segundos inteiros (horário local, sem fuso)."""
+    return calendar.timegm(datetime.fromisoformat(str(texto)).timetuple())
+
+def epoch_para_texto(epoch):
+    """Inverso de texto_para_epoch, no formato usado pelos CSVs."""
+    return (datetime(1970, 1, 1) + timedelta(seconds=int(epoch))).strftime("%Y-%m-%d %H:%M:%S")
+
+def serie_para_epoch(serie):
+    """Converte uma coluna datetime64 (sem NaT) em segundos inteiros."""
+    import numpy as np
+    return np.asarray(serie, dtype='datetime64[s]').astype(np.int64)
+
+def serie_de_epoch(serie):
+    """Converte uma coluna de segundos de volta para datetime64 do pandas."""
+    import pandas as pd
+    return pd.to_datetime(serie, unit='s')
+
+
+# --- 3. CONEXÃO ---
+def conectar(caminho=PATH_DB, timeout=30.0, mesma_thread=True):
+    """
+    Abre o banco em modo WAL (leituras do dashboard não bloqueiam as gravações das decisões).
+    Na primeira conexão do processo a um arquivo, cria/migra o esquema.
+    mesma_thread=False: conexão compartilhada entre threads (quem usa serializa com um lock).
+    """
+    conn = sqlite3.connect(caminho, timeout=timeout, check_same_thread=mesma_thread)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+    chave = str(Path(caminho).resolve())
+    if chave not in _bancos_preparados:
+        migrar_banco(conn)
+        criar_esquema(conn)
+        _bancos_preparados.add(chave)
+    return conn
+
+def _comandos(script):
+    """Separa um script SQL em comandos completos (respeita os ';' dentro de triggers)."""
+    comando = ""
+    for linha in script.splitlines(keepends=True):
+        comando += linha
+        if sqlite3.complete_statement(comando):
+            yield comando.strip()
+            comando = ""
+
+def criar_esquema(conn):
+    """Cria tabelas, índices e triggers que ainda não existirem."""
+    with conn:
+        for comando in _comandos(ESQUEMA_SQL):
+            conn.execute(comando)
+
+
+def registrar_corte(conn, camada, corte):
+    """Registra que a camada não tem mais dados anteriores a `corte` (o corte nunca recua)."""
+    conn.execute("""INSERT INTO retencao_cortes (camada, corte, atualizado_em) VALUES (?, ?, ?)
+                    ON CONFLICT(camada) DO UPDATE SET corte = MAX(corte, excluded.corte),
+                                                      atualizado_em = excluded.atualizado_em""",
+                 (camada, int(corte), datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+def ler_cortes(conn):
+    """{camada: corte} das camadas já podadas ('bruto', '15min', 'horario')."""
+    return dict(conn.execute("SELECT camada, corte FROM retencao_cortes"))
+
+def ler_gravacoes(conn):
+    """
+    (primeira, última) seq de gravacoes_historico, (0, 0) sem nenhuma. Quem guardou uma marca
+    abaixo de primeira - 1 perdeu gravações para a poda da retenção e precisa reler tudo.
+    """
+    return conn.execute("""SELECT COALESCE((SELECT MIN(seq) FROM gravacoes_historico), 0),
+                                  COALESCE((SELECT MAX(seq) FROM gravacoes_historico), 0)""").fetchone()
+
+
+# --- 4. MIGRAÇÃO ---
+def _colunas(conn, tabela):
+    return [linha[1] for linha in conn.execute(f"PRAGMA table_info({tabela})")]
+
+def migrar_banco(conn):
+    """
+    Leva bancos antigos ao esquema atual numa única transação, versão por versão:
+      v1: tabela criada pelo to_sql (sem chave, timestamp em texto) -> chave primária, índices e epoch
+      v2: rollups horário/diário alimentados por triggers, recalculados a partir do histórico
+      v3: trigger de INSERT dos rollups ignora leituras anteriores ao corte 'bruto'
+    Bancos já na versão atual não são tocados.
+    """
+    versao = conn.execute("PRAGMA user_version").fetchone()[0]
+    if versao >= VERSAO_ESQUEMA:
+        return
+
+    tabelas = {linha[0] for linha in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if versao < 1:
+            _migrar_v1(conn, tabelas)
+        if versao < 3:
+            conn.execute("DROP TRIGGER IF EXISTS trg_historico_rollups")  # recriado com o WHEN abaixo
+        for comando in _comandos(ESQUEMA_SQL):
+            conn.execute(comando)
+        if versao < 2:
+            reconstruir_rollups(conn)
+
+        conn.execute(f"PRAGMA user_version = {VERSAO_ESQUEMA}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    if tabelas & {'historico_clima', 'logs_decisao'}:
+        print(f"🛠️ Banco migrado da v{versao} para o esquema v{VERSAO_ESQUEMA}.")
+
+def _migrar_v1(conn, tabelas):
+    """Chave primária, índices e timestamps em epoch (dentro da transação de migrar_banco)."""
+    if 'historico_clima' in tabelas:
+        conn.execute("ALTER TABLE historico_clima RENAME TO _historico_antigo")
+    if 'logs_decisao' in tabelas:
+        conn.execute("ALTER TABLE logs_decisao RENAME TO _logs_antigo")
+    conn.execute("DROP INDEX IF EXISTS idx_historico_id_leitura")
+
+    for comando in _comandos(ESQUEMA_SQL):
+        conn.execute(comando)
+
+    if 'historico_clima' in tabelas:
+        colunas = ", ".join(COLUNAS_HISTORICO[2:])
+        epoch = "CAST(strftime('%s', timestamp) AS INTEGER)"
+        # IDs repetidos: fica a última versão (maior rowid). Sem ID: recebe um novo no fim.
+        conn.execute(f"""INSERT OR REPLACE INTO historico_clima (id_leitura, timestamp, {colunas})
+                         SELECT CAST(id_leitura AS INTEGER), {epoch}, {colunas}
+                         FROM _historico_antigo
+                         WHERE id_leitura IS NOT NULL AND {epoch} IS NOT NULL
+                         ORDER BY rowid""")
+        conn.execute(f"""INSERT INTO historico_clima (timestamp, {colunas})
+                         SELECT {epoch}, {colunas}
+                         FROM _historico_antigo
+                         WHERE id_leitura IS NULL AND {epoch} IS NOT NULL
+                         ORDER BY rowid""")
+
+    if 'logs_decisao' in tabelas:
+        if 'id_sensor' in _colunas(conn, '_logs_antigo'):
+            sensor = "id_sensor"
+        elif 'historico_clima' in tabelas:
+            # Logs anteriores ao modo lote: sensor da leitura gravada no mesmo instante
+            sensor = """(SELECT h.id_sensor FROM _historico_antigo h
+                         WHERE h.timestamp = _logs_antigo.timestamp LIMIT 1)"""
+        else:
+            sensor = "NULL"
+        previsao = "previsao_chuva" if 'previsao_chuva' in _colunas(conn, '_logs_antigo') else "NULL"
+        conn.execute(f"""INSERT INTO logs_decisao (id, timestamp, id_sensor, umidade_solo, previsao_chuva,
+                                                  tarifa, acao, motivo)
+                         SELECT id, CAST(strftime('%s', timestamp) AS INTEGER), {sensor}, umidade_solo,
+                                {previsao}, tarifa, acao, motivo
+                         FROM _logs_antigo
+                         WHERE strftime('%s', timestamp) IS NOT NULL
+                         ORDER BY id""")
+
+    conn.execute("DROP TABLE IF EXISTS _historico_antigo")
+    conn.execute("DROP TABLE IF EXISTS _logs_antigo")
+
+def reconstruir_rollups(conn):
+    """Recalcula todos os rollups a partir das tabelas brutas (migração ou correção manual)."""
+    conn.execute("DELETE FROM rollup_horario_sensor")
+    conn.execute("DELETE FROM rollup_diario_sensor")
+    conn.execute("DELETE FROM rollup_acoes_diario")
+
+    for tabela, coluna, segundos in (('rollup_horario_sensor', 'hora', 3600),
+                                     ('rollup_diario_sensor', 'dia', 86400)):
+        conn.execute(f"""INSERT INTO {tabela} ({coluna}, id_sensor, leituras,
+                                                qtd_umidade, soma_umidade, min_umidade, max_umidade,
+                                                qtd_temp, soma_temp, min_temp, max_temp, soma_chuva)
+                         SELECT timestamp - timestamp % {segundos}, COALESCE(id_sensor, ''), COUNT(*),
+                                COUNT(umidade_solo), TOTAL(umidade_solo), MIN(umidade_solo), MAX(umidade_solo),
+                                COUNT(temp_ambiente), TOTAL(temp_ambiente), MIN(temp_ambiente), MAX(temp_ambiente),
+                                TOTAL(chuva_mm)
+                         FROM historico_clima
+                         GROUP BY 1, 2""")
+
+    conn.execute("""INSERT INTO rollup_acoes_diario (dia, acao, total)
+                    SELECT timestamp - timestamp % 86400, COALESCE(acao, ''), COUNT(*)
+                    FROM logs_decisao
+                    GROUP BY 1, 2""")
+
+if __name__ == "__main__":
+    caminho = Path(sys.argv[1]) if len(sys.argv) > 1 else PATH_DB
+    conectar(caminho).close()
+    print(f"✅ Esquema em dia: {caminho}")
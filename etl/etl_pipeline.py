@@ -1,34 +1,38 @@
 import pandas as pd
-import sqlite3
-import requests
-from datetime import datetime, timedelta
+import sys
+from datetime import datetime
 from pathlib import Path
 
 # --- CAMINHOS ---
 BASE_DIR = Path(__file__).resolve().parent.parent
-DB_PATH = BASE_DIR / 'green_horizon.db'
 
-LATITUDE = -22.9519
-LONGITUDE = -43.2105
+# Cliente de clima compartilhado com o backend (sessão, retentativas e cache)
+sys.path.append(str(BASE_DIR / 'backend'))
+from clima_API import cliente_clima, LATITUDE, LONGITUDE, FUSO_HORARIO
+from esquema_db import texto_para_epoch
+from roteador_shards import obter_roteador
 
 
 # --- API CLIMÁTICA ---
-def consultar_clima():
-    url = "https://api.open-meteo.com/v1/forecast"
+def consultar_clima(cliente=None, latitude=LATITUDE, longitude=LONGITUDE):
+    cliente = cliente or cliente_clima
 
     params = {
-        "latitude": LATITUDE,
-        "longitude": LONGITUDE,
+        "latitude": latitude,
+        "longitude": longitude,
         "current": [
             "temperature_2m",
             "precipitation",
             "wind_speed_10m"
         ],
-        "timezone": "America/Sao_Paulo"
+        "timezone": FUSO_HORARIO
     }
 
-    r = requests.get(url, params=params)
-    dados = r.json()["current"]
+    try:
+        dados = cliente.buscar(params)["current"]
+    except Exception as e:
+        print(f"⚠️ Erro na API de Clima: {e}")
+        return None
 
     return {
         "temp_ambiente": dados["temperature_2m"],
@@ -42,6 +46,9 @@ def consultar_clima():
 # --- SALVAR HISTÓRICO CLIMÁTICO ---
 def atualizar_historico_clima(umidade_solo, id_sensor=1, id_cultura=1):
     clima = consultar_clima()
+    if clima is None:
+        print("❌ Histórico climático não atualizado: API indisponível.")
+        return
 
     registro = {
         "timestamp": clima["timestamp"],
@@ -54,33 +61,9 @@ def atualizar_historico_clima(umidade_solo, id_sensor=1, id_cultura=1):
         "chuva_mm": clima["chuva_mm"]
     }
 
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    # Criar tabela se não existir
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS historico_clima (
-            id_leitura INTEGER PRIMARY KEY AUTOINCREMENT,
-            timestamp TEXT,
-            id_sensor INTEGER,
-            id_cultura INTEGER,
-            umidade_solo REAL,
-            temp_ambiente REAL,
-            vento_kmh REAL,
-            radiacao_solar REAL,
-            chuva_mm REAL
-        )
-    """)
-
-    # Inserir novo registro
-    cursor.execute("""
-        INSERT INTO historico_clima (
-            timestamp, id_sensor, id_cultura, umidade_solo,
-            temp_ambiente, vento_kmh, radiacao_solar, chuva_mm
-        )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        registro["timestamp"],
+    # Mesmo banco (ou shard da fazenda) do resto do sistema: o roteador cria o esquema na conexão
+    falhas = obter_roteador().inserir_historico([(
+        texto_para_epoch(registro["timestamp"]),
         registro["id_sensor"],
         registro["id_cultura"],
         registro["umidade_solo"],
@@ -88,17 +71,10 @@ def atualizar_historico_clima(umidade_solo, id_sensor=1, id_cultura=1):
         registro["vento_kmh"],
         registro["radiacao_solar"],
         registro["chuva_mm"]
-    ))
-
-    # Limpar registros antigos (mais de 3h)
-    limite = (datetime.now() - timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S")
-
-    cursor.execute("""
-        DELETE FROM historico_clima
-        WHERE timestamp < ?
-    """, (limite,))
-
-    conn.commit()
-    conn.close()
+    )])
+    # Sem DELETE por inserção: leituras antigas são compactadas em lotes por retencao.py
+    if falhas:
+        print(f"❌ Histórico climático não atualizado: {falhas[0][1]}")
+        return
 
-    print("🌱 Histórico climático atualizado (últimas 3h mantidas).")
+    print("🌱 Histórico climático atualizado.")
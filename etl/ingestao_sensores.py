@@ -0,0 +1,327 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pandas as pd
+from esquema_db import COLUNAS_HISTORICO, conectar, serie_para_epoch
+from metricas import medir
+from regras_qualidade import MotorQualidade, gravar_quarentena
+from roteador_shards import SQL_HISTORICO, RoteadorShards, obter_roteador
+
+# --- 1. CONFIGURAÇÃO ---
+# Sem autenticação: por padrão só aceita conexões da própria máquina. GREEN_HORIZON_INGESTAO_HOST
+# (ou o terceiro argumento da linha de comando) abre para outra interface, ex.: a rede dos sensores
+HOST = os.environ.get("GREEN_HORIZON_INGESTAO_HOST", "127.0.0.1")
+PORTA_HTTP = 8088
+PORTA_UDP = 8089
+
+# Protocolo de linha: uma leitura por linha, mesmas colunas do CSV de histórico sem o id_leitura
+# (reservado na gravação pelo roteador). timestamp vazio = horário de chegada.
+#   2026-01-21 14:42:46,S-01,1,33.8,29.4,14.6,596.3,0
+# HTTP: POST /leituras com várias linhas no corpo; GET /status devolve os contadores.
+# UDP: um ou mais linhas por datagrama.
+COLUNAS_LINHA = [c for c in COLUNAS_HISTORICO if c != 'id_leitura']
+
+# Fila limitada (em linhas): cheia, o HTTP responde 503 e o UDP descarta, sempre contando
+MAX_FILA_LINHAS = 200_000
+MAX_CORPO_BYTES = 8 * 1024 * 1024
+
+# Micro-lotes: grava quando a fila passa de TAMANHO_LOTE linhas ou a cada INTERVALO_LOTE_S
+TAMANHO_LOTE = 10_000
+INTERVALO_LOTE_S = 0.05
+
+INTERVALO_RELATORIO_S = 60
+ORIGEM_QUARENTENA = "ingestao"
+# Linha com mais campos que o protocolo: vai inteira para a quarentena (o excesso fica em chuva_mm)
+REGRA_CAMPOS_A_MAIS = "campos_a_mais"
+
+
+# --- 2. VALIDAÇÃO E GRAVAÇÃO ---
+def validar_linhas(linhas, recebido_em=None, motor=None):
+    """
+    Aplica as regras de qualidade do run_etl (MotorQualidade) a um lote de linhas do protocolo.
+    Linhas com campos a mais, valores não numéricos, nulos, fora da faixa, fora de ordem,
+    repetidos ou picos vão para a quarentena.
+    Retorna (leituras válidas com timestamp em datetime64, quarentena).
+    """
+    recebido_em = recebido_em or datetime.now()
+    separadores = len(COLUNAS_LINHA) - 1
+    a_mais = [linha for linha in linhas if linha.count(b",") > separadores]
+    if a_mais:
+        linhas = [linha for linha in linhas if linha.count(b",") <= separadores]
+    # Sem aspas: o parser conta os campos como a separação acima
+    df = (pd.read_csv(io.BytesIO(b"\n".join(linhas)), header=None, names=COLUNAS_LINHA,
+                      dtype={'timestamp': 'str', 'id_sensor': 'str'}, quoting=csv.QUOTE_NONE,
+                      skip_blank_lines=True, encoding_errors='replace')
+          if linhas else pd.DataFrame(columns=COLUNAS_LINHA))
+
+    numericas = COLUNAS_LINHA[2:]
+    df[numericas] = df[numericas].apply(pd.to_numeric, errors='coerce')
+    df['timestamp'] = df['timestamp'].fillna(recebido_em.strftime("%Y-%m-%d %H:%M:%S.%f"))
+
+    # As regras exigem um id_leitura válido; a posição no lote faz esse papel até a gravação
+    df, df_quarentena = (motor or MotorQualidade()).aplicar(df.assign(id_leitura=range(len(df))))
+    if a_mais:
+        campos = [linha.decode('utf-8', 'replace').split(",", separadores) for linha in a_mais]
+        df_quarentena = pd.concat([df_quarentena, pd.DataFrame(campos, columns=COLUNAS_LINHA)
+                                   .assign(regra=REGRA_CAMPOS_A_MAIS)], ignore_index=True)
+    return df.astype({'id_cultura': 'int64'})[COLUNAS_LINHA], df_quarentena.assign(id_leitura=None)
+
+def _colunas_lote(df):
+    return [serie_para_epoch(df['timestamp']).tolist()] + [df[c].tolist() for c in COLUNAS_LINHA[1:]]
+
+def gravar_leituras(conn, roteador, df, df_quarentena=None):
+    """
+    executemany do lote (e da quarentena) em uma transação, com ids reservados pelo roteador:
+    o mesmo contador do EscritorLote e do ETL, então as leituras nunca disputam um id.
+    """
+    primeiro = roteador.reservar_ids(len(df)) if len(df) else 0
+    with conn:
+        conn.executemany(SQL_HISTORICO, zip(range(primeiro, primeiro + len(df)), *_colunas_lote(df)))
+        if df_quarentena is not None:
+            gravar_quarentena(conn, df_quarentena, ORIGEM_QUARENTENA)
+    return len(df)
+
+def gravar_leituras_shards(conn, roteador, df, df_quarentena=None, pendentes=()):
+    """
+    gravar_leituras nos shards: a quarentena vai para o catálogo (conn) e as leituras para o shard
+    da fazenda e do mês, com ids reservados pelo roteador. `pendentes` são linhas (já com id) de
+    lotes anteriores cujo shard falhou. Retorna (gravadas, linhas que falharam, já com id).
+    """
+    if df_quarentena is not None:
+        with conn:
+            gravar_quarentena(conn, df_quarentena, ORIGEM_QUARENTENA)
+    falhas = roteador.gravar([(SQL_HISTORICO, list(pendentes), 2, 1)]) if pendentes else []
+    falhas += roteador.inserir_historico(zip(*_colunas_lote(df)))
+    nao_gravadas = [linha for _, _, (linhas,) in falhas for linha in linhas]
+    return len(df) + len(pendentes) - len(nao_gravadas), nao_gravadas
+
+
+# --- 3. SERVIDOR ---
+class IngestaoSensores:
+    """
+    Endpoint local de ingestão (HTTP e UDP) com fila limitada e gravação em micro-lotes.
+
+    O laço de eventos só recebe e enfileira; validação e executemany rodam numa única thread
+    de gravação, um lote por vez. Nada some sem contagem: `contadores` separa o que foi gravado,
+    rejeitado pela validação, recusado/descartado com a fila cheia e o que falhou na gravação
+    (esse volta para a fila e é tentado de novo).
+
+    Sem caminho_db, grava pelo roteador de shards (obter_roteador). Nos shards cada fazenda/mês
+    grava à parte: se só um shard falha, as leituras dele (já com id) ficam pendentes e vão
+    junto com o próximo lote, sem regravar as que entraram.
+    """
+
+    def __init__(self, caminho_db=None, host=HOST, porta_http=PORTA_HTTP, porta_udp=PORTA_UDP,
+                 max_fila=MAX_FILA_LINHAS, tamanho_lote=TAMANHO_LOTE, intervalo_lote_s=INTERVALO_LOTE_S):
+        self.roteador = RoteadorShards(caminho_unico=caminho_db, ativo=False) if caminho_db else obter_roteador()
+        self.caminho_db = self.roteador.caminho_unico
+        self.host = host
+        self.porta_http = porta_http
+        self.porta_udp = porta_udp
+        self.max_fila = max_fila
+        self.tamanho_lote = tamanho_lote
+        self.intervalo_lote_s = intervalo_lote_s
+
+        self.contadores = {"recebidas": 0, "gravadas": 0, "rejeitadas": 0,
+                           "recusadas_fila_cheia": 0, "descartadas_fila_cheia": 0, "erros_gravacao": 0}
+        self._fila = []
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestao-db")
+        self._motor = MotorQualidade()  # só a thread de gravação usa
+        self._conn = None
+        self._pendentes = []  # linhas com id de shards que falharam (só a thread de gravação usa)
+        self._loop = None
+        self._parar = None
+        self._lote_cheio = None
+
+    # --- RECEPÇÃO ---
+    def receber(self, dados, descartar_se_cheia=True):
+        """
+        Enfileira as linhas de um corpo HTTP ou datagrama. Retorna quantas entraram
+        (0 se a fila não comporta o conjunto inteiro).
+        """
+        linhas = [linha for linha in dados.splitlines() if linha.strip()]
+        self.contadores["recebidas"] += len(linhas)
+        if len(self._fila) + len(linhas) > self.max_fila:
+            self.contadores["descartadas_fila_cheia" if descartar_se_cheia else "recusadas_fila_cheia"] += len(linhas)
+            return 0
+
+        self._fila.extend(linhas)
+        if len(self._fila) >= self.tamanho_lote:
+            self._lote_cheio.set()
+        return len(linhas)
+
+    async def _atender_http(self, reader, writer):
+        try:
+            while True:
+                cabecalho = await reader.readuntil(b"\r\n\r\n")
+                linha_pedido, *campos = cabecalho.decode('latin-1').split("\r\n")
+                metodo, caminho = linha_pedido.split(" ")[:2]
+                cabecalhos = {nome.strip().lower(): valor.strip()
+                              for nome, valor in (c.split(":", 1) for c in campos if ":" in c)}
+
+                tamanho = int(cabecalhos.get('content-length', 0))
+                if tamanho > MAX_CORPO_BYTES:
+                    await self._responder(writer, 413, {"erro": "corpo grande demais"}, fechar=True)
+                    break
+                corpo = await reader.readexactly(tamanho)
+
+                if metodo == "POST" and caminho == "/leituras":
+                    aceitas = self.receber(corpo, descartar_se_cheia=False)
+                    if aceitas or not corpo.strip():
+                        await self._responder(writer, 202, {"enfileiradas": aceitas})
+                    else:
+                        await self._responder(writer, 503, {"erro": "fila cheia, tente novamente"})
+                elif metodo == "GET" and caminho == "/status":
+                    await self._responder(writer, 200, dict(self.contadores, fila=len(self._fila)))
+                else:
+                    await self._responder(writer, 404, {"erro": "use POST /leituras ou GET /status"})
+
+                if cabecalhos.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        except asyncio.CancelledError:
+            pass  # encerramento com a conexão keep-alive ainda aberta
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _responder(writer, status, corpo, fechar=False):
+        textos = {200: "OK", 202: "Accepted", 404: "Not Found", 413: "Payload Too Large", 503: "Service Unavailable"}
+        dados = json.dumps(corpo).encode()
+        cabecalho = (f"HTTP/1.1 {status} {textos[status]}\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(dados)}\r\n" + ("Connection: close\r\n" if fechar else "") + "\r\n")
+        writer.write(cabecalho.encode() + dados)
+        await writer.drain()
+
+    # --- GRAVAÇÃO ---
+    def _gravar(self, linhas):
+        """Roda na thread de gravação: valida e grava um lote. Retorna (gravadas, rejeitadas)."""
+        if self._conn is None:
+            self._conn = conectar(self.caminho_db)
+            self._motor.carregar_contexto(self._conn, roteador=self.roteador)
+        contexto = self._motor.contexto
+        try:
+            with medir('ingestao.validar'):
+                df, df_quarentena = validar_linhas(linhas, motor=self._motor)
+            with medir('ingestao.gravar'):
+                if not self.roteador.ativo:
+                    return gravar_leituras(self._conn, self.roteador, df, df_quarentena), len(linhas) - len(df), 0
+                gravadas, self._pendentes = gravar_leituras_shards(self._conn, self.roteador, df, df_quarentena,
+                                                                   self._pendentes)
+        except Exception:
+            self._motor.contexto = contexto  # o lote volta para a fila e será avaliado de novo
+            raise
+        return gravadas, len(linhas) - len(df), len(self._pendentes)
+
+    async def descarregar(self):
+        """Valida e grava tudo que está na fila (fora do laço de eventos)."""
+        while self._fila:
+            linhas, self._fila = self._fila[:self.tamanho_lote], self._fila[self.tamanho_lote:]
+            try:
+                gravadas, rejeitadas, pendentes = await self._loop.run_in_executor(self._executor, self._gravar, linhas)
+            except Exception as e:
+                # Volta para o início da fila; a fila cheia segura os clientes até o banco voltar
+                self._fila[:0] = linhas
+                self.contadores["erros_gravacao"] += len(linhas)
+                print(f"❌ Erro na gravação do lote ({len(linhas)} leituras voltaram para a fila): {e}")
+                return
+            self.contadores["gravadas"] += gravadas
+            self.contadores["rejeitadas"] += rejeitadas
+            if pendentes:
+                self.contadores["erros_gravacao"] += pendentes
+                print(f"❌ Shard(s) com erro na gravação: {pendentes} leituras pendentes para o próximo lote.")
+
+    async def _laco_gravacao(self):
+        while not self._parar.is_set():
+            try:
+                await asyncio.wait_for(self._lote_cheio.wait(), timeout=self.intervalo_lote_s)
+            except asyncio.TimeoutError:
+                pass
+            self._lote_cheio.clear()
+            await self.descarregar()
+
+    async def _laco_relatorio(self):
+        while not self._parar.is_set():
+            try:
+                await asyncio.wait_for(self._parar.wait(), timeout=INTERVALO_RELATORIO_S)
+            except asyncio.TimeoutError:
+                self.imprimir_relatorio()
+
+    def imprimir_relatorio(self):
+        c = self.contadores
+        descartadas = c["recusadas_fila_cheia"] + c["descartadas_fila_cheia"]
+        print(f"📡 Ingestão: {c['recebidas']} recebidas | {c['gravadas']} gravadas | {c['rejeitadas']} rejeitadas"
+              + (f" | ⚠️ {descartadas} fora por fila cheia" if descartadas else "")
+              + (f" | ❌ {c['erros_gravacao']} com erro de gravação" if c['erros_gravacao'] else ""))
+
+    # --- CICLO DE VIDA ---
+    async def executar(self):
+        self._loop = asyncio.get_running_loop()
+        self._parar = asyncio.Event()
+        self._lote_cheio = asyncio.Event()
+        for sinal in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self._loop.add_signal_handler(sinal, self._parar.set)
+            except (NotImplementedError, RuntimeError):
+                pass
+
+        servidor_http = await asyncio.start_server(self._atender_http, self.host, self.porta_http)
+        transporte_udp, _ = await self._loop.create_datagram_endpoint(
+            lambda: _ProtocoloUDP(self), local_addr=(self.host, self.porta_udp))
+        print(f"📡 Ingestão no ar: HTTP {self.host}:{self.porta_http} (POST /leituras), UDP {self.host}:{self.porta_udp}.")
+
+        tarefas = [asyncio.create_task(self._laco_gravacao()), asyncio.create_task(self._laco_relatorio())]
+        try:
+            await self._parar.wait()
+        finally:
+            self._parar.set()
+            servidor_http.close()
+            transporte_udp.close()
+            await servidor_http.wait_closed()
+            await asyncio.gather(*tarefas)
+            await self.descarregar()
+            await self._loop.run_in_executor(self._executor, self._fechar_conexao)
+            self._executor.shutdown(wait=True)
+            self.imprimir_relatorio()
+            if self._pendentes:
+                print(f"⚠️ {len(self._pendentes)} leituras ficaram sem gravar (shards com erro).")
+            print("🛑 Ingestão encerrada.")
+
+    def _fechar_conexao(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def parar(self):
+        """Pede a parada (pode ser chamado de outra thread)."""
+        if self._loop is not None and self._parar is not None:
+            self._loop.call_soon_threadsafe(self._parar.set)
+
+
+class _ProtocoloUDP(asyncio.DatagramProtocol):
+    def __init__(self, ingestao):
+        self.ingestao = ingestao
+
+    def datagram_received(self, dados, endereco):
+        self.ingestao.receber(dados, descartar_se_cheia=True)
+
+
+def executar_ingestao(**opcoes):
+    try:
+        asyncio.run(IngestaoSensores(**opcoes).executar())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    porta_http = int(sys.argv[1]) if len(sys.argv) > 1 else PORTA_HTTP
+    porta_udp = int(sys.argv[2]) if len(sys.argv) > 2 else PORTA_UDP
+    host = sys.argv[3] if len(sys.argv) > 3 else HOST
+    executar_ingestao(host=host, porta_http=porta_http, porta_udp=porta_udp)
@@ -1,7 +1,17 @@
+import io
+import numpy as np
+import os
 import pandas as pd
-import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from esquema_db import COLUNAS_HISTORICO, PATH_DB, conectar, serie_para_epoch
+from metricas import medido, medir
+from roteador_shards import obter_roteador
+from regras_qualidade import (COLUNAS_CONTEXTO, MotorQualidade, avaliar_linhas, gravar_quarentena,
+                              limpar_quarentena, reprovar_ids_duplicados, resumo_regras)
 
 # --- 1. CONFIGURAÇÃO DE CAMINHOS ---
 # Pega o caminho de onde este script está
@@ -11,8 +21,46 @@ BASE_DIR = Path(__file__).resolve().parent
 # .parent (sai de etl) / 'data' (entra em data)
 DATA_DIR = BASE_DIR.parent / 'data'
 
-DB_NAME = BASE_DIR / 'green_horizon.db'
+DB_NAME = PATH_DB
+PATH_HISTORICO = DATA_DIR / 'historico_leituras_sujo.csv'
 
+# Tipos explícitos para o modo streaming (sem inferência do pandas).
+# id_leitura e timestamp entram como texto porque linhas corrompidas trazem colunas deslocadas.
+DTYPES_HISTORICO = {
+    'id_leitura': 'str',
+    'timestamp': 'str',
+    'id_sensor': 'category',
+    'id_cultura': 'float64',
+    'umidade_solo': 'float64',
+    'temp_ambiente': 'float64',
+    'vento_kmh': 'float64',
+    'radiacao_solar': 'float64',
+    'chuva_mm': 'float64',
+}
+TAMANHO_CHUNK = 100_000
+
+# Colunas de texto lidas sem inferência nos modos completo, incremental e paralelo: o mesmo valor
+# sai igual em qualquer partição do arquivo
+DTYPES_TEXTO = {'id_leitura': 'str', 'timestamp': 'str', 'id_sensor': 'str'}
+
+# Modo paralelo: faixas de bytes por processo (mais faixas que processos equilibra a carga)
+PROCESSOS_ETL = os.cpu_count() or 1
+FAIXAS_POR_PROCESSO = 4
+
+def limpar_historico(df_historico, motor=None):
+    """
+    Regras de qualidade das leituras (compartilhadas com o backtest e a ingestão): só as válidas.
+    Passe o mesmo MotorQualidade para todos os blocos de um arquivo; quem grava a quarentena
+    usa motor.aplicar() direto.
+    """
+    return (motor or MotorQualidade()).aplicar(df_historico)[0]
+
+def avisar_quarentena(motor):
+    total = sum(motor.reprovadas_por_regra.values())
+    if total:
+        print(f"🚧 {total} leituras em quarentena ({resumo_regras(motor.reprovadas_por_regra)}).")
+
+@medido('etl.total')
 def run_etl():
     print(f"[{datetime.now()}] Iniciando processo de ETL...")
     print(f"🔎 Buscando dados em: {DATA_DIR}")
@@ -20,32 +68,328 @@ def run_etl():
     # --- 2. EXTRACT ---
     try:
         # PEGANDO CSVS
-        df_culturas = pd.read_csv(DATA_DIR / 'config_culturas.csv')
-        df_tarifas = pd.read_csv(DATA_DIR / 'tarifas_energia.csv')
-        df_historico = pd.read_csv(DATA_DIR / 'historico_leituras_sujo.csv')
+        with medir('etl.extrair'):
+            df_culturas = pd.read_csv(DATA_DIR / 'config_culturas.csv')
+            df_tarifas = pd.read_csv(DATA_DIR / 'tarifas_energia.csv')
+            offset_lido = fim_ultima_linha(PATH_HISTORICO)
+            df_historico = pd.read_csv(PATH_HISTORICO, dtype=DTYPES_TEXTO)
 
         print("✅ Arquivos CSV carregados com sucesso.")
         
         # --- 3. TRANSFORM (Limpeza) ---
-        # Removendo Nulos
-        df_historico = df_historico.dropna()
-        
-        # Removendo Temperaturas > 60°C (Ruído)
-        df_historico = df_historico[df_historico['temp_ambiente'] <= 60]
+        with medir('etl.limpar'):
+            motor = MotorQualidade()
+            df_historico, df_quarentena = motor.aplicar(df_historico)
         
         print(f"🧹 Dados limpos. Total de registros válidos: {len(df_historico)}")
+        avisar_quarentena(motor)
 
         # --- 4. LOAD (Salvando no SQLite) ---
-        conn = sqlite3.connect(DB_NAME)
-        df_historico.to_sql('historico_clima', conn, if_exists='replace', index=False)
+        # Upsert em vez de substituir a tabela: preserva a chave primária, os índices
+        # e as leituras gravadas direto pelo backend
+        with medir('etl.gravar'):
+            conn = conectar(DB_NAME)
+            with conn:
+                upsert_historico(conn, df_historico)
+                # Carga completa: a quarentena do arquivo é refeita do zero
+                limpar_quarentena(conn, PATH_HISTORICO.name)
+                gravar_quarentena(conn, df_quarentena, PATH_HISTORICO.name)
+                salvar_watermark(conn, offset_lido, df_historico)
         print(f"Banco de dados criado/atualizado em: {DB_NAME}")
         conn.close()
 
     except Exception as e:
         print(f"❌ Erro durante o processo: {e}")
 
+# --- 5. MODO INCREMENTAL (WATERMARK) ---
+def ler_watermark(conn, arquivo=PATH_HISTORICO):
+    """Retorna o offset (em bytes) até onde o CSV já foi carregado."""
+    linha = conn.execute("SELECT offset_bytes FROM etl_watermark WHERE arquivo = ?",
+                         (arquivo.name,)).fetchone()
+    return linha[0] if linha else 0
+
+def salvar_watermark(conn, offset_bytes, df_carregado, arquivo=PATH_HISTORICO):
+    """Registra o novo offset junto com o último id e timestamp carregados."""
+    ultimo_id, ultimo_timestamp = None, None
+    if not df_carregado.empty:
+        ids = pd.to_numeric(df_carregado['id_leitura'], errors='coerce')
+        ultimo_id = int(ids.max()) if ids.notna().any() else None
+        ultimo_timestamp = str(df_carregado['timestamp'].max())
+
+    conn.execute("""INSERT INTO etl_watermark (arquivo, offset_bytes, ultimo_id, ultimo_timestamp, atualizado_em)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(arquivo) DO UPDATE SET
+                        offset_bytes = excluded.offset_bytes,
+                        ultimo_id = COALESCE(excluded.ultimo_id, ultimo_id),
+                        ultimo_timestamp = COALESCE(excluded.ultimo_timestamp, ultimo_timestamp),
+                        atualizado_em = excluded.atualizado_em""",
+                 (arquivo.name, offset_bytes, ultimo_id, ultimo_timestamp,
+                  datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+def fim_ultima_linha(caminho):
+    """Offset logo após a última quebra de linha do arquivo (ignora uma linha ainda incompleta)."""
+    with open(caminho, 'rb') as f:
+        f.seek(0, io.SEEK_END)
+        posicao = f.tell()
+        while posicao > 0:
+            bloco = min(64 * 1024, posicao)
+            f.seek(posicao - bloco)
+            trecho = f.read(bloco)
+            quebra = trecho.rfind(b'\n')
+            if quebra >= 0:
+                return posicao - bloco + quebra + 1
+            posicao -= bloco
+    return 0
+
+def ler_cauda_csv(caminho, offset):
+    """
+    Lê apenas as linhas completas escritas depois do offset.
+    Retorna o DataFrame da cauda e o novo offset (sempre no fim de uma linha).
+    """
+    with open(caminho, 'rb') as f:
+        f.seek(0, io.SEEK_END)
+        tamanho = f.tell()
+
+        # Arquivo menor que o watermark: foi truncado ou substituído, recomeça do início
+        if offset > tamanho:
+            print("⚠️ CSV menor que o watermark. Recarregando desde o início.")
+            offset = 0
+
+        f.seek(offset)
+        if offset == 0:
+            f.readline()  # cabeçalho
+        inicio = f.tell()
+        dados = f.read()
+
+    # Uma linha ainda sendo escrita fica para a próxima execução
+    fim = dados.rfind(b'\n') + 1
+    dados = dados[:fim]
+
+    if not dados.strip():
+        return pd.DataFrame(columns=COLUNAS_HISTORICO), inicio + fim
+
+    df = pd.read_csv(io.BytesIO(dados), header=None, names=COLUNAS_HISTORICO, dtype=DTYPES_TEXTO)
+    return df, inicio + fim
+
+def upsert_historico(conn, df_historico):
+    """
+    Insere ou atualiza leituras por id_leitura com executemany (timestamp vai como epoch).
+    Leituras anteriores ao corte 'bruto' do banco (ou shard) de destino são ignoradas: a retenção
+    já as compactou nos rollups ou as arquivou, e o run_etl completo não as traz de volta.
+    Com os shards ligados as leituras vão pelo roteador (conn fica só com quarentena e watermark);
+    se algum shard falhar, levanta erro e o watermark não avança: o upsert refeito não duplica nada.
+    Antes de gravar nos shards, o contador de ids do catálogo sobe acima do maior id do CSV, para
+    nenhuma reserva (EscritorLote, ingestão) receber um id que o upsert vai sobrescrever.
+    """
+    df_historico = df_historico.assign(timestamp=serie_para_epoch(df_historico['timestamp']))
+    colunas = ", ".join(COLUNAS_HISTORICO)
+    marcadores = ", ".join(f"?{i}" for i in range(1, len(COLUNAS_HISTORICO) + 1))
+    posicao_epoch = COLUNAS_HISTORICO.index('timestamp') + 1
+    atualizacao = ", ".join(f"{c} = excluded.{c}" for c in COLUNAS_HISTORICO if c != 'id_leitura')
+    # O corte é lido no próprio banco de destino: vale igual no banco único e em cada shard
+    sql = f"""INSERT INTO historico_clima ({colunas}) SELECT {marcadores}
+              WHERE NOT EXISTS (SELECT 1 FROM retencao_cortes WHERE camada = 'bruto' AND corte > ?{posicao_epoch})
+              ON CONFLICT(id_leitura) DO UPDATE SET {atualizacao}"""
+    linhas = df_historico[COLUNAS_HISTORICO].astype(object).itertuples(index=False, name=None)
+
+    roteador = obter_roteador()
+    if not roteador.ativo:
+        conn.executemany(sql, linhas)
+        return
+    if not df_historico.empty:
+        roteador.elevar_ids(int(df_historico['id_leitura'].max()) + 1)
+    falhas = roteador.gravar([(sql, list(linhas), 2, 1)])
+    if falhas:
+        caminho, erro, _ = falhas[0]
+        raise RuntimeError(f"{len(falhas)} shard(s) sem gravar, ex.: {caminho}: {erro}")
+
+@medido('etl_incremental.total')
+def run_etl_incremental():
+    """Carrega só a parte nova do CSV e faz upsert no SQLite em uma única transação."""
+    print(f"[{datetime.now()}] Iniciando ETL incremental...")
+
+    try:
+        conn = conectar(DB_NAME)
+        offset = ler_watermark(conn)
+
+        with medir('etl_incremental.extrair'):
+            df_novo, novo_offset = ler_cauda_csv(PATH_HISTORICO, offset)
+        print(f"📥 {novo_offset - offset} bytes novos desde o último watermark.")
+
+        with medir('etl_incremental.limpar'):
+            # Ordem, duplicatas e picos continuam de onde o banco parou
+            motor = MotorQualidade()
+            ids = pd.to_numeric(df_novo['id_leitura'], errors='coerce')
+            motor.carregar_contexto(conn, antes_do_id=int(ids.min()) if ids.notna().any() else None,
+                                    roteador=obter_roteador())
+            df_novo, df_quarentena = motor.aplicar(df_novo)
+
+        with medir('etl_incremental.gravar'), conn:
+            upsert_historico(conn, df_novo)
+            gravar_quarentena(conn, df_quarentena, PATH_HISTORICO.name)
+            salvar_watermark(conn, novo_offset, df_novo)
+
+        conn.close()
+        print(f"🧹 {len(df_novo)} registros válidos carregados (watermark em {novo_offset} bytes).")
+        avisar_quarentena(motor)
+
+    except Exception as e:
+        print(f"❌ Erro durante o ETL incremental: {e}")
+
+# --- 6. MODO STREAMING (MEMÓRIA CONSTANTE) ---
+def run_etl_streaming(caminho=PATH_HISTORICO, tamanho_chunk=TAMANHO_CHUNK):
+    """
+    Carrega dumps grandes em blocos de tamanho fixo: tipos explícitos, limpeza por bloco
+    e executemany por bloco. O pico de memória depende só de tamanho_chunk.
+    """
+    print(f"[{datetime.now()}] Iniciando ETL em streaming ({tamanho_chunk} linhas por bloco)...")
+
+    try:
+        conn = conectar(DB_NAME)
+
+        offset_final = fim_ultima_linha(caminho)
+        total_lidas, total_validas = 0, 0
+        motor = MotorQualidade()
+        with conn:
+            limpar_quarentena(conn, Path(caminho).name)
+        inicio = time.perf_counter()
+
+        leitor = pd.read_csv(caminho, dtype=DTYPES_HISTORICO, usecols=COLUNAS_HISTORICO,
+                             chunksize=tamanho_chunk)
+        for chunk in leitor:
+            total_lidas += len(chunk)
+
+            with medir('etl_streaming.limpar'):
+                chunk, quarentena = motor.aplicar(chunk)
+                chunk = chunk.astype({'id_cultura': 'int64'})
+
+            with medir('etl_streaming.gravar'), conn:
+                upsert_historico(conn, chunk)
+                gravar_quarentena(conn, quarentena, Path(caminho).name)
+            total_validas += len(chunk)
+
+            decorrido = time.perf_counter() - inicio
+            print(f"   ↳ {total_lidas} linhas lidas | {total_lidas / decorrido:,.0f} linhas/s")
+
+        if Path(caminho) == PATH_HISTORICO:
+            with conn:
+                salvar_watermark(conn, offset_final, pd.DataFrame(columns=COLUNAS_HISTORICO))
+        conn.close()
+
+        decorrido = time.perf_counter() - inicio
+        vazao = total_lidas / decorrido if decorrido > 0 else 0.0
+        print(f"🧹 {total_validas} de {total_lidas} registros válidos em {decorrido:.1f}s "
+              f"({vazao:,.0f} linhas/s).")
+        avisar_quarentena(motor)
+        return {"linhas_lidas": total_lidas, "linhas_validas": total_validas,
+                "segundos": decorrido, "linhas_por_segundo": vazao}
+
+    except Exception as e:
+        print(f"❌ Erro durante o ETL em streaming: {e}")
+
+# --- 7. MODO PARALELO (PROCESSOS) ---
+def faixas_de_bytes(caminho, partes):
+    """
+    Divide o arquivo (sem o cabeçalho) em até `partes` faixas [início, fim) terminadas em quebra
+    de linha. Retorna (cabeçalho, faixas).
+    """
+    with open(caminho, 'rb') as f:
+        cabecalho = f.readline().decode('utf-8').strip().split(',')
+        inicio, tamanho = f.tell(), f.seek(0, io.SEEK_END)
+        cortes = [inicio]
+        for alvo in np.linspace(inicio, tamanho, partes + 1)[1:-1].astype(int):
+            f.seek(max(alvo, cortes[-1]))
+            f.readline()  # avança até o fim da linha em que o corte caiu
+            if cortes[-1] < f.tell() < tamanho:
+                cortes.append(f.tell())
+    cortes.append(tamanho)
+    return cabecalho, [(a, b) for a, b in zip(cortes[:-1], cortes[1:]) if b > a]
+
+def _avaliar_faixa(caminho, cabecalho, inicio, fim):
+    """Processo do pool: lê uma faixa de bytes e aplica as regras linha a linha."""
+    with open(caminho, 'rb') as f:
+        f.seek(inicio)
+        dados = f.read(fim - inicio)
+    return avaliar_linhas(pd.read_csv(io.BytesIO(dados), header=None, names=cabecalho, dtype=DTYPES_TEXTO))
+
+def _avaliar_sensores(df_sensores):
+    """Processo do pool: regras de sequência de um grupo de sensores (leituras em ordem de chegada)."""
+    motivo = np.zeros(len(df_sensores), dtype=np.int8)
+    MotorQualidade().avaliar_sequencia(df_sensores.reset_index(drop=True), motivo)
+    return motivo
+
+@medido('etl_paralelo.total')
+def run_etl_paralelo(processos=PROCESSOS_ETL, caminho=None):
+    """
+    Mesmo resultado do run_etl (linhas, quarentena e ordem de gravação), com a limpeza em processos:
+    1. faixas de bytes do CSV são lidas e avaliadas linha a linha em paralelo;
+    2. ids duplicados são resolvidos no arquivo inteiro (aqui, é uma comparação global);
+    3. as regras de sequência rodam em paralelo por grupo de sensores (hash do id_sensor);
+    4. este processo, o único com conexão ao SQLite, grava tudo na ordem do arquivo.
+    """
+    print(f"[{datetime.now()}] Iniciando ETL paralelo ({processos} processos)...")
+    caminho = caminho or PATH_HISTORICO
+
+    try:
+        inicio = time.perf_counter()
+        offset_lido = fim_ultima_linha(caminho)
+        cabecalho, faixas = faixas_de_bytes(caminho, processos * FAIXAS_POR_PROCESSO)
+
+        with ProcessPoolExecutor(max_workers=processos) as pool:
+            with medir('etl_paralelo.linhas'):
+                partes = list(pool.map(_avaliar_faixa, *zip(*[(caminho, cabecalho, a, b) for a, b in faixas])))
+                df_historico = pd.concat([df for df, _ in partes], ignore_index=True)
+                motivo = np.concatenate([m for _, m in partes])
+                del partes
+
+            reprovar_ids_duplicados(df_historico, motivo)
+
+            with medir('etl_paralelo.sequencia'):
+                vivas = np.flatnonzero(motivo == 0)
+                df_vivas = df_historico.iloc[vivas][COLUNAS_CONTEXTO]
+                grupos = (pd.util.hash_array(df_vivas['id_sensor'].astype(str).to_numpy(dtype=object))
+                          % np.uint64(processos * FAIXAS_POR_PROCESSO)).astype(np.int64)
+                posicoes = [vivas[grupos == g] for g in np.unique(grupos)]
+                for posicoes_grupo, motivo_grupo in zip(posicoes, pool.map(
+                        _avaliar_sensores, (df_historico.iloc[p][COLUNAS_CONTEXTO] for p in posicoes))):
+                    motivo[posicoes_grupo] = motivo_grupo
+
+        motor = MotorQualidade()
+        df_historico, df_quarentena = motor.separar(df_historico, motivo)
+        limpeza = time.perf_counter() - inicio
+        print(f"🧹 Dados limpos em {limpeza:.1f}s. Total de registros válidos: {len(df_historico)}")
+        avisar_quarentena(motor)
+
+        with medir('etl_paralelo.gravar'):
+            conn = conectar(DB_NAME)
+            with conn:
+                upsert_historico(conn, df_historico)
+                limpar_quarentena(conn, Path(caminho).name)
+                gravar_quarentena(conn, df_quarentena, Path(caminho).name)
+                if Path(caminho) == PATH_HISTORICO:
+                    salvar_watermark(conn, offset_lido, df_historico)
+            conn.close()
+
+        decorrido = time.perf_counter() - inicio
+        linhas = len(motivo)
+        print(f"Banco de dados criado/atualizado em: {DB_NAME} ({linhas / decorrido:,.0f} linhas/s no total, "
+              f"{linhas / limpeza:,.0f} linhas/s na limpeza).")
+        return {"linhas_lidas": linhas, "linhas_validas": len(df_historico), "segundos": decorrido,
+                "segundos_limpeza": limpeza, "processos": processos}
+
+    except Exception as e:
+        print(f"❌ Erro durante o ETL paralelo: {e}")
+
 if __name__ == "__main__":
-    run_etl()
+    if "--incremental" in sys.argv:
+        run_etl_incremental()
+    elif "--paralelo" in sys.argv:
+        argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+        run_etl_paralelo(int(argumentos[0]) if argumentos else PROCESSOS_ETL)
+    elif "--streaming" in sys.argv:
+        run_etl_streaming()
+    else:
+        run_etl()
         
 
 
@@ -0,0 +1,213 @@
+import atexit
+import json
+import math
+import os
+import socket
+import threading
+import time
+from datetime import datetime
+
+try:
+    from esquema_db import PATH_DB, conectar, texto_para_epoch
+except ImportError:  # importado como pacote (app.py: etl.metricas)
+    from etl.esquema_db import PATH_DB, conectar, texto_para_epoch
+
+# --- 1. CONFIGURAÇÃO ---
+# GREEN_HORIZON_METRICAS=0 desliga tudo: medir() devolve um contexto vazio e nada é gravado
+ATIVO = os.environ.get("GREEN_HORIZON_METRICAS", "1") != "0"
+
+# Histograma logarítmico: 4 baldes por potência de 2 a partir de 1 µs (erro de ~9% nos percentis)
+BALDES_POR_OITAVA = 4
+INTERVALO_DESCARGA_S = 60
+DIAS_METRICAS = 30
+
+PROCESSO = f"{socket.gethostname()}:{os.getpid()}"
+
+
+# --- 2. HISTOGRAMAS EM MEMÓRIA ---
+def indice_balde(segundos):
+    return max(0, int(math.log2(max(segundos * 1e6, 1.0)) * BALDES_POR_OITAVA))
+
+def valor_balde(indice):
+    """Centro (geométrico) do balde, em milissegundos."""
+    return 2 ** ((indice + 0.5) / BALDES_POR_OITAVA) / 1000
+
+def percentis(baldes, quantis=(0.5, 0.95, 0.99)):
+    """Percentis (ms) de um histograma {índice: contagem}."""
+    total = sum(baldes.values())
+    if not total:
+        return [None] * len(quantis)
+    ordem = sorted(baldes.items())
+    resultado = []
+    for quantil in quantis:
+        alvo, acumulado = quantil * total, 0
+        for indice, contagem in ordem:
+            acumulado += contagem
+            if acumulado >= alvo:
+                resultado.append(valor_balde(indice))
+                break
+    return resultado
+
+
+class _Etapa:
+    __slots__ = ("qtd", "soma", "maximo", "erros", "retentativas", "baldes")
+
+    def __init__(self):
+        self.qtd, self.soma, self.maximo, self.erros, self.retentativas = 0, 0.0, 0.0, 0, 0
+        self.baldes = {}
+
+
+_lock = threading.Lock()
+_etapas = {}
+_descarga = None
+
+
+def registrar_duracao(etapa, segundos, erro=False):
+    """Soma uma medida ao histograma da etapa."""
+    indice = indice_balde(segundos)
+    with _lock:
+        dados = _etapas.get(etapa)
+        if dados is None:
+            dados = _etapas[etapa] = _Etapa()
+        dados.qtd += 1
+        dados.soma += segundos
+        dados.maximo = max(dados.maximo, segundos)
+        dados.erros += erro
+        dados.baldes[indice] = dados.baldes.get(indice, 0) + 1
+    if _descarga is None:
+        _iniciar_descarga()
+
+def contar(etapa, erros=0, retentativas=0):
+    """Conta erros/retentativas de uma etapa sem medir tempo (ex.: retentativas do HTTP)."""
+    if not ATIVO or not (erros or retentativas):
+        return
+    with _lock:
+        dados = _etapas.get(etapa)
+        if dados is None:
+            dados = _etapas[etapa] = _Etapa()
+        dados.erros += erros
+        dados.retentativas += retentativas
+    if _descarga is None:
+        _iniciar_descarga()
+
+
+# --- 3. SPANS ---
+class _Span:
+    __slots__ = ("etapa", "inicio")
+
+    def __init__(self, etapa):
+        self.etapa = etapa
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, rastro):
+        registrar_duracao(self.etapa, time.perf_counter() - self.inicio, erro=tipo is not None)
+        return False
+
+
+class _SpanNulo:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, rastro):
+        return False
+
+
+_SPAN_NULO = _SpanNulo()
+
+
+def medir(etapa):
+    """
+    Contexto que mede o bloco como `etapa` (nomes em 'grupo.etapa', ex.: 'decisao.clima').
+    Uma exceção que atravessa o bloco conta como erro da etapa.
+    """
+    return _Span(etapa) if ATIVO else _SPAN_NULO
+
+def medido(etapa):
+    """Decorador equivalente a medir(); desligado, devolve a própria função (custo zero)."""
+    def decorar(funcao):
+        if not ATIVO:
+            return funcao
+
+        def envolvida(*args, **kwargs):
+            with _Span(etapa):
+                return funcao(*args, **kwargs)
+        envolvida.__name__, envolvida.__doc__, envolvida.__wrapped__ = funcao.__name__, funcao.__doc__, funcao
+        return envolvida
+    return decorar
+
+
+# --- 4. DESCARGA PARA O BANCO ---
+def descarregar(caminho_db=PATH_DB):
+    """Grava e zera os histogramas acumulados (uma linha por etapa). Retorna quantas etapas foram gravadas."""
+    global _etapas
+    with _lock:
+        etapas, _etapas = _etapas, {}
+    if not etapas:
+        return 0
+
+    agora = texto_para_epoch(datetime.now().replace(microsecond=0))
+    linhas = [(agora, PROCESSO, etapa, d.qtd, d.soma * 1000, d.maximo * 1000, d.erros, d.retentativas,
+               json.dumps(d.baldes)) for etapa, d in etapas.items()]
+    try:
+        conn = conectar(caminho_db)
+        with conn:
+            conn.executemany("""INSERT INTO metricas_desempenho (timestamp, processo, etapa, qtd, soma_ms, max_ms,
+                                                                 erros, retentativas, baldes)
+                                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""", linhas)
+            conn.execute("DELETE FROM metricas_desempenho WHERE timestamp < ?", (agora - DIAS_METRICAS * 86400,))
+        conn.close()
+    except Exception as e:
+        print(f"⚠️ Métricas descartadas (falha na gravação): {e}")
+        return 0
+    return len(linhas)
+
+def _iniciar_descarga():
+    global _descarga
+    with _lock:
+        if _descarga is not None:
+            return
+        _descarga = threading.Thread(target=_laco_descarga, name="metricas", daemon=True)
+    _descarga.start()
+    atexit.register(descarregar)
+
+def _laco_descarga():
+    while True:
+        time.sleep(INTERVALO_DESCARGA_S)
+        descarregar()
+
+
+# --- 5. CONSULTA (DASHBOARD) ---
+def resumo_etapas(conn, desde):
+    """
+    Junta os histogramas gravados desde `desde` (epoch) por etapa:
+    qtd, erros, retentativas, média, p50/p95/p99 e máximo (ms).
+    """
+    resumo = {}
+    for etapa, qtd, soma_ms, max_ms, erros, retentativas, baldes in conn.execute(
+            """SELECT etapa, qtd, soma_ms, max_ms, erros, retentativas, baldes
+               FROM metricas_desempenho WHERE timestamp >= ?""", (desde,)):
+        dados = resumo.setdefault(etapa, {"qtd": 0, "soma_ms": 0.0, "max_ms": 0.0, "erros": 0,
+                                          "retentativas": 0, "baldes": {}})
+        dados["qtd"] += qtd
+        dados["soma_ms"] += soma_ms
+        dados["max_ms"] = max(dados["max_ms"], max_ms or 0.0)
+        dados["erros"] += erros
+        dados["retentativas"] += retentativas
+        for indice, contagem in json.loads(baldes or "{}").items():
+            dados["baldes"][int(indice)] = dados["baldes"].get(int(indice), 0) + contagem
+
+    linhas = []
+    for etapa, dados in sorted(resumo.items()):
+        # O centro do balde pode passar do máximo medido; o máximo é exato. Etapa só com contar()
+        # (sem baldes, ex.: erros com o circuito aberto) fica sem percentis (None)
+        p50, p95, p99 = (p if p is None else min(p, dados["max_ms"]) for p in percentis(dados["baldes"]))
+        linhas.append({"etapa": etapa, "qtd": dados["qtd"], "erros": dados["erros"],
+                       "retentativas": dados["retentativas"],
+                       "media_ms": dados["soma_ms"] / dados["qtd"] if dados["qtd"] else None,
+                       "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "max_ms": dados["max_ms"]})
+    return linhas
@@ -0,0 +1,367 @@
+import numpy as np
+import pandas as pd
+from collections import deque
+from datetime import datetime
+
+try:
+    from esquema_db import COLUNAS_HISTORICO, serie_de_epoch, texto_para_epoch
+except ImportError:  # importado como pacote
+    from etl.esquema_db import COLUNAS_HISTORICO, serie_de_epoch, texto_para_epoch
+
+# --- 1. REGRAS (DECLARATIVAS) ---
+# Cada leitura reprovada vai para a quarentena com o nome da PRIMEIRA regra que falhou,
+# na ordem abaixo. As regras sem estado valem linha a linha; as de sequência olham as
+# leituras anteriores do mesmo sensor (na ordem de chegada), inclusive as do bloco anterior.
+
+# Faixas físicas aceitas por coluna (inclusivas) -> regra 'faixa_<coluna>'
+FAIXAS = {
+    'umidade_solo': (0.0, 100.0),
+    'temp_ambiente': (-10.0, 60.0),
+    'vento_kmh': (0.0, 150.0),
+    'radiacao_solar': (0.0, 1400.0),
+    'chuva_mm': (0.0, 200.0),
+}
+# Datas aceitas: nem antes do início da operação nem mais que um dia à frente do relógio local
+INICIO_VALIDO = datetime(2000, 1, 1)
+TOLERANCIA_FUTURO_S = 86400
+
+# Pico: |x - média| / desvio das últimas JANELA_PICO leituras do sensor acima de LIMIAR_ZSCORE.
+# O desvio mínimo por coluna evita que uma série muito estável marque ruído comum como pico.
+JANELA_PICO = 12
+MIN_LEITURAS_PICO = 6
+LIMIAR_ZSCORE = 4.0
+COLUNAS_PICO = {'temp_ambiente': 2.0, 'umidade_solo': 3.0}
+# Reprovar uma leitura tira ela da janela das seguintes; sensor que não estabiliza em tantas
+# rodadas vetorizadas é avaliado leitura a leitura
+MAX_RODADAS_SEQUENCIA = 4
+# Salto de umidade com chuva na mesma leitura é resposta do solo, não pico
+ISENCOES_PICO = {'umidade_solo': 'chuva_mm'}
+
+# Sensor travado: as mesmas colunas repetidas em LEITURAS_TRAVADO leituras seguidas.
+# A primeira leitura da sequência fica; as repetições vão para a quarentena.
+COLUNAS_TRAVADO = ('umidade_solo', 'temp_ambiente')
+LEITURAS_TRAVADO = 6
+
+REGRAS = (['campo_invalido', 'timestamp_fora_da_faixa']
+          + [f'faixa_{coluna}' for coluna in FAIXAS]
+          + ['id_duplicado', 'leitura_duplicada', 'fora_de_ordem', 'sensor_travado']
+          + [f'pico_{coluna}' for coluna in COLUNAS_PICO])
+
+COLUNAS_NUMERICAS = ['id_cultura', 'umidade_solo', 'temp_ambiente', 'vento_kmh', 'radiacao_solar', 'chuva_mm']
+# Texto original de id_leitura/timestamp que não converteram (só existem enquanto o bloco é avaliado)
+COLUNA_ID_BRUTO, COLUNA_TIMESTAMP_BRUTO = '_id_leitura_bruto', '_timestamp_bruto'
+
+# Colunas guardadas por sensor entre blocos (só as que as regras de sequência usam)
+COLUNAS_CONTEXTO = ['id_sensor', 'timestamp'] + sorted(set(COLUNAS_PICO) | set(COLUNAS_TRAVADO)
+                                                       | set(ISENCOES_PICO.values()))
+
+
+# --- 2. MOTOR ---
+class MotorQualidade:
+    """
+    Aplica REGRAS a blocos de leituras com operações vetorizadas por coluna (sem laço por linha).
+
+    Guarda as últimas JANELA_PICO leituras aprovadas de cada sensor para que ordem, duplicatas,
+    sensor travado e picos continuem valendo na fronteira entre blocos: use a mesma instância
+    para todos os blocos de um arquivo ou de uma ingestão. Nas duplicatas fica a primeira
+    ocorrência; id_duplicado vale dentro do bloco (entre blocos, o upsert por id_leitura decide).
+    """
+
+    def __init__(self):
+        self.contexto = pd.DataFrame(columns=COLUNAS_CONTEXTO)
+        self.reprovadas_por_regra = dict.fromkeys(REGRAS, 0)
+
+    def carregar_contexto(self, conn, horas=24, antes_do_id=None, roteador=None):
+        """
+        Semeia o contexto com as leituras das últimas `horas` do banco (carga incremental e ingestão).
+        antes_do_id deixa de fora leituras que o bloco vai só regravar (o backend grava no banco e no CSV).
+        Com um roteador ligado (RoteadorShards), as leituras vêm dos shards e não de conn.
+        """
+        sql = f"""SELECT {', '.join(COLUNAS_CONTEXTO)} FROM historico_clima
+                  WHERE timestamp >= ? AND id_leitura < ? ORDER BY timestamp, id_leitura"""
+        teto_id = antes_do_id or np.iinfo(np.int64).max
+        if roteador is not None and roteador.ativo:
+            _, maximos = roteador.consultar("SELECT MAX(timestamp) FROM historico_clima", recentes=True)
+            maximo = max((m for m, in maximos if m is not None), default=None)
+            if maximo is None:
+                return
+            inicio = maximo - horas * 3600
+            df = roteador.consultar_df(sql, (inicio, teto_id), inicio=inicio).sort_values('timestamp', kind='stable')
+        else:
+            maximo = conn.execute("SELECT MAX(timestamp) FROM historico_clima").fetchone()[0]
+            if maximo is None:
+                return
+            df = pd.read_sql_query(sql, conn, params=(maximo - horas * 3600, teto_id))
+        df['timestamp'] = serie_de_epoch(df['timestamp'])
+        self.contexto = _ultimas_por_sensor(df.dropna())
+
+    def aplicar(self, df_bruto):
+        """
+        Retorna (válidas, quarentena). Válidas: id_leitura inteiro e timestamp em datetime64,
+        como o antigo limpar_historico. Quarentena: as reprovadas mais 'regra' (ver separar()).
+        """
+        df, motivo = avaliar_linhas(df_bruto)
+        reprovar_ids_duplicados(df, motivo)
+        self.avaliar_sequencia(df, motivo)
+        return self.separar(df, motivo)
+
+    def separar(self, df, motivo):
+        """
+        Conta as reprovações, avança o contexto e divide o bloco avaliado em (válidas, quarentena).
+        Na quarentena vão os valores convertidos; id_leitura e timestamp que não converteram vão como texto.
+        """
+        for codigo, total in zip(*np.unique(motivo[motivo > 0], return_counts=True)):
+            self.reprovadas_por_regra[REGRAS[codigo - 1]] += int(total)
+
+        aprovadas = motivo == 0
+        brutas = [c for c in (COLUNA_ID_BRUTO, COLUNA_TIMESTAMP_BRUTO) if c in df.columns]
+        df_validas = df[aprovadas].drop(columns=brutas).astype({'id_leitura': 'int64'})
+        novas = df_validas[COLUNAS_CONTEXTO]
+        self.contexto = _ultimas_por_sensor(pd.concat([self.contexto, novas], ignore_index=True)
+                                            if len(self.contexto) else novas)
+
+        df_quarentena = df[~aprovadas]
+        df_quarentena = df_quarentena.assign(
+            id_leitura=df_quarentena['id_leitura'].astype('Int64').astype(object),
+            timestamp=df_quarentena['timestamp'].dt.strftime("%Y-%m-%d %H:%M:%S.%f"),
+            regra=np.array(REGRAS, dtype=object)[motivo[~aprovadas] - 1])
+        for coluna, bruta in ((COLUNA_ID_BRUTO, 'id_leitura'), (COLUNA_TIMESTAMP_BRUTO, 'timestamp')):
+            if coluna in df_quarentena.columns:
+                df_quarentena[bruta] = df_quarentena[bruta].where(df_quarentena[coluna].isna(), df_quarentena[coluna])
+        return df_validas, df_quarentena.drop(columns=brutas)
+
+    def avaliar_sequencia(self, df, motivo):
+        """
+        Ordem, duplicatas, sensor travado e picos sobre as leituras ainda aprovadas (motivo == 0).
+        Cada sensor é avaliado só com as próprias leituras, então blocos separados por sensor dão
+        o mesmo resultado que o bloco inteiro (base do ETL paralelo).
+
+        Uma leitura reprovada aqui sai das janelas das seguintes (maior timestamp, duplicatas, média
+        e desvio dos picos), como entre blocos, em que o contexto só leva as aprovadas: o resultado
+        não depende do tamanho do bloco. Cada leitura depende só das anteriores, então as regras são
+        reaplicadas sem as reprovadas da rodada anterior até nada mudar; o sensor que não estabiliza
+        em MAX_RODADAS_SEQUENCIA rodadas (ex.: salto de nível, cada pico expõe o seguinte) é avaliado
+        leitura a leitura.
+        """
+        posicoes = np.flatnonzero(motivo == 0)
+        if not len(posicoes):
+            return
+
+        # Contexto (já aprovado) antes das leituras novas; ordenação estável por sensor mantém a chegada
+        n_contexto = len(self.contexto)
+        seq = df.iloc[posicoes][COLUNAS_CONTEXTO]
+        if n_contexto:
+            seq = pd.concat([self.contexto, seq], ignore_index=True)
+        sensores = pd.factorize(seq['id_sensor'].astype(str))[0]
+        ordem = np.argsort(sensores, kind='stable')
+        sensores = sensores[ordem]
+        novas = ordem >= n_contexto                      # linhas do bloco atual (as únicas reprováveis)
+        destino = posicoes[np.where(novas, ordem - n_contexto, 0)]
+
+        inicio_grupo = np.ones(len(ordem), dtype=bool)
+        inicio_grupo[1:] = sensores[1:] != sensores[:-1]
+
+        # Sensor travado: sequência de valores idênticos ao anterior do mesmo sensor
+        igual = ~inicio_grupo
+        for coluna in COLUNAS_TRAVADO:
+            valores = seq[coluna].to_numpy(dtype='float64')[ordem]
+            igual[1:] &= valores[1:] == valores[:-1]
+        sequencia = np.cumsum(~igual)
+        leituras = _LeiturasSequencia(
+            sensores=sensores, inicio_grupo=inicio_grupo, novas=novas,
+            ts=seq['timestamp'].to_numpy(dtype='datetime64[ns]').astype('int64')[ordem],
+            travado=igual & (np.bincount(sequencia)[sequencia] >= LEITURAS_TRAVADO),
+            valores={coluna: seq[coluna].to_numpy(dtype='float64')[ordem] for coluna in COLUNAS_PICO},
+            isentas={coluna: seq[isencao].to_numpy(dtype='float64')[ordem] > 0
+                     for coluna, isencao in ISENCOES_PICO.items()})
+
+        codigos = np.zeros(len(ordem), dtype=motivo.dtype)
+        for _ in range(MAX_RODADAS_SEQUENCIA):
+            novos_codigos = leituras.codigos(ativas=codigos == 0)
+            mudou = novos_codigos != codigos
+            codigos = novos_codigos
+            if not mudou.any():
+                break
+        else:
+            for sensor in np.unique(sensores[mudou]):
+                linhas = np.flatnonzero(sensores == sensor)
+                codigos[linhas] = leituras.codigos_uma_a_uma(linhas)
+
+        reprovadas = codigos > 0
+        motivo[destino[reprovadas]] = codigos[reprovadas]
+
+
+class _LeiturasSequencia:
+    """
+    Colunas das regras de sequência com as linhas agrupadas por sensor (em ordem de chegada).
+    codigos() aplica as regras de uma vez dadas as leituras ativas (aprovadas); codigos_uma_a_uma()
+    é a mesma regra em ordem, linha por linha, para os sensores que não estabilizam.
+    """
+
+    def __init__(self, sensores, inicio_grupo, novas, ts, travado, valores, isentas):
+        self.sensores, self.inicio_grupo, self.novas = sensores, inicio_grupo, novas
+        self.ts, self.travado, self.valores, self.isentas = ts, travado, valores, isentas
+        comeco = np.maximum.accumulate(np.where(inicio_grupo, np.arange(len(sensores)), 0))
+        self.comeco = comeco
+
+        # Duplicata: linha anterior (na chegada) do mesmo sensor e timestamp. Estável: entre iguais, a chegada
+        self.por_tempo = np.lexsort((ts, sensores))
+        self.novo_par = np.ones(len(ts), dtype=bool)
+        anteriores, seguintes = self.por_tempo[:-1], self.por_tempo[1:]
+        self.novo_par[1:] = (ts[seguintes] != ts[anteriores]) | (sensores[seguintes] != sensores[anteriores])
+
+    def codigos(self, ativas):
+        """Código da primeira regra que reprova cada linha nova (0: aprovada), olhando só as ativas anteriores."""
+        codigos = np.zeros(len(self.ts), dtype=np.int8)
+
+        def marcar(regra, mascara):
+            codigos[(codigos == 0) & mascara & self.novas] = REGRAS.index(regra) + 1
+
+        # Mesmo sensor e timestamp de uma leitura ativa anterior: duplicata
+        ativas_por_tempo = ativas[self.por_tempo].astype(np.int64)
+        antes_no_par = np.cumsum(ativas_por_tempo) - ativas_por_tempo
+        inicio_par = np.maximum.accumulate(np.where(self.novo_par, np.arange(len(self.ts)), 0))
+        repetida = np.empty(len(self.ts), dtype=bool)
+        repetida[self.por_tempo] = antes_no_par > antes_no_par[inicio_par]
+        marcar('leitura_duplicada', repetida)
+
+        # Antes do maior timestamp das ativas anteriores do sensor: fora de ordem
+        minimo = np.iinfo(np.int64).min
+        acumulado = pd.Series(np.where(ativas, self.ts, minimo)).groupby(self.sensores).cummax().to_numpy()
+        maior_anterior = np.empty_like(self.ts)
+        maior_anterior[1:] = acumulado[:-1]
+        maior_anterior[self.inicio_grupo] = minimo
+        marcar('fora_de_ordem', self.ts < maior_anterior)
+
+        marcar('sensor_travado', self.travado)
+
+        # Picos: z-score contra média e desvio das JANELA_PICO ativas anteriores do sensor, por somas
+        # acumuladas só das ativas (a linha não entra na própria janela)
+        ativas_antes = np.cumsum(ativas) - ativas
+        n = np.minimum(ativas_antes - ativas_antes[self.comeco], JANELA_PICO)
+        for coluna, desvio_minimo in COLUNAS_PICO.items():
+            valores = self.valores[coluna]
+            validos = ativas & ~np.isnan(valores)
+            soma = np.concatenate(([0.0], np.cumsum(np.where(validos, valores, 0.0)[ativas])))
+            soma_quadrados = np.concatenate(([0.0], np.cumsum(np.where(validos, valores * valores, 0.0)[ativas])))
+            qtd = np.concatenate(([0], np.cumsum(validos[ativas])))
+            na_janela = qtd[ativas_antes] - qtd[ativas_antes - n]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                media = (soma[ativas_antes] - soma[ativas_antes - n]) / na_janela
+                variancia = (soma_quadrados[ativas_antes] - soma_quadrados[ativas_antes - n]) / na_janela - media * media
+                desvio = np.maximum(np.sqrt(np.maximum(variancia, 0.0)), desvio_minimo)
+                zscore = np.abs(valores - media) / desvio
+            pico = (na_janela >= MIN_LEITURAS_PICO) & (zscore > LIMIAR_ZSCORE)
+            if coluna in self.isentas:
+                pico &= ~self.isentas[coluna]
+            marcar(f'pico_{coluna}', pico)
+        return codigos
+
+    def codigos_uma_a_uma(self, linhas):
+        """As mesmas regras de codigos() sobre as linhas de um sensor, em ordem: cada reprovada sai na hora."""
+        codigos = np.zeros(len(linhas), dtype=np.int8)
+        vistos, maior = set(), np.iinfo(np.int64).min
+        janelas = {coluna: deque(maxlen=JANELA_PICO) for coluna in COLUNAS_PICO}
+        for i, linha in enumerate(linhas):
+            ts = self.ts[linha]
+            regra = None
+            if self.novas[linha]:
+                if ts in vistos:
+                    regra = 'leitura_duplicada'
+                elif ts < maior:
+                    regra = 'fora_de_ordem'
+                elif self.travado[linha]:
+                    regra = 'sensor_travado'
+                else:
+                    for coluna, desvio_minimo in COLUNAS_PICO.items():
+                        janela = [v for v in janelas[coluna] if not np.isnan(v)]
+                        if len(janela) < MIN_LEITURAS_PICO or (coluna in self.isentas and self.isentas[coluna][linha]):
+                            continue
+                        media = sum(janela) / len(janela)
+                        variancia = sum(v * v for v in janela) / len(janela) - media * media
+                        desvio = max(np.sqrt(max(variancia, 0.0)), desvio_minimo)
+                        if abs(self.valores[coluna][linha] - media) / desvio > LIMIAR_ZSCORE:
+                            regra = f'pico_{coluna}'
+                            break
+            if regra is not None:
+                codigos[i] = REGRAS.index(regra) + 1
+                continue
+            vistos.add(ts)
+            maior = max(maior, ts)
+            for coluna in COLUNAS_PICO:
+                janelas[coluna].append(self.valores[coluna][linha])
+        return codigos
+
+
+def _reprovar(motivo, regra, mascara):
+    """Marca `regra` nas linhas da máscara que ainda não tinham reprovado em nenhuma."""
+    motivo[(motivo == 0) & mascara] = REGRAS.index(regra) + 1
+
+def avaliar_linhas(df_bruto):
+    """
+    Converte tipos e aplica as regras sem estado (linha a linha). Retorna (df convertido, motivo),
+    motivo = 0 para aprovada ou 1 + índice em REGRAS. Não depende de outras linhas: pode rodar
+    por partição do arquivo.
+    """
+    df = df_bruto.reset_index(drop=True)
+    ids = pd.to_numeric(df['id_leitura'], errors='coerce')
+    datas = pd.to_datetime(df['timestamp'], errors='coerce', format='ISO8601')
+    # Colunas numéricas com texto no meio (linha corrompida) viram NaN; float em todas as partições
+    numericas = {c: pd.to_numeric(df[c], errors='coerce').astype('float64') for c in COLUNAS_NUMERICAS}
+    df = df.assign(id_leitura=ids, timestamp=datas, **numericas)
+    # Texto original do que não converteu, para a quarentena
+    if ids.isna().any():
+        df[COLUNA_ID_BRUTO] = df_bruto['id_leitura'].to_numpy(dtype=object)
+        df[COLUNA_ID_BRUTO] = df[COLUNA_ID_BRUTO].where(ids.isna())
+    if datas.isna().any():
+        df[COLUNA_TIMESTAMP_BRUTO] = df_bruto['timestamp'].to_numpy(dtype=object)
+        df[COLUNA_TIMESTAMP_BRUTO] = df[COLUNA_TIMESTAMP_BRUTO].where(datas.isna())
+
+    motivo = np.zeros(len(df), dtype=np.int8)
+    _reprovar(motivo, 'campo_invalido', df[COLUNAS_HISTORICO].isna().any(axis=1).to_numpy())
+    agora = np.datetime64(datetime.now(), 'ns')
+    ts = df['timestamp'].to_numpy(dtype='datetime64[ns]')
+    _reprovar(motivo, 'timestamp_fora_da_faixa',
+              (ts < np.datetime64(INICIO_VALIDO, 'ns')) | (ts > agora + np.timedelta64(TOLERANCIA_FUTURO_S, 's')))
+    for coluna, (minimo, maximo) in FAIXAS.items():
+        valores = df[coluna].to_numpy()
+        _reprovar(motivo, f'faixa_{coluna}', ~((valores >= minimo) & (valores <= maximo)))
+    return df, motivo
+
+def reprovar_ids_duplicados(df, motivo):
+    """Mesmo id repetido no bloco: fica a primeira ocorrência aprovada até aqui."""
+    vivas = motivo == 0
+    repetidos = df['id_leitura'].where(vivas).duplicated().to_numpy() & vivas & df['id_leitura'].notna().to_numpy()
+    _reprovar(motivo, 'id_duplicado', repetidos)
+
+
+def _ultimas_por_sensor(df):
+    """Só as últimas JANELA_PICO leituras de cada sensor (o que as regras de sequência precisam)."""
+    if df.empty:
+        return df.reset_index(drop=True)
+    return df[df.groupby('id_sensor', observed=True).cumcount(ascending=False) < JANELA_PICO].reset_index(drop=True)
+
+
+# --- 3. QUARENTENA ---
+SQL_QUARENTENA = f"""INSERT INTO quarentena_leituras (registrado_em, origem, regra, {', '.join(COLUNAS_HISTORICO)})
+                     VALUES (?, ?, ?, {', '.join('?' for _ in COLUNAS_HISTORICO)})"""
+
+def gravar_quarentena(conn, df_quarentena, origem):
+    """Grava as reprovadas (na transação do chamador) com os valores como chegaram."""
+    if df_quarentena.empty:
+        return 0
+    agora = texto_para_epoch(datetime.now().replace(microsecond=0))
+    valores = df_quarentena.reindex(columns=COLUNAS_HISTORICO).astype(object)
+    valores = valores.where(valores.notna(), None)
+    conn.executemany(SQL_QUARENTENA, ((agora, origem, regra) + linha for regra, linha in
+                                      zip(df_quarentena['regra'], valores.itertuples(index=False, name=None))))
+    return len(df_quarentena)
+
+def limpar_quarentena(conn, origem):
+    """Apaga a quarentena de uma origem antes de reprocessá-la inteira (carga completa do CSV)."""
+    conn.execute("DELETE FROM quarentena_leituras WHERE origem = ?", (origem,))
+
+def resumo_regras(contagens):
+    """'faixa_temp_ambiente: 8, campo_invalido: 4' (só as regras que reprovaram algo, da mais frequente)."""
+    return ", ".join(f"{regra}: {total}" for regra, total in
+                     sorted(contagens.items(), key=lambda item: -item[1]) if total)
@@ -0,0 +1,202 @@
+import pandas as pd
+import sys
+import threading
+import time
+from datetime import datetime
+from esquema_db import COLUNAS_HISTORICO, PATH_DB, conectar, registrar_corte, serie_de_epoch, texto_para_epoch
+from arquivo_colunar import caminho_particao, escrever_particao
+from roteador_shards import obter_roteador
+
+# --- 1. CONFIGURAÇÃO ---
+# Camadas de retenção (em dias). O rollup diário é mantido para sempre.
+#   bruto (historico_clima) -> 15 min (rollup_15min_sensor) -> horário -> diário
+DIAS_BRUTO = 7
+DIAS_15MIN = 30
+DIAS_HORARIO = 365
+
+# Cada lote é uma transação curta: as gravações das decisões entram entre um lote e outro
+TAMANHO_LOTE = 5_000
+PAUSA_ENTRE_LOTES_S = 0.05
+INTERVALO_SEGUNDOS = 3600
+# Gravações mantidas em gravacoes_historico: um leitor que ficar mais que isso para trás relê tudo
+MANTER_GRAVACOES = 100_000
+
+# Mesma fusão dos triggers de rollup: soma contagens/somas e mantém os extremos ignorando NULL
+SQL_COMPACTAR_15MIN = """
+    INSERT INTO rollup_15min_sensor (quinze_min, id_sensor, leituras,
+                                     qtd_umidade, soma_umidade, min_umidade, max_umidade,
+                                     qtd_temp, soma_temp, min_temp, max_temp, soma_chuva)
+    SELECT timestamp - timestamp % 900, COALESCE(id_sensor, ''), COUNT(*),
+           COUNT(umidade_solo), TOTAL(umidade_solo), MIN(umidade_solo), MAX(umidade_solo),
+           COUNT(temp_ambiente), TOTAL(temp_ambiente), MIN(temp_ambiente), MAX(temp_ambiente),
+           TOTAL(chuva_mm)
+    FROM historico_clima
+    WHERE timestamp < ?
+    GROUP BY 1, 2
+    ON CONFLICT (quinze_min, id_sensor) DO UPDATE SET
+        leituras = leituras + excluded.leituras,
+        qtd_umidade = qtd_umidade + excluded.qtd_umidade,
+        soma_umidade = soma_umidade + excluded.soma_umidade,
+        min_umidade = MIN(COALESCE(min_umidade, excluded.min_umidade), COALESCE(excluded.min_umidade, min_umidade)),
+        max_umidade = MAX(COALESCE(max_umidade, excluded.max_umidade), COALESCE(excluded.max_umidade, max_umidade)),
+        qtd_temp = qtd_temp + excluded.qtd_temp,
+        soma_temp = soma_temp + excluded.soma_temp,
+        min_temp = MIN(COALESCE(min_temp, excluded.min_temp), COALESCE(excluded.min_temp, min_temp)),
+        max_temp = MAX(COALESCE(max_temp, excluded.max_temp), COALESCE(excluded.max_temp, max_temp)),
+        soma_chuva = soma_chuva + excluded.soma_chuva
+"""
+
+
+# --- 2. LOTES ---
+def _limite_do_lote(conn, corte, tamanho_lote):
+    """Timestamp que fecha o próximo lote: ~tamanho_lote leituras mais antigas, sem passar do corte."""
+    linha = conn.execute("SELECT timestamp FROM historico_clima WHERE timestamp < ? ORDER BY timestamp "
+                         "LIMIT 1 OFFSET ?", (corte, tamanho_lote)).fetchone()
+    if linha is None:
+        return corte
+    primeiro = conn.execute("SELECT MIN(timestamp) FROM historico_clima").fetchone()[0]
+    # Muitas leituras no mesmo segundo: o lote leva o segundo inteiro
+    return linha[0] if linha[0] > primeiro else linha[0] + 1
+
+def compactar_lote_bruto(conn, corte, tamanho_lote=TAMANHO_LOTE, arquivar=False):
+    """
+    Compacta um lote de leituras brutas anteriores ao corte em baldes de 15 minutos e as apaga,
+    numa única transação. Com arquivar=True elas também vão para o arquivo colunar antes.
+    Retorna quantas leituras saíram do banco (0 quando não há mais nada antes do corte).
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        limite = _limite_do_lote(conn, corte, tamanho_lote)
+        if arquivar:
+            _arquivar_ate(conn, limite)
+        conn.execute(SQL_COMPACTAR_15MIN, (limite,))
+        # Corte antes do DELETE: o trigger não tira dos rollups as leituras anteriores a ele
+        registrar_corte(conn, 'bruto', limite)
+        removidas = conn.execute("DELETE FROM historico_clima WHERE timestamp < ?", (limite,)).rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return removidas
+
+def _arquivar_ate(conn, limite):
+    """Copia as leituras anteriores ao limite para as partições dia/sensor do arquivo colunar."""
+    df = pd.read_sql_query(f"SELECT {', '.join(COLUNAS_HISTORICO)} FROM historico_clima WHERE timestamp < ?",
+                           conn, params=(limite,))
+    dias = serie_de_epoch(df['timestamp']).dt.date
+    for (dia, id_sensor), grupo in df.groupby([dias, 'id_sensor'], dropna=False, sort=True):
+        escrever_particao(caminho_particao(dia, None if pd.isna(id_sensor) else id_sensor),
+                          grupo.drop(columns='id_sensor'))
+
+def expurgar_lote(conn, camada, tabela, coluna, corte, tamanho_lote=TAMANHO_LOTE):
+    """Apaga até tamanho_lote baldes de um rollup anteriores ao corte. Retorna quantos saíram."""
+    with conn:
+        removidos = conn.execute(f"""DELETE FROM {tabela}
+                                     WHERE ({coluna}, id_sensor) IN (SELECT {coluna}, id_sensor FROM {tabela}
+                                                                     WHERE {coluna} < ? LIMIT ?)""",
+                                 (corte, tamanho_lote)).rowcount
+        if removidos < tamanho_lote:
+            registrar_corte(conn, camada, corte)  # último lote: nada mais antes do corte
+    return removidos
+
+def podar_gravacoes(conn, manter=MANTER_GRAVACOES, tamanho_lote=TAMANHO_LOTE):
+    """Apaga até tamanho_lote das gravações mais antigas, deixando as `manter` últimas. Retorna quantas saíram."""
+    with conn:
+        return conn.execute("""DELETE FROM gravacoes_historico
+                               WHERE seq IN (SELECT seq FROM gravacoes_historico
+                                             WHERE seq <= (SELECT MAX(seq) FROM gravacoes_historico) - ?
+                                             ORDER BY seq LIMIT ?)""", (manter, tamanho_lote)).rowcount
+
+
+# --- 3. EXECUÇÃO ---
+def aplicar_retencao(caminho_db=PATH_DB, dias_bruto=DIAS_BRUTO, dias_15min=DIAS_15MIN,
+                     dias_horario=DIAS_HORARIO, manter_gravacoes=MANTER_GRAVACOES,
+                     tamanho_lote=TAMANHO_LOTE, arquivar=False,
+                     pausa_entre_lotes=PAUSA_ENTRE_LOTES_S, agora=None, parar=None):
+    """
+    Uma rodada completa de retenção, em lotes:
+      1. leituras brutas com mais de dias_bruto -> baldes de 15 min (e apagadas);
+      2. baldes de 15 min com mais de dias_15min -> apagados (o rollup horário já os cobre);
+      3. baldes horários com mais de dias_horario -> apagados (o diário já os cobre);
+      4. gravacoes_historico além das manter_gravacoes últimas -> apagadas.
+    Os rollups horário e diário são mantidos pelos triggers de inserção, então nada se perde
+    ao apagar as camadas mais finas. O corte de cada camada fica em retencao_cortes, para o
+    dashboard saber qual camada cobre um período. `parar` (threading.Event) interrompe entre lotes.
+    """
+    agora = texto_para_epoch((agora or datetime.now()).replace(microsecond=0))
+    etapas = [
+        ("brutas", lambda conn: compactar_lote_bruto(conn, agora - dias_bruto * 86400, tamanho_lote, arquivar)),
+        ("15 min", lambda conn: expurgar_lote(conn, '15min', 'rollup_15min_sensor', 'quinze_min',
+                                              agora - dias_15min * 86400, tamanho_lote)),
+        ("horárias", lambda conn: expurgar_lote(conn, 'horario', 'rollup_horario_sensor', 'hora',
+                                                agora - dias_horario * 86400, tamanho_lote)),
+        ("gravações", lambda conn: podar_gravacoes(conn, manter_gravacoes, tamanho_lote)),
+    ]
+
+    resultado = {}
+    conn = conectar(caminho_db)
+    try:
+        for nome, lote in etapas:
+            total = 0
+            while not (parar is not None and parar.is_set()):
+                removidas = lote(conn)
+                total += removidas
+                if removidas == 0:
+                    break
+                time.sleep(pausa_entre_lotes)
+            resultado[nome] = total
+    finally:
+        conn.close()
+
+    print("🧺 Retenção: " + " | ".join(f"{total} {nome}" for nome, total in resultado.items()) + " compactadas/removidas.")
+    return resultado
+
+def aplicar_retencao_frota(roteador=None, parar=None, **opcoes):
+    """aplicar_retencao em cada shard, um por vez (no banco único, só no PATH_DB). Retorna {caminho: resultado}."""
+    resultados = {}
+    for caminho in (roteador or obter_roteador()).shards():
+        if parar is not None and parar.is_set():
+            break
+        resultados[caminho] = aplicar_retencao(caminho, parar=parar, **opcoes)
+    return resultados
+
+
+class AgendadorRetencao:
+    """Roda aplicar_retencao_frota em uma thread de fundo a cada intervalo_segundos."""
+
+    def __init__(self, intervalo_segundos=INTERVALO_SEGUNDOS, **opcoes):
+        self.intervalo_segundos = intervalo_segundos
+        self.opcoes = opcoes
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._laco, name="retencao", daemon=True)
+
+    def iniciar(self):
+        self._thread.start()
+        return self
+
+    def _laco(self):
+        while not self._parar.is_set():
+            try:
+                aplicar_retencao_frota(parar=self._parar, **self.opcoes)
+            except Exception as e:
+                print(f"❌ Erro na retenção: {e}")
+            self._parar.wait(self.intervalo_segundos)
+
+    def parar(self):
+        """Interrompe no próximo lote e espera a thread terminar."""
+        self._parar.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=30)
+
+
+if __name__ == "__main__":
+    arquivar = "--arquivar" in sys.argv
+    if "--continuo" in sys.argv:
+        agendador = AgendadorRetencao(arquivar=arquivar).iniciar()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            agendador.parar()
+    else:
+        aplicar_retencao_frota(arquivar=arquivar)
@@ -0,0 +1,317 @@
+import csv
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+try:
+    from esquema_db import COLUNAS_HISTORICO, PATH_DB, conectar
+except ImportError:  # importado como pacote (app.py: etl.roteador_shards)
+    from etl.esquema_db import COLUNAS_HISTORICO, PATH_DB, conectar
+
+# --- 1. CONFIGURAÇÃO ---
+BASE_DIR = Path(__file__).resolve().parent
+PATH_SHARDS = BASE_DIR / 'shards'
+PATH_SENSORES = BASE_DIR.parent / 'data' / 'config_sensores.csv'
+
+# GREEN_HORIZON_SHARDS=1 liga o layout por fazenda e mês: leituras, decisões e seus rollups em
+# shards/<id_fazenda>/<AAAA-MM>.db. Desligado, o roteador tem um único shard, o PATH_DB.
+# Nos dois modos o PATH_DB é o catálogo: métricas, quarentena e watermark do ETL ficam nele.
+ATIVO = os.environ.get("GREEN_HORIZON_SHARDS", "0") == "1"
+
+# Sensores fora do config_sensores.csv (id_sensor,id_fazenda) caem nesta fazenda
+FAZENDA_PADRAO = "principal"
+# Consultas simultâneas no fan-out (o sqlite3 solta o GIL durante a consulta)
+MAX_LEITORES = 8
+
+SQL_HISTORICO = f"""INSERT INTO historico_clima ({', '.join(COLUNAS_HISTORICO)})
+                    VALUES ({', '.join('?' for _ in COLUNAS_HISTORICO)})"""
+
+
+def carregar_fazendas(caminho=PATH_SENSORES):
+    """{id_sensor: id_fazenda} do config_sensores.csv ({} se o arquivo não existir)."""
+    if not Path(caminho).exists():
+        return {}
+    with open(caminho, newline='', encoding='utf-8') as f:
+        return {linha['id_sensor'].strip(): linha['id_fazenda'].strip() for linha in csv.DictReader(f)}
+
+
+_meses = {}
+
+def mes_do_epoch(epoch):
+    """'AAAA-MM' de um timestamp epoch (horário local da fazenda, como no banco). Cache por dia."""
+    dia = int(epoch) // 86400
+    mes = _meses.get(dia)
+    if mes is None:
+        data = time.gmtime(dia * 86400)
+        mes = _meses[dia] = f"{data.tm_year:04d}-{data.tm_mon:02d}"
+    return mes
+
+
+# --- 2. ROTEADOR ---
+class RoteadorShards:
+    """
+    Camada única de acesso às leituras e decisões.
+
+    Gravação: cada linha vai para o shard da fazenda do seu sensor e do mês do seu timestamp;
+    cada shard grava em uma transação própria. Um lote de uma fazenda só abre os shards dela,
+    então a latência de gravação não cresce com o tamanho da frota.
+
+    Leitura: a consulta roda em paralelo em cada shard selecionado (fazendas, período ou só o
+    mais recente de cada fazenda) e as linhas são concatenadas; quem consulta faz a junção final
+    (ordenar, somar baldes, ficar com a última leitura de cada sensor).
+
+    Os ids de leitura saem de um contador único no catálogo (reservar_ids): EscritorLote, ingestão
+    e ETL, no mesmo processo ou em processos separados, nunca recebem o mesmo id.
+    """
+
+    def __init__(self, raiz=PATH_SHARDS, caminho_unico=PATH_DB, ativo=None, fazendas=None,
+                 max_leitores=MAX_LEITORES):
+        self.raiz = Path(raiz)
+        self.caminho_unico = Path(caminho_unico)
+        self.ativo = ATIVO if ativo is None else ativo
+        self.fazendas = carregar_fazendas() if fazendas is None else fazendas
+        self.max_leitores = max_leitores
+
+        self._lock = threading.Lock()       # executor de leitura
+        self._lock_ids = threading.Lock()   # reservas de ids (a primeira consulta os shards)
+        self._piso_ids = None
+        self._conn_ids = None               # conexão do catálogo aberta entre reservas (e o pid dela)
+        self._pid_ids = None
+        self._executor = None
+
+    # --- ENDEREÇAMENTO ---
+    def fazenda_de(self, id_sensor):
+        return self.fazendas.get(id_sensor, FAZENDA_PADRAO)
+
+    def caminho(self, id_fazenda, epoch):
+        if not self.ativo:
+            return self.caminho_unico
+        return self.raiz / str(id_fazenda) / f"{mes_do_epoch(epoch)}.db"
+
+    def shards(self, fazendas=None, inicio=None, fim=None, recentes=False, mes=None):
+        """
+        Arquivos existentes que podem ter dados do filtro, podados só pelos nomes (fazenda e mês).
+        inicio/fim em epoch; mes ('AAAA-MM') fica com um mês só; recentes=True fica com o shard
+        mais novo de cada fazenda (onde está a última leitura de cada uma).
+        """
+        if not self.ativo:
+            return [self.caminho_unico]
+        if not self.raiz.exists():
+            return []
+
+        mes_inicio = mes or (mes_do_epoch(inicio) if inicio is not None else None)
+        mes_fim = mes or (mes_do_epoch(fim) if fim is not None else None)
+        selecionados = []
+        for pasta in sorted(p for p in self.raiz.iterdir() if p.is_dir()):
+            if fazendas is not None and pasta.name not in fazendas:
+                continue
+            meses = sorted(p for p in pasta.glob('*.db')
+                           if (mes_inicio is None or p.stem >= mes_inicio) and (mes_fim is None or p.stem <= mes_fim))
+            selecionados.extend(meses[-1:] if recentes else meses)
+        return selecionados
+
+    def meses(self):
+        """Meses ('AAAA-MM') com algum shard, em ordem (vazio fora do modo shards)."""
+        return sorted({p.stem for p in self.shards()}) if self.ativo else []
+
+    # --- GRAVAÇÃO ---
+    def gravar(self, comandos):
+        """
+        comandos: [(sql, linhas, posição do id_sensor, posição do timestamp epoch)].
+        Separa as linhas por shard e grava cada shard em uma transação (todos os comandos dele juntos).
+        Retorna as falhas como [(caminho, erro, [linhas de cada comando])]; vazio se tudo foi gravado.
+        As linhas de um shard que falhou não foram gravadas e podem ser reenviadas como estão.
+        """
+        comandos = list(comandos)
+        if not self.ativo:
+            # Um shard só: as linhas vão direto ao executemany, sem passar pelo roteamento
+            por_shard = {self.caminho_unico: [linhas for _, linhas, _, _ in comandos]}
+        else:
+            por_shard = {}
+            for indice, (_, linhas, posicao_sensor, posicao_epoch) in enumerate(comandos):
+                for linha in linhas:
+                    caminho = self.caminho(self.fazenda_de(linha[posicao_sensor]), linha[posicao_epoch])
+                    grupos = por_shard.get(caminho)
+                    if grupos is None:
+                        grupos = por_shard[caminho] = [[] for _ in comandos]
+                    grupos[indice].append(linha)
+
+        falhas = []
+        for caminho, grupos in por_shard.items():
+            try:
+                if self.ativo:
+                    caminho.parent.mkdir(parents=True, exist_ok=True)
+                conn = conectar(caminho)
+                try:
+                    with conn:
+                        for (sql, _, _, _), linhas in zip(comandos, grupos):
+                            conn.executemany(sql, linhas)
+                finally:
+                    conn.close()
+            except Exception as e:
+                falhas.append((caminho, e, [list(linhas) for linhas in grupos]))
+        return falhas
+
+    def reservar_ids(self, quantidade):
+        """
+        Primeiro de `quantidade` ids de leitura consecutivos e livres na frota.
+        O contador fica na tabela sequencias do catálogo e cada reserva é uma transação BEGIN IMMEDIATE,
+        então dois processos nunca recebem o mesmo id. O maior id já gravado é o piso: leituras de
+        antes do contador não são reaproveitadas. Nos shards, quem grava com ids próprios (upsert do
+        ETL, migração) sobe o contador antes (elevar_ids), já que o MAX do catálogo não os vê.
+        """
+        with self._lock_ids:
+            if self._piso_ids is None:
+                # Nos shards o maior id da frota é lido uma vez (shards gravados antes do contador);
+                # no banco único o MAX vem na própria reserva
+                self._piso_ids = self.max_id_leitura() + 1 if self.ativo else 0
+            conn = self._conexao_ids()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                proximo = conn.execute("SELECT proximo FROM sequencias WHERE nome = 'id_leitura'").fetchone()
+                maior = conn.execute("SELECT MAX(id_leitura) FROM historico_clima").fetchone()[0] or 0
+                primeiro = max(proximo[0] if proximo else 0, maior + 1, self._piso_ids)
+                conn.execute("""INSERT INTO sequencias (nome, proximo) VALUES ('id_leitura', ?)
+                                ON CONFLICT(nome) DO UPDATE SET proximo = excluded.proximo""",
+                             (primeiro + quantidade,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return primeiro
+
+    def elevar_ids(self, proximo):
+        """Garante que nenhuma reserva futura devolva ids abaixo de `proximo` (ids gravados por fora do contador)."""
+        with self._lock_ids:
+            with self._conexao_ids() as conn:
+                conn.execute("""INSERT INTO sequencias (nome, proximo) VALUES ('id_leitura', ?)
+                                ON CONFLICT(nome) DO UPDATE SET proximo = MAX(proximo, excluded.proximo)""",
+                             (int(proximo),))
+
+    def _conexao_ids(self):
+        # Abrir e fechar a cada reserva custa mais que a transação (o último close faz checkpoint)
+        if self._conn_ids is None or self._pid_ids != os.getpid():
+            self._conn_ids, self._pid_ids = conectar(self.caminho_unico, mesma_thread=False), os.getpid()
+        return self._conn_ids
+
+    def inserir_historico(self, linhas):
+        """
+        Leituras novas, sem id (colunas de COLUNAS_HISTORICO a partir do timestamp epoch).
+        Os ids são reservados aqui (reservar_ids), nunca atribuídos pelo SQLite.
+        Retorna as falhas de gravar() (linhas já com id).
+        """
+        linhas = list(linhas)
+        if not linhas:
+            return []
+        primeiro = self.reservar_ids(len(linhas))
+        return self.gravar([(SQL_HISTORICO, [(primeiro + i,) + tuple(linha) for i, linha in enumerate(linhas)], 2, 1)])
+
+    # --- LEITURA ---
+    def _consultar_shard(self, caminho, sql, params):
+        conn = conectar(caminho)
+        try:
+            cursor = conn.execute(sql, params)
+            return [coluna[0] for coluna in cursor.description], cursor.fetchall()
+        finally:
+            conn.close()
+
+    def consultar_por_shard(self, sql, params=(), fazendas=None, inicio=None, fim=None, recentes=False, mes=None):
+        """
+        Roda `sql` em cada shard do filtro de shards(), em paralelo. Retorna {caminho: (colunas, linhas)}.
+        `params` pode ser uma função do caminho do shard (ex.: marca d'água própria de cada shard).
+        """
+        shards = self.shards(fazendas, inicio, fim, recentes, mes)
+        executar = lambda caminho: self._consultar_shard(caminho, sql, params(caminho) if callable(params) else params)
+        return dict(zip(shards, self.mapear(executar, shards)))
+
+    def mapear(self, funcao, itens):
+        """[funcao(item) for item in itens] no executor de leitura (em paralelo se houver mais de um item)."""
+        itens = list(itens)
+        if len(itens) <= 1:
+            return [funcao(item) for item in itens]
+        with self._lock:
+            if self._executor is None:
+                from concurrent.futures import ThreadPoolExecutor  # ~10 ms de import: fora da partida rápida
+                self._executor = ThreadPoolExecutor(max_workers=self.max_leitores, thread_name_prefix="shards-leitura")
+        return list(self._executor.map(funcao, itens))
+
+    def consultar(self, sql, params=(), **filtro):
+        """consultar_por_shard() com as linhas concatenadas. Retorna (colunas, linhas); sem nenhum shard, ([], [])."""
+        resultados = list(self.consultar_por_shard(sql, params, **filtro).values())
+        colunas = resultados[0][0] if resultados else []
+        return colunas, [linha for _, linhas in resultados for linha in linhas]
+
+    def consultar_df(self, sql, params=(), **filtro):
+        """consultar() como DataFrame (o pandas só é importado aqui)."""
+        import pandas as pd
+        colunas, linhas = self.consultar(sql, params, **filtro)
+        return pd.DataFrame.from_records(linhas, columns=colunas)
+
+    def max_id_leitura(self):
+        _, linhas = self.consultar("SELECT MAX(id_leitura) FROM historico_clima")
+        return max((maximo for maximo, in linhas if maximo is not None), default=0)
+
+
+_roteador = None
+_lock_roteador = threading.Lock()
+
+def obter_roteador():
+    """Roteador único do processo, criado no primeiro uso."""
+    global _roteador
+    with _lock_roteador:
+        if _roteador is None:
+            _roteador = RoteadorShards()
+        return _roteador
+
+
+# --- 3. MIGRAÇÃO DO BANCO ÚNICO ---
+def migrar_para_shards(caminho_origem=PATH_DB, roteador=None, tamanho_lote=100_000):
+    """
+    Copia historico_clima e logs_decisao do banco único para os shards (os triggers refazem os
+    rollups em cada shard). Ids preservados e INSERT OR IGNORE: rodar de novo não duplica nada.
+    O banco de origem não é alterado e continua como catálogo.
+    """
+    roteador = roteador or RoteadorShards(ativo=True)
+    sql_logs = """INSERT OR IGNORE INTO logs_decisao (id, timestamp, id_sensor, umidade_solo, previsao_chuva,
+                                                      tarifa, acao, motivo) VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+    tabelas = [("historico_clima", f"SELECT {', '.join(COLUNAS_HISTORICO)} FROM historico_clima ORDER BY id_leitura",
+                SQL_HISTORICO.replace("INSERT", "INSERT OR IGNORE", 1), 2, 1),
+               ("logs_decisao", """SELECT id, timestamp, id_sensor, umidade_solo, previsao_chuva, tarifa, acao, motivo
+                                   FROM logs_decisao ORDER BY id""", sql_logs, 2, 1)]
+
+    origem = conectar(caminho_origem)
+    totais = {}
+    try:
+        for tabela, consulta, insercao, posicao_sensor, posicao_epoch in tabelas:
+            cursor = origem.execute(consulta)
+            totais[tabela] = 0
+            while True:
+                linhas = cursor.fetchmany(tamanho_lote)
+                if not linhas:
+                    break
+                if tabela == "historico_clima":
+                    roteador.elevar_ids(linhas[-1][0] + 1)  # ids em ordem: o último é o maior do lote
+                falhas = roteador.gravar([(insercao, linhas, posicao_sensor, posicao_epoch)])
+                if falhas:
+                    caminho, erro, _ = falhas[0]
+                    raise RuntimeError(f"falha gravando {caminho}: {erro}")
+                totais[tabela] += len(linhas)
+    finally:
+        origem.close()
+
+    print(f"🧩 Migração para shards: {totais['historico_clima']} leituras e {totais['logs_decisao']} decisões "
+          f"em {len(roteador.shards())} shard(s) sob {roteador.raiz}.")
+    return totais
+
+
+if __name__ == "__main__":
+    if "--migrar" in sys.argv:
+        argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+        migrar_para_shards(Path(argumentos[0]) if argumentos else PATH_DB)
+    else:
+        roteador = obter_roteador()
+        print(f"🧩 Modo {'shards' if roteador.ativo else 'banco único'}: {len(roteador.shards())} shard(s).")
+        for caminho in roteador.shards():
+            print(f"   ↳ {caminho}")